@@ -4,7 +4,7 @@ from pathlib import Path
 import yaml
 from yaml.loader import SafeLoader
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 
 
 # Page config must be first Streamlit command
@@ -16,9 +16,10 @@ st.set_page_config(
 )
 
 # Import custom modules directly
-from drive_handler import DriveHandler
-from rag_engine import RAGEngine
-from supabase_store import SupabaseVectorStore
+from indexer import index_folder, index_namespaces, load_namespaces, sync_folder
+from rag_engine import ConversationMemory, cache_hit_rate
+from supabase_store import DEFAULT_NAMESPACE
+import warmup
 
 # Load custom CSS for Wake Forest branding
 def load_css():
@@ -239,16 +240,44 @@ def load_css():
     </style>
     """, unsafe_allow_html=True)
 
+# File types offered in the search filters, mapped to their MIME types
+FILTER_FILE_TYPES = {
+    'PDF': ['application/pdf'],
+    'Word': ['application/vnd.openxmlformats-officedocument.wordprocessingml.document'],
+    'Excel': [
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'application/vnd.ms-excel',
+    ],
+    'CSV': ['text/csv'],
+    'Text': ['text/plain'],
+    'Google Docs': ['application/vnd.google-apps.document'],
+    'Google Sheets': ['application/vnd.google-apps.spreadsheet'],
+    'Google Slides': ['application/vnd.google-apps.presentation'],
+}
+
+# Most recent chat messages rendered on every rerun; older ones are paged
+CHAT_WINDOW = 10
+CHAT_PAGE_SIZE = 10
+# Messages kept per session, oldest dropped first
+CHAT_MAX_MESSAGES = 200
+
 # Initialize session state
 def init_session_state():
     if 'rag_engine' not in st.session_state:
         st.session_state.rag_engine = None
     if 'messages' not in st.session_state:
+        # role and content, plus the chunk IDs of the sources for answers
         st.session_state.messages = []
     if 'indexed' not in st.session_state:
         st.session_state.indexed = False
     if 'indexing' not in st.session_state:
         st.session_state.indexing = False
+    if 'search_filters' not in st.session_state:
+        st.session_state.search_filters = {}
+    if 'conversation' not in st.session_state:
+        st.session_state.conversation = ConversationMemory()
+    if 'user_namespaces' not in st.session_state:
+        st.session_state.user_namespaces = None
 
 # Load authentication configuration
 def load_auth_config():
@@ -257,11 +286,25 @@ def load_auth_config():
         config = yaml.load(file, Loader=SafeLoader)
     return config
 
+def user_namespaces(config, username):
+    """Namespaces a user may search, or None if the user is not restricted"""
+    user = config['credentials']['usernames'].get(username) or {}
+    namespaces = user.get('namespaces')
+    return list(namespaces) if namespaces is not None else None
+
 # Main app function
 def main():
     load_css()
     init_session_state()
     
+    # Once per process; already done if the app was started with run.py
+    if not warmup.status['ready']:
+        with st.spinner("Starting up..."):
+            warmup.warm_up()
+    # Documents indexed earlier are searchable without indexing again
+    if not st.session_state.indexed and warmup.status['steps'].get('supabase', {}).get('result'):
+        finish_indexing()
+    
     # Load authentication
     config = load_auth_config()
     
@@ -285,6 +328,9 @@ def main():
     
     # User is authenticated
     if authentication_status:
+        st.session_state.user_namespaces = user_namespaces(config, username)
+        namespaces = load_namespaces(config)
+        
         # Display logo and header
         # Center the logo and header
         logo_col1, logo_col2, logo_col3 = st.columns([1, 2, 1])
@@ -313,24 +359,78 @@ def main():
             else:
                 st.warning("⚠ Documents Not Indexed")
             
+            # This session's answers only; the engine is shared by all users
+            usage = st.session_state.conversation.usage
+            if usage['requests']:
+                st.caption(
+                    f"Prompt cache: {cache_hit_rate(usage):.0%} of input tokens "
+                    f"({usage['cache_read_input_tokens']:,} read, "
+                    f"{usage['cache_creation_input_tokens']:,} written)"
+                )
+            
             st.markdown("---")
             st.markdown("### Settings")
             
             # Index documents section
             with st.expander("📁 Index Documents", expanded=not st.session_state.indexed):
-                st.markdown("**Google Drive Folder ID:**")
-                st.caption("Find this in your folder's URL after 'folders/'")
-                folder_id = st.text_input("Folder ID", key="folder_id", label_visibility="collapsed")
+                allowed = st.session_state.user_namespaces
+                if allowed is None:
+                    st.markdown("**Google Drive Folder ID:**")
+                    st.caption("Find this in your folder's URL after 'folders/'")
+                    folder_id = st.text_input("Folder ID", key="folder_id", label_visibility="collapsed")
+                    namespace = st.text_input(
+                        "Namespace",
+                        key="namespace",
+                        placeholder=DEFAULT_NAMESPACE,
+                        help="Searches can be limited to the namespaces a user has access to. "
+                             "Leave empty to sync a folder into the namespace it was indexed into."
+                    ).strip() or None
+                else:
+                    # Restricted users may only index the configured root
+                    # folders of their own namespaces
+                    own_namespaces = [name for name in allowed if name in namespaces]
+                    namespace = st.selectbox("Namespace", own_namespaces, key="namespace")
+                    folder_id = namespaces.get(namespace)
+                    if not own_namespaces:
+                        st.caption("Your documents are indexed by an administrator.")
+                locked = st.session_state.indexing or (allowed is not None and not folder_id)
                 
-                if st.button("Index Documents", disabled=st.session_state.indexing):
+                if st.button("Index Documents", disabled=locked):
                     if folder_id:
-                        index_documents(folder_id)
+                        index_documents(folder_id, namespace or DEFAULT_NAMESPACE)
                     else:
                         st.error("Please enter a folder ID")
+                
+                if st.button(
+                    "Sync Changes",
+                    disabled=locked,
+                    help="Only process files added, changed, moved or removed since the last run"
+                ):
+                    if folder_id:
+                        sync_documents(folder_id, namespace)
+                    else:
+                        st.error("Please enter a folder ID")
+                
+                if namespaces and allowed is None:
+                    st.markdown("---")
+                    st.caption(f"Configured namespaces: {', '.join(namespaces)}")
+                    if st.button(
+                        "Sync All Namespaces",
+                        disabled=st.session_state.indexing,
+                        help="Index or sync every namespace in config.yaml, in parallel"
+                    ):
+                        sync_all_namespaces(namespaces)
+            
+            # Search filters
+            with st.expander("🔎 Search Filters"):
+                display_search_filters(st.session_state.user_namespaces
+                                       if st.session_state.user_namespaces is not None
+                                       else list(namespaces))
             
             # Clear conversation
             if st.button("🗑️ Clear Conversation"):
                 st.session_state.messages = []
+                st.session_state.conversation.clear()
                 st.rerun()
             
             # System info
@@ -353,6 +453,38 @@ def main():
         </div>
         """, unsafe_allow_html=True)
 
+def display_search_filters(namespace_options):
+    """Collect metadata filters applied to every search in this session"""
+    selected_namespaces = []
+    if len(namespace_options) > 1:
+        selected_namespaces = st.multiselect(
+            "Namespaces", namespace_options,
+            help="Leave empty to search every namespace you have access to"
+        )
+    file_types = st.multiselect("File types", list(FILTER_FILE_TYPES.keys()))
+    folder_id = st.text_input(
+        "Subfolder ID",
+        help="Only search files inside this folder (including nested folders)"
+    )
+    date_range = st.date_input("Modified between", value=(), format="YYYY-MM-DD")
+    
+    filters = {}
+    if selected_namespaces:
+        filters['namespaces'] = selected_namespaces
+    if file_types:
+        filters['mime_types'] = [
+            mime for label in file_types for mime in FILTER_FILE_TYPES[label]
+        ]
+    if folder_id.strip():
+        filters['folder_id'] = folder_id.strip()
+    if len(date_range) == 2:
+        start_date, end_date = date_range
+        filters['modified_after'] = start_date.isoformat()
+        # Exclusive upper bound so files modified on the end date are included
+        filters['modified_before'] = (end_date + timedelta(days=1)).isoformat()
+    
+    st.session_state.search_filters = filters
+
 def display_welcome_message():
     st.markdown("""
     ### Getting Started
@@ -374,27 +506,68 @@ def display_welcome_message():
     - 📚 Source citations for all answers
     """)
 
+def sources_html(sources):
+    """HTML for a list of source citations"""
+    parts = []
+    for i, source in enumerate(sources, 1):
+        also_in = ""
+        if source.get('also_in'):
+            names = ", ".join(other['title'] for other in source['also_in'])
+            also_in = f"""
+            <div style="font-size: 0.8rem; color: #666; margin-top: 0.3rem;">
+                Also in: {names}
+            </div>"""
+        parts.append(f"""
+        <div class="source-box">
+            <div class="source-title">Source {i}: {source['title']}</div>
+            <div style="font-size: 0.85rem; color: #666; margin-top: 0.3rem;">
+                {source['snippet']}
+            </div>{also_in}
+        </div>
+        """)
+    return "".join(parts)
+
+@st.cache_data(max_entries=1000, ttl=3600, show_spinner=False)
+def stored_sources_html(source_ids, _rag_engine):
+    """Source citations of an earlier answer, rebuilt once from its chunk IDs
+    and shared by every session showing them"""
+    return sources_html(_rag_engine.load_sources(list(source_ids)))
+
+def display_sources(html):
+    """Render source citations in an expander"""
+    with st.expander("📚 View Sources"):
+        st.markdown(html, unsafe_allow_html=True)
+
+def display_message(message):
+    """Render one stored chat message"""
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        if message.get("source_ids") and st.session_state.rag_engine:
+            display_sources(stored_sources_html(
+                tuple(message["source_ids"]), st.session_state.rag_engine
+            ))
+
 def display_chat_interface():
-    # Display chat messages
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-            if "sources" in message and message["sources"]:
-                with st.expander("📚 View Sources"):
-                    for i, source in enumerate(message["sources"], 1):
-                        st.markdown(f"""
-                        <div class="source-box">
-                            <div class="source-title">Source {i}: {source['title']}</div>
-                            <div style="font-size: 0.85rem; color: #666; margin-top: 0.3rem;">
-                                {source['snippet']}
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
+    messages = st.session_state.messages
+    
+    # Only a fixed number of messages is rendered per rerun, however long the
+    # conversation: the latest CHAT_WINDOW, and one page of older ones on request
+    older = messages[:-CHAT_WINDOW] if len(messages) > CHAT_WINDOW else []
+    if older:
+        with st.expander(f"Earlier messages ({len(older)})"):
+            pages = (len(older) + CHAT_PAGE_SIZE - 1) // CHAT_PAGE_SIZE
+            page = st.number_input("Page (1 = oldest)", min_value=1, max_value=pages,
+                                   value=pages, key="history_page")
+            for message in older[(page - 1) * CHAT_PAGE_SIZE:page * CHAT_PAGE_SIZE]:
+                display_message(message)
+    
+    for message in messages[len(older):]:
+        display_message(message)
     
     # Chat input
     if prompt := st.chat_input("Ask a question about your documents..."):
         # Add user message
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
             st.markdown(prompt)
         
@@ -405,83 +578,149 @@ def display_chat_interface():
                 st.markdown(response)
                 
                 if sources:
-                    with st.expander("📚 View Sources"):
-                        for i, source in enumerate(sources, 1):
-                            st.markdown(f"""
-                            <div class="source-box">
-                                <div class="source-title">Source {i}: {source['title']}</div>
-                                <div style="font-size: 0.85rem; color: #666; margin-top: 0.3rem;">
-                                    {source['snippet']}
-                                </div>
-                            </div>
-                            """, unsafe_allow_html=True)
+                    display_sources(sources_html(sources))
         
-        # Add assistant message
-        st.session_state.messages.append({
+        # Sources are stored as chunk IDs, not copied snippets
+        messages.append({
             "role": "assistant",
             "content": response,
-            "sources": sources
+            "source_ids": [source['id'] for source in sources]
         })
+        del messages[:-CHAT_MAX_MESSAGES]
+
+def job_progress():
+    """Progress bar and status line for an indexing job running in this thread"""
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    
+    def update(done, total, file_name):
+        progress_bar.progress(done / total if total else 1.0)
+        status_text.text(f"Processing: {file_name}" if file_name else "")
+    
+    return progress_bar, status_text, update
+
+def display_job_report(report):
+    """Show the files skipped and duplicates found by an indexing job"""
+    for file_name, error in report['skipped']:
+        st.warning(f"Skipped {file_name}: {error}")
+    if report['duplicate_files'] or report['duplicate_chunks']:
+        st.info(
+            f"Skipped {report['duplicate_files']} duplicate files and "
+            f"{report['duplicate_chunks']} near-duplicate chunks"
+        )
 
-def index_documents(folder_id):
+def finish_indexing():
+    """Make the index searchable in this session"""
+    if st.session_state.rag_engine is None:
+        st.session_state.rag_engine = warmup.shared_engine()
+    st.session_state.indexed = True
+
+def index_documents(folder_id, namespace=DEFAULT_NAMESPACE):
     st.session_state.indexing = True
     
     try:
-        with st.spinner("Initializing..."):
-            # Initialize components
-            drive_handler = DriveHandler()
-            vector_store = SupabaseVectorStore()
-            
-            st.info("📂 Scanning Google Drive folder...")
-        
-        # Get all files recursively
-        with st.spinner("Scanning folders..."):
-            files = drive_handler.get_all_files_recursive(folder_id)
-            st.success(f"Found {len(files)} files")
-        
-        # Process and index files
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        st.info("📂 Scanning Google Drive folder...")
+        progress_bar, status_text, update = job_progress()
+        report = index_folder(folder_id, namespace, progress=update)
+        status_text.empty()
+        progress_bar.empty()
         
-        indexed_count = 0
-        for i, file_info in enumerate(files):
-            try:
-                status_text.text(f"Processing: {file_info['name']}")
-                
-                # Extract text content
-                content = drive_handler.extract_content(file_info)
-                
-                if content:
-                    # Create chunks and embeddings
-                    chunks = vector_store.create_chunks(content, file_info)
-                    vector_store.add_documents(chunks)
-                    indexed_count += 1
-                
-                progress_bar.progress((i + 1) / len(files))
-            except Exception as e:
-                st.warning(f"Skipped {file_info['name']}: {str(e)}")
+        st.success(f"Found {report['found']} files")
+        display_job_report(report)
+        finish_indexing()
         
-        # Initialize RAG engine
-        st.session_state.rag_engine = RAGEngine(vector_store)
-        st.session_state.indexed = True
+        st.success(f"✓ Successfully indexed {report['indexed']} documents!")
+        st.balloons()
         
+    except Exception as e:
+        st.error(f"Error during indexing: {str(e)}")
+        st.error("Please check your credentials and folder ID.")
+    
+    finally:
+        st.session_state.indexing = False
+
+def sync_documents(folder_id, namespace=None):
+    """Apply only the Drive changes since the last index or sync of a folder"""
+    st.session_state.indexing = True
+    
+    try:
+        st.info("Checking Google Drive for changes...")
+        progress_bar, status_text, update = job_progress()
+        report = sync_folder(folder_id, namespace, progress=update)
         status_text.empty()
         progress_bar.empty()
-        st.success(f"✓ Successfully indexed {indexed_count} documents!")
-        st.balloons()
+        
+        display_job_report(report)
+        finish_indexing()
+        
+        if report['full']:
+            st.success(f"✓ Folder was not indexed yet - indexed {report['indexed']} documents")
+        else:
+            st.success(
+                f"✓ Sync complete: {report['indexed']} files indexed, "
+                f"{report['moved']} moved or renamed, {report['removed']} removed"
+            )
         
     except Exception as e:
-        st.error(f"Error during indexing: {str(e)}")
+        st.error(f"Error during sync: {str(e)}")
         st.error("Please check your credentials and folder ID.")
     
     finally:
         st.session_state.indexing = False
 
+def sync_all_namespaces(namespaces):
+    """Index or sync every configured namespace, one concurrent job per root folder"""
+    st.session_state.indexing = True
+    
+    try:
+        # Jobs report from their own threads; the bars are redrawn from this one
+        status = {name: (0, 0, "") for name in namespaces}
+        bars = {name: st.progress(0, text=name) for name in namespaces}
+        
+        def progress(name, done, total, file_name):
+            status[name] = (done, total, file_name)
+        
+        def redraw():
+            for name, (done, total, file_name) in status.items():
+                bars[name].progress(
+                    done / total if total else 0.0,
+                    text=f"{name}: {done}/{total} {file_name}"
+                )
+        
+        reports = index_namespaces(namespaces, progress=progress, poll=redraw)
+        for bar in bars.values():
+            bar.empty()
+        
+        for name, report in reports.items():
+            if 'error' in report:
+                st.error(f"{name}: {report['error']}")
+                continue
+            display_job_report(report)
+            st.success(f"✓ {name}: {report['indexed']} files indexed")
+        finish_indexing()
+        
+    finally:
+        st.session_state.indexing = False
+
+def search_filters():
+    """The session's search filters, limited to the user's namespaces"""
+    filters = dict(st.session_state.search_filters)
+    allowed = st.session_state.user_namespaces
+    if allowed is not None:
+        selected = [name for name in filters.get('namespaces') or allowed if name in allowed]
+        # An empty list would disable the filter, so match nothing instead
+        filters['namespaces'] = selected or ['']
+    return filters
+
 def get_ai_response(query):
     """Get response from RAG engine"""
     try:
         if st.session_state.rag_engine:
-            response, sources = st.session_state.rag_engine.query(query)
+            response, sources = st.session_state.rag_engine.query(
+                query,
+                filters=search_filters(),
+                conversation=st.session_state.conversation
+            )
             return response, sources
         else:
             return "RAG engine not initialized. Please index documents first.", []
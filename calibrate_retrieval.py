@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Retrieval Cutoff Calibration for Wake Forest RAG App
+Fits the thresholds RAGEngine uses to decide how many retrieved chunks to
+keep, and the similarity below which match_documents drops rows, from a
+labelled query set
+
+Usage:
+    python calibrate_retrieval.py queries.jsonl [--max-chunks 10] [--beta 2] [--dry-run]
+
+Each line of the query file is a JSON object with a "question" and the
+"relevant_file_ids" and/or "relevant_chunk_ids" that answer it.
+"""
+
+import argparse
+import itertools
+import json
+import sys
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+
+from rescoring import DEFAULT_CUTOFF, adaptive_cutoff
+from supabase_store import SupabaseVectorStore
+
+MIN_SIMILARITY_LEVELS = [0.0, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6]
+RELATIVE_DROP_LEVELS = [0.05, 0.1, 0.15, 0.2, 0.3, 1.0]
+MIN_GAP_LEVELS = [0.01, 0.02, 0.03, 0.05, 0.08, 0.12, 1.0]
+
+
+def load_queries(path: str) -> List[Dict]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def collect_candidates(store: SupabaseVectorStore, queries: List[Dict],
+                       max_chunks: int) -> List[Dict]:
+    """
+    Search every labelled question and mark which candidates are relevant
+
+    Candidates are collected without the store's match_threshold, which
+    would hide the low-scoring ones the fit has to see.
+
+    Returns:
+        One entry per question that has a relevant candidate, with the
+        candidate similarities (best first) and relevance flags
+    """
+    embeddings = store.create_embeddings([query['question'] for query in queries])
+    samples = []
+    match_threshold, store.match_threshold = store.match_threshold, -1.0
+    try:
+        results_per_query = [
+            store.search(query['question'], top_k=max_chunks, query_embedding=embedding,
+                         hydrate=False)
+            for query, embedding in zip(queries, embeddings)
+        ]
+    finally:
+        store.match_threshold = match_threshold
+
+    for query, results in zip(queries, results_per_query):
+        results = sorted(results, key=lambda row: row['similarity'], reverse=True)
+        file_ids = set(query.get('relevant_file_ids', []))
+        chunk_ids = set(query.get('relevant_chunk_ids', []))
+        relevant = np.array([row['file_id'] in file_ids or row['id'] in chunk_ids
+                             for row in results], dtype=bool)
+        if not relevant.any():
+            print(f"⚠️  No relevant chunk retrieved for: {query['question']}")
+            continue
+        samples.append({
+            'scores': np.array([row['similarity'] for row in results], dtype=np.float32),
+            'relevant': relevant,
+        })
+    return samples
+
+
+def evaluate(samples: List[Dict], cutoff: Dict, beta: float) -> Dict:
+    """Mean precision, recall, F-beta and chunks kept for one cutoff setting"""
+    precision, recall, kept = [], [], []
+    for sample in samples:
+        count = adaptive_cutoff(sample['scores'], cutoff['min_similarity'],
+                                cutoff['relative_drop'], cutoff['min_gap'])
+        hits = int(sample['relevant'][:count].sum())
+        precision.append(hits / count if count else 0.0)
+        recall.append(hits / int(sample['relevant'].sum()))
+        kept.append(count)
+
+    p, r = float(np.mean(precision)), float(np.mean(recall))
+    f = (1 + beta ** 2) * p * r / (beta ** 2 * p + r) if p + r else 0.0
+    return {'precision': p, 'recall': r, 'f_score': f, 'chunks': float(np.mean(kept))}
+
+
+def fit_cutoff(samples: List[Dict], beta: float) -> Dict:
+    """Grid-search the cutoff with the best F-beta, preferring fewer chunks on ties"""
+    best = None
+    for min_similarity, relative_drop, min_gap in itertools.product(
+            MIN_SIMILARITY_LEVELS, RELATIVE_DROP_LEVELS, MIN_GAP_LEVELS):
+        cutoff = {'min_similarity': min_similarity, 'relative_drop': relative_drop,
+                  'min_gap': min_gap}
+        result = {**cutoff, **evaluate(samples, cutoff, beta)}
+        if best is None or (round(result['f_score'], 4), -result['chunks']) > \
+                (round(best['f_score'], 4), -best['chunks']):
+            best = result
+    return best
+
+
+def fit_match_threshold(samples: List[Dict], cutoff: Dict) -> float:
+    """
+    Highest similarity level that still keeps every candidate the cutoff keeps
+
+    match_documents drops rows below its threshold before anything is
+    ranked, so it must not remove what the fitted cutoff would have kept.
+    """
+    lowest = min(
+        float(sample['scores'][adaptive_cutoff(sample['scores'], cutoff['min_similarity'],
+                                               cutoff['relative_drop'], cutoff['min_gap']) - 1])
+        for sample in samples
+    )
+    return max([level for level in MIN_SIMILARITY_LEVELS if level <= lowest], default=-1.0)
+
+
+def print_result(label: str, result: Dict) -> None:
+    print(f"{label:<10} min_similarity={result['min_similarity']:.2f} "
+          f"relative_drop={result['relative_drop']:.2f} min_gap={result['min_gap']:.2f} | "
+          f"precision={result['precision']:.3f} recall={result['recall']:.3f} "
+          f"F={result['f_score']:.3f} chunks={result['chunks']:.1f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fit the retrieval cutoff on labelled queries")
+    parser.add_argument('queries', help="JSONL file of labelled questions")
+    parser.add_argument('--max-chunks', type=int, default=10,
+                        help="Candidates fetched per question (RAGEngine.max_chunks)")
+    parser.add_argument('--beta', type=float, default=2.0,
+                        help="Weight of recall over precision in the F-score")
+    parser.add_argument('--dry-run', action='store_true', help="Do not store the result")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    store = SupabaseVectorStore()
+    samples = collect_candidates(store, load_queries(args.queries), args.max_chunks)
+    if not samples:
+        print("❌ No labelled question retrieved a relevant chunk.")
+        return 1
+
+    print(f"Calibrating on {len(samples)} questions for {store.embedding_model}")
+    print("-" * 60)
+    print_result('default', {**DEFAULT_CUTOFF, **evaluate(samples, DEFAULT_CUTOFF, args.beta)})
+    fixed = evaluate(samples, {'min_similarity': 0.0, 'relative_drop': 1.0, 'min_gap': 1.0},
+                     args.beta)
+    print(f"{'fixed':<10} top_k={args.max_chunks} | precision={fixed['precision']:.3f} "
+          f"recall={fixed['recall']:.3f} F={fixed['f_score']:.3f}")
+    best = fit_cutoff(samples, args.beta)
+    print_result('fitted', best)
+    match_threshold = fit_match_threshold(samples, best)
+    print(f"{'':<10} match_threshold={match_threshold:.2f} (was {store.match_threshold:.2f})")
+
+    if not args.dry_run:
+        store.supabase.table('retrieval_calibration').upsert({
+            'embedding_model': store.embedding_model,
+            'min_similarity': best['min_similarity'],
+            'relative_drop': best['relative_drop'],
+            'min_gap': best['min_gap'],
+            'match_threshold': match_threshold,
+            'f_score': best['f_score'],
+            'query_count': len(samples),
+            'measured_at': datetime.utcnow().isoformat(),
+        }).execute()
+        print("✅ Stored; new RAGEngine instances use the fitted cutoff.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
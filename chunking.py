@@ -0,0 +1,128 @@
+from typing import List
+
+# Separates structural sections (sheet tabs, slides) in extracted text. Each
+# section starts with a heading line that is repeated on every chunk cut from it.
+SECTION_BREAK = "\f"
+
+
+def join_sections(sections: List[str]) -> str:
+    """Join heading-first sections into extracted text"""
+    return SECTION_BREAK.join(section.strip() for section in sections if section.strip())
+
+
+def split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """
+    Split plain text into overlapping chunks of roughly chunk_size characters
+
+    Breaks at the last sentence end or newline past the halfway point of
+    each chunk where possible.
+
+    Args:
+        text: Text to split
+        chunk_size: Maximum chunk length in characters
+        chunk_overlap: Characters repeated at the start of the next chunk
+
+    Returns:
+        List of chunk texts
+    """
+    pieces = []
+    start = 0
+
+    while start < len(text):
+        end = start + chunk_size
+        chunk_text = text[start:end]
+
+        # Try to break at sentence boundary
+        if end < len(text):
+            last_period = chunk_text.rfind('.')
+            last_newline = chunk_text.rfind('\n')
+            break_point = max(last_period, last_newline)
+
+            if break_point > chunk_size * 0.5:  # Only break if we're past halfway
+                chunk_text = chunk_text[:break_point + 1]
+                end = start + break_point + 1
+
+        pieces.append(chunk_text.strip())
+
+        # Move start position with overlap
+        start = end - chunk_overlap if end < len(text) else end
+
+    return pieces
+
+
+def cap_heading(heading: str, limit: int) -> str:
+    """
+    Shorten a section heading to at most limit characters
+
+    Long column lists are cut after the last whole column that fits and
+    marked with an ellipsis, keeping the title at the start.
+    """
+    if len(heading) <= limit:
+        return heading
+    cut = heading[:max(limit - 4, 0)]
+    boundary = cut.rfind(" | ")
+    if boundary > 0:
+        cut = cut[:boundary]
+    return f"{cut} ..."[:limit]
+
+
+def split_sections(text: str, chunk_size: int) -> List[str]:
+    """
+    Split sectioned text into chunks that follow section boundaries
+
+    Consecutive small sections are packed into one chunk. A section too
+    large for one chunk is cut between lines, and every piece starts with
+    the section heading (e.g. the sheet name and column headers), so no
+    chunk mixes two slides or loses track of its columns. Headings are
+    capped at half a chunk (see cap_heading), so every chunk stays within
+    chunk_size however many columns a sheet has.
+
+    Args:
+        text: Sections separated by SECTION_BREAK, each starting with a heading line
+        chunk_size: Maximum chunk length in characters
+
+    Returns:
+        List of chunk texts
+    """
+    pieces = []
+    current = ""
+
+    def flush():
+        nonlocal current
+        if current.strip():
+            pieces.append(current.strip())
+        current = ""
+
+    for section in text.split(SECTION_BREAK):
+        section = section.strip()
+        if not section:
+            continue
+
+        if len(section) <= chunk_size:
+            if current and len(current) + 2 + len(section) > chunk_size:
+                flush()
+            current = f"{current}\n\n{section}" if current else section
+            continue
+
+        flush()
+        heading, _, body = section.partition("\n")
+        heading = cap_heading(heading, chunk_size // 2)
+        room = chunk_size - len(heading) - 1
+        piece = ""
+        for line in body.split("\n"):
+            # A single over-long line is cut into pieces
+            while len(line) > room:
+                if piece:
+                    pieces.append(f"{heading}\n{piece}")
+                    piece = ""
+                pieces.append(f"{heading}\n{line[:room]}")
+                line = line[room:]
+            if piece and len(piece) + 1 + len(line) > room:
+                pieces.append(f"{heading}\n{piece}")
+                piece = ""
+            piece = f"{piece}\n{line}" if piece else line
+        if piece.strip():
+            pieces.append(f"{heading}\n{piece}")
+
+    flush()
+    return pieces
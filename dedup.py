@@ -0,0 +1,170 @@
+import hashlib
+import re
+from typing import List, Dict, Optional
+
+import numpy as np
+
+# Chunks whose 64-bit SimHashes differ in at most this many bits are treated
+# as near-duplicates
+SIMHASH_MAX_DISTANCE = 3
+
+# The fingerprint is split into more bands than the allowed distance, so two
+# near-duplicates always agree exactly on at least one band
+SIMHASH_BANDS = 4
+SIMHASH_BAND_BITS = 64 // SIMHASH_BANDS
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase text and collapse whitespace so trivial differences don't matter"""
+    return ' '.join(text.lower().split())
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """
+    Compute a 64-bit SimHash fingerprint of text
+
+    Word shingles are hashed and their bits summed as +1/-1 votes in a single
+    vectorized pass; similar texts produce fingerprints with a small Hamming
+    distance.
+
+    Args:
+        text: Text to fingerprint
+        shingle_size: Number of words per shingle
+
+    Returns:
+        Fingerprint as an unsigned 64-bit integer
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return 0
+    if len(words) < shingle_size:
+        shingle_size = 1
+
+    shingles = {
+        ' '.join(words[i:i + shingle_size])
+        for i in range(len(words) - shingle_size + 1)
+    }
+    digests = b''.join(
+        hashlib.blake2b(shingle.encode(), digest_size=8).digest() for shingle in shingles
+    )
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(shingles), 64)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    fingerprint_bits = np.packbits((votes > 0).astype(np.uint8))
+    return int.from_bytes(fingerprint_bits.tobytes(), 'big')
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two fingerprints"""
+    return bin(a ^ b).count('1')
+
+
+def _source(file_info: Dict) -> Dict:
+    return {
+        'file_id': file_info['id'],
+        'file_name': file_info['name'],
+        'file_url': file_info.get('webViewLink', ''),
+        # Lets folder-filtered searches find the chunk from the copy's folder
+        'folder_ids': file_info.get('folderIds', []),
+    }
+
+
+class Deduplicator:
+    """
+    Tracks file and chunk fingerprints during an indexing run
+
+    Exact file copies are detected by content hash and near-identical chunks
+    by SimHash, so only one copy is embedded and stored. Every other location
+    of a shared chunk is kept as an extra source on the stored row.
+    """
+
+    def __init__(self):
+        # Content key -> file info of the first copy seen
+        self.files: Dict[str, Dict] = {}
+        # File ID -> row IDs of its stored chunks
+        self.file_chunks: Dict[str, List[str]] = {}
+        # (band index, band value) -> row IDs, for near-duplicate candidate lookup
+        self.bands: Dict[tuple, List[str]] = {}
+        # Row ID -> (fingerprint, file ID)
+        self.chunks: Dict[str, tuple] = {}
+        # Row ID -> other files containing the same chunk
+        self.shared_sources: Dict[str, List[Dict]] = {}
+        self.duplicate_files = 0
+        self.duplicate_chunks = 0
+
+    def duplicate_file(self, file_info: Dict, content: Optional[str] = None) -> Optional[Dict]:
+        """
+        Check whether a file is an exact copy of one already indexed
+
+        Files are matched on the Drive md5Checksum when available, so binary
+        copies are caught before downloading, and otherwise on a hash of the
+        extracted text.
+
+        Args:
+            file_info: File metadata from Google Drive
+            content: Extracted text, if it has been extracted yet
+
+        Returns:
+            File info of the original copy, or None if the file is new
+        """
+        keys = []
+        if file_info.get('md5Checksum'):
+            keys.append('md5:' + file_info['md5Checksum'])
+        if content is not None:
+            digest = hashlib.sha256(normalize_text(content).encode()).hexdigest()
+            keys.append('sha256:' + digest)
+
+        for key in keys:
+            original = self.files.get(key)
+            if original and original['id'] != file_info['id']:
+                self.duplicate_files += 1
+                for row_id in self.file_chunks.get(original['id'], []):
+                    self.add_shared_source(row_id, file_info)
+                return original
+
+        for key in keys:
+            self.files.setdefault(key, file_info)
+        return None
+
+    def duplicate_chunk(self, row_id: str, text: str, file_info: Dict) -> Optional[str]:
+        """
+        Check a chunk against the chunks already kept in this run
+
+        New chunks are registered; near-duplicates record this file as an
+        extra source of the chunk they match.
+
+        Args:
+            row_id: Row ID the chunk would be stored under
+            text: Chunk text
+            file_info: File metadata of the chunk's file
+
+        Returns:
+            Row ID of the matching chunk, or None if the chunk is new
+        """
+        fingerprint = simhash(text)
+        bands = [
+            (band, (fingerprint >> (band * SIMHASH_BAND_BITS)) & ((1 << SIMHASH_BAND_BITS) - 1))
+            for band in range(SIMHASH_BANDS)
+        ]
+
+        candidates = {row for band in bands for row in self.bands.get(band, [])}
+        for candidate in candidates:
+            other_fingerprint, other_file_id = self.chunks[candidate]
+            if hamming_distance(fingerprint, other_fingerprint) <= SIMHASH_MAX_DISTANCE:
+                self.duplicate_chunks += 1
+                if other_file_id != file_info['id']:
+                    self.add_shared_source(candidate, file_info)
+                return candidate
+
+        self.chunks[row_id] = (fingerprint, file_info['id'])
+        self.file_chunks.setdefault(file_info['id'], []).append(row_id)
+        for band in bands:
+            self.bands.setdefault(band, []).append(row_id)
+        return None
+
+    def add_shared_source(self, row_id: str, file_info: Dict) -> None:
+        """Record another file that contains the chunk stored under row_id"""
+        sources = self.shared_sources.setdefault(row_id, [])
+        if all(source['file_id'] != file_info['id'] for source in sources):
+            sources.append(_source(file_info))
@@ -1,16 +1,31 @@
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
+import httplib2
 import io
 import os
-from typing import List, Dict
+import tempfile
+import threading
+from typing import List, Dict, Optional, Tuple
 import mimetypes
 
-# Document processing libraries
-import PyPDF2
-from docx import Document
-import openpyxl
-import csv
+from drive_sync import FOLDER_MIME_TYPE
+from parser_pool import ParserPool
+from parsers import HEAVY_KINDS, PARSERS
+from table_store import ROWS_STORED_NOTE, TableStore
+from text_cache import TextCache
+
+# File metadata requested from both the folder listing and the changes feed
+FILE_FIELDS = (
+    "id, name, mimeType, size, modifiedTime, md5Checksum, webViewLink, "
+    "capabilities/canDownload"
+)
+
+# Most calls the Drive API accepts in one batch HTTP request
+BATCH_LIMIT = 100
+
+MB = 1024 * 1024
 
 class DriveHandler:
     """Handles Google Drive API interactions with service account"""
@@ -47,86 +62,293 @@ class DriveHandler:
                 "- GOOGLE_SERVICE_ACCOUNT_FILE (file path) environment variable"
             )
         
+        # Download tuning: bytes per ranged request (the library default is
+        # 100 MB, all held in memory at once), size above which downloads go
+        # to a temporary file instead of memory, and the largest file indexed
+        self.download_chunk_size = int(os.getenv('DRIVE_DOWNLOAD_CHUNK_MB', '10')) * MB
+        self.spool_threshold = int(os.getenv('DRIVE_SPOOL_THRESHOLD_MB', '16')) * MB
+        self.max_file_size = int(os.getenv('DRIVE_MAX_FILE_MB', '200')) * MB
+        
+        # Extracted text by file revision, so unchanged files skip Drive and the parsers
+        self.text_cache = TextCache.from_env()
+        
+        # Rows of large spreadsheet tables, kept locally instead of embedded
+        self.table_store = TableStore.from_env()
+        
+        # PDF/DOCX/XLSX parsing runs in worker processes with time and memory
+        # limits; extract_workers files are downloaded and parsed at once
+        self.parser_pool = ParserPool.shared()
+        self.extract_workers = int(os.getenv('EXTRACT_WORKERS', str(os.cpu_count() or 1)))
+        
+        # One authorized HTTP connection per thread, reused for every request
+        # that thread makes (httplib2 connections are not thread-safe)
+        self.credentials = credentials
+        self._local = threading.local()
+        
         # Build the Drive API service
-        self.service = build('drive', 'v3', credentials=credentials)
+        self.service = build('drive', 'v3', http=self._http(), cache_discovery=False)
+    
+    def _http(self) -> AuthorizedHttp:
+        """Authorized HTTP session for the current thread"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=120))
+            self._local.http = http
+        return http
+    
+    def _download(self, request, file_buffer) -> None:
+        """Stream a media request into a buffer in fixed-size chunks"""
+        request.http = self._http()
+        downloader = MediaIoBaseDownload(file_buffer, request, chunksize=self.download_chunk_size)
+        
+        done = False
+        while not done:
+            status, done = downloader.next_chunk()
+        
+        file_buffer.seek(0)
     
-    def get_all_files_recursive(self, folder_id: str) -> List[Dict]:
+    def _new_buffer(self, size: Optional[int] = None):
+        """
+        Buffer for a download: memory for small files, disk for large ones
+        
+        Args:
+            size: Expected size in bytes, if known
+        """
+        if size is None:
+            # Unknown size: start in memory, roll over to disk if it grows
+            return tempfile.SpooledTemporaryFile(max_size=self.spool_threshold)
+        if size > self.spool_threshold:
+            # Named, so parser workers can read it from disk
+            return tempfile.NamedTemporaryFile()
+        return io.BytesIO()
+    
+    def _parse(self, kind: str, file_buffer, file_name: str):
+        """
+        Extract text from a downloaded file with the parser for its kind
+        
+        Heavy formats go to the parser pool, as a path when the download is
+        on disk and as bytes otherwise; light ones are parsed in place.
+        """
+        if kind in HEAVY_KINDS and self.parser_pool is not None:
+            path = getattr(file_buffer, 'name', None)
+            if isinstance(path, str):
+                file_buffer.flush()
+                return self.parser_pool.parse(kind, path, file_name)
+            return self.parser_pool.parse(kind, file_buffer.read(), file_name)
+        return PARSERS[kind](file_buffer)
+    
+    def _parse_tables(self, kind: str, file_buffer, file_info: Dict) -> str:
+        """
+        Extract text from a spreadsheet ('xlsx' or 'csv')
+        
+        With the table store enabled, large tables are stored row by row and
+        only summarized in the returned text.
+        """
+        if self.table_store is None:
+            return self._parse(kind, file_buffer, file_info['name'])
+        tables = self._parse(f"{kind}_tables", file_buffer, file_info['name'])
+        if not tables:
+            return ""
+        return self.table_store.ingest(file_info, tables)
+    
+    def _execute_batch(self, requests: List[Tuple[str, object]]) -> Dict[str, Tuple]:
+        """
+        Execute API requests in batch HTTP calls of up to BATCH_LIMIT each
+        
+        Args:
+            requests: (key, request) pairs
+            
+        Returns:
+            Dictionary mapping each key to (response, exception); a failed call
+            has response None and does not affect the others
+        """
+        results = {}
+        
+        def callback(request_id, response, exception):
+            results[request_id] = (response, exception)
+        
+        for start in range(0, len(requests), BATCH_LIMIT):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for key, request in requests[start:start + BATCH_LIMIT]:
+                batch.add(request, request_id=key)
+            try:
+                batch.execute(http=self._http())
+            except Exception as e:
+                # The whole batch call failed; report it for each request
+                for key, _ in requests[start:start + BATCH_LIMIT]:
+                    results.setdefault(key, (None, e))
+        
+        return results
+    
+    def get_all_files_recursive(self, folder_id: str, folders: Optional[Dict] = None,
+                                ancestors: Optional[List[str]] = None) -> List[Dict]:
         """
         Recursively get all files from a folder and its subfolders
         
+        The tree is scanned one level at a time, with the listing calls for
+        every folder on a level sent together in batch requests.
+        
         Args:
             folder_id: The Google Drive folder ID to scan
+            folders: Optional dictionary filled with the path (list of folder
+                IDs from the root) of every folder visited, keyed by folder ID
+            ancestors: IDs of the folders above folder_id, when scanning a
+                subfolder of an already indexed tree
             
         Returns:
-            List of file information dictionaries
+            List of file information dictionaries. Each file carries a
+            ``folderIds`` list with the IDs of all folders containing it,
+            from the root down to its direct parent.
         """
         all_files = []
-        folders_to_process = [folder_id]
+        root_path = list(ancestors or []) + [folder_id]
+        if folders is not None:
+            folders[folder_id] = root_path
+        
+        # Each entry is (folder ID, path from the root to it, listing page token)
+        pending = [(folder_id, root_path, None)]
         
-        while folders_to_process:
-            current_folder = folders_to_process.pop(0)
+        while pending:
+            requests = [
+                (str(i), self.service.files().list(
+                    q=f"'{current_folder}' in parents and trashed=false",
+                    pageSize=1000,
+                    fields=f"nextPageToken, files({FILE_FIELDS})",
+                    pageToken=page_token
+                ))
+                for i, (current_folder, _, page_token) in enumerate(pending)
+            ]
+            responses = self._execute_batch(requests)
             
-            # Query for all items in current folder
-            query = f"'{current_folder}' in parents and trashed=false"
+            next_pending = []
+            for i, (current_folder, folder_path, _) in enumerate(pending):
+                results, error = responses.get(str(i), (None, None))
+                if error or results is None:
+                    print(f"Error scanning folder {current_folder}: {str(error)}")
+                    continue
+                
+                for item in results.get('files', []):
+                    if item['mimeType'] == FOLDER_MIME_TYPE:
+                        # Add subfolder to the next level
+                        subfolder_path = folder_path + [item['id']]
+                        if folders is not None:
+                            folders[item['id']] = subfolder_path
+                        next_pending.append((item['id'], subfolder_path, None))
+                    else:
+                        # Record every containing folder so searches can be
+                        # restricted to a subtree of the indexed folder
+                        item['folderIds'] = folder_path
+                        all_files.append(item)
+                
+                if results.get('nextPageToken'):
+                    next_pending.append((current_folder, folder_path, results['nextPageToken']))
             
-            page_token = None
-            while True:
-                try:
-                    results = self.service.files().list(
-                        q=query,
-                        pageSize=100,
-                        fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, webViewLink)",
-                        pageToken=page_token
-                    ).execute()
-                    
-                    items = results.get('files', [])
-                    
-                    for item in items:
-                        if item['mimeType'] == 'application/vnd.google-apps.folder':
-                            # Add subfolder to processing queue
-                            folders_to_process.append(item['id'])
-                        else:
-                            # Add file to results
-                            all_files.append(item)
-                    
-                    page_token = results.get('nextPageToken')
-                    if not page_token:
-                        break
-                        
-                except Exception as e:
-                    print(f"Error scanning folder {current_folder}: {str(e)}")
-                    break
+            pending = next_pending
         
         return all_files
     
-    def download_file(self, file_id: str) -> io.BytesIO:
+    def get_start_page_token(self) -> str:
+        """
+        Get the changes feed position for "now"
+        
+        Fetch this before a full scan so that edits made while the scan runs
+        are picked up by the next sync.
+        
+        Returns:
+            Page token to pass to list_changes
+        """
+        response = self.service.changes().getStartPageToken(
+            supportsAllDrives=True
+        ).execute()
+        return response['startPageToken']
+    
+    def get_files(self, file_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Fetch the current metadata of files by ID, in batch requests
+    
+        Args:
+            file_ids: Google Drive file IDs
+    
+        Returns:
+            File information keyed by file ID, with parents and trashed in
+            addition to the usual listing fields. Files that no longer exist
+            or cannot be read are left out.
+        """
+        requests = [
+            (file_id, self.service.files().get(
+                fileId=file_id,
+                supportsAllDrives=True,
+                fields=f"{FILE_FIELDS}, parents, trashed"
+            ))
+            for file_id in file_ids
+        ]
+        return {
+            file_id: response
+            for file_id, (response, _) in self._execute_batch(requests).items()
+            if response is not None
+        }
+    
+    def list_changes(self, page_token: str) -> Tuple[List[Dict], str]:
+        """
+        List every change visible to the service account since a page token
+        
+        Args:
+            page_token: Token from get_start_page_token or a previous call
+            
+        Returns:
+            Tuple of (list of change dictionaries, token to resume from next time).
+            Each change has fileId, removed and, unless removed, a file with
+            parents and trashed in addition to the usual listing fields.
+        """
+        changes = []
+        while True:
+            results = self.service.changes().list(
+                pageToken=page_token,
+                pageSize=1000,
+                includeRemoved=True,
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+                fields=(
+                    "nextPageToken, newStartPageToken, "
+                    f"changes(fileId, removed, file({FILE_FIELDS}, parents, trashed))"
+                )
+            ).execute()
+            
+            changes.extend(results.get('changes', []))
+            
+            if 'newStartPageToken' in results:
+                return changes, results['newStartPageToken']
+            page_token = results['nextPageToken']
+    
+    def download_file(self, file_id: str, size: Optional[int] = None):
         """
         Download a file from Google Drive
         
         Args:
             file_id: The Google Drive file ID
+            size: File size from the listing, used to decide whether to
+                buffer in memory or in a temporary file
             
         Returns:
-            BytesIO object containing file content
+            Seekable file object positioned at the start; the caller closes it
         """
         request = self.service.files().get_media(fileId=file_id)
-        file_buffer = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_buffer, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        
-        file_buffer.seek(0)
+        file_buffer = self._new_buffer(size)
+        self._download(request, file_buffer)
         return file_buffer
     
-    def export_google_doc(self, file_id: str, mime_type: str) -> str:
+    def export_google_doc(self, file_id: str, mime_type: str,
+                          file_info: Optional[Dict] = None) -> str:
         """
         Export Google Workspace files (Docs, Sheets, Slides) as text
         
+        Sheets are exported as XLSX so that every tab is included, and Slides
+        as PDF so that each slide becomes its own section.
+        
         Args:
             file_id: The Google Drive file ID
             mime_type: The Google Workspace MIME type
+            file_info: Full file metadata; needed to store large Sheets tables
             
         Returns:
             Text content of the document
@@ -134,8 +356,9 @@ class DriveHandler:
         # Map Google Workspace MIME types to export formats
         export_formats = {
             'application/vnd.google-apps.document': 'text/plain',
-            'application/vnd.google-apps.spreadsheet': 'text/csv',
-            'application/vnd.google-apps.presentation': 'text/plain',
+            'application/vnd.google-apps.spreadsheet':
+                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            'application/vnd.google-apps.presentation': 'application/pdf',
         }
         
         export_mime = export_formats.get(mime_type, 'text/plain')
@@ -145,15 +368,16 @@ class DriveHandler:
                 fileId=file_id,
                 mimeType=export_mime
             )
-            file_buffer = io.BytesIO()
-            downloader = MediaIoBaseDownload(file_buffer, request)
-            
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-            
-            file_buffer.seek(0)
-            return file_buffer.read().decode('utf-8', errors='ignore')
+            with self._new_buffer() as file_buffer:
+                self._download(request, file_buffer)
+                
+                if mime_type == 'application/vnd.google-apps.spreadsheet':
+                    if file_info is not None:
+                        return self._parse_tables('xlsx', file_buffer, file_info)
+                    return self._parse('xlsx', file_buffer, file_id)
+                if mime_type == 'application/vnd.google-apps.presentation':
+                    return self._parse('slides', file_buffer, file_id)
+                return self._parse('text', file_buffer, file_id)
         except Exception as e:
             print(f"Error exporting Google Doc {file_id}: {str(e)}")
             return ""
@@ -162,98 +386,77 @@ class DriveHandler:
         """
         Extract text content from various file types
         
+        Text of a file revision that was extracted before is served from the
+        local text cache without downloading or parsing.
+        
         Args:
             file_info: Dictionary containing file metadata
             
         Returns:
             Extracted text content
         """
+        if self.text_cache is not None:
+            cached = self.text_cache.get(file_info)
+            # Summaries of large tables are only useful with their stored rows
+            if cached is not None and (ROWS_STORED_NOTE not in cached or (
+                    self.table_store is not None and self.table_store.has(file_info))):
+                return cached
+        
+        text = self._extract_uncached(file_info)
+        
+        # Empty results may be transient download errors, so are not cached
+        if text and self.text_cache is not None:
+            self.text_cache.put(file_info, text)
+        return text
+    
+    def _extract_uncached(self, file_info: Dict) -> str:
+        """Download and parse a file (see extract_content)"""
         file_id = file_info['id']
         mime_type = file_info['mimeType']
         file_name = file_info['name']
         
         try:
+            # Permission check comes free with the listing metadata
+            if file_info.get('capabilities', {}).get('canDownload') is False:
+                print(f"Skipping {file_name}: the service account cannot download it")
+                return ""
+            
             # Handle Google Workspace files
             if mime_type.startswith('application/vnd.google-apps'):
-                return self.export_google_doc(file_id, mime_type)
-            
-            # Download regular files
-            file_buffer = self.download_file(file_id)
-            
-            # Extract based on MIME type
-            if mime_type == 'application/pdf':
-                return self._extract_pdf(file_buffer)
-            
-            elif mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-                return self._extract_docx(file_buffer)
+                return self.export_google_doc(file_id, mime_type, file_info)
             
-            elif mime_type in [
-                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                'application/vnd.ms-excel'
-            ]:
-                return self._extract_xlsx(file_buffer)
-            
-            elif mime_type == 'text/csv':
-                return self._extract_csv(file_buffer)
-            
-            elif mime_type.startswith('text/'):
-                return file_buffer.read().decode('utf-8', errors='ignore')
-            
-            else:
-                print(f"Unsupported file type: {mime_type} for {file_name}")
+            # Skip oversized files before downloading anything
+            size = int(file_info['size']) if file_info.get('size') else None
+            if size is not None and size > self.max_file_size:
+                print(f"Skipping {file_name}: {size / MB:.0f} MB exceeds the "
+                      f"{self.max_file_size / MB:.0f} MB limit")
                 return ""
-                
-        except Exception as e:
-            print(f"Error extracting content from {file_name}: {str(e)}")
-            return ""
-    
-    def _extract_pdf(self, file_buffer: io.BytesIO) -> str:
-        """Extract text from PDF file"""
-        try:
-            pdf_reader = PyPDF2.PdfReader(file_buffer)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-        except Exception as e:
-            print(f"Error extracting PDF: {str(e)}")
-            return ""
-    
-    def _extract_docx(self, file_buffer: io.BytesIO) -> str:
-        """Extract text from DOCX file"""
-        try:
-            doc = Document(file_buffer)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            return text
-        except Exception as e:
-            print(f"Error extracting DOCX: {str(e)}")
-            return ""
-    
-    def _extract_xlsx(self, file_buffer: io.BytesIO) -> str:
-        """Extract text from XLSX file"""
-        try:
-            workbook = openpyxl.load_workbook(file_buffer, data_only=True)
-            text = ""
             
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                text += f"\n=== Sheet: {sheet_name} ===\n"
+            # Download regular files
+            with self.download_file(file_id, size) as file_buffer:
+                # Extract based on MIME type
+                if mime_type == 'application/pdf':
+                    return self._parse('pdf', file_buffer, file_name)
+                
+                elif mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
+                    return self._parse('docx', file_buffer, file_name)
+                
+                elif mime_type in [
+                    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                    'application/vnd.ms-excel'
+                ]:
+                    return self._parse_tables('xlsx', file_buffer, file_info)
+                
+                elif mime_type == 'text/csv':
+                    return self._parse_tables('csv', file_buffer, file_info)
+                
+                elif mime_type.startswith('text/'):
+                    return self._parse('text', file_buffer, file_name)
+                
+                else:
+                    print(f"Unsupported file type: {mime_type} for {file_name}")
+                    return ""
                 
-                for row in sheet.iter_rows(values_only=True):
-                    row_text = " | ".join([str(cell) if cell is not None else "" for cell in row])
-                    if row_text.strip():
-                        text += row_text + "\n"
-            
-            return text
-        except Exception as e:
-            print(f"Error extracting XLSX: {str(e)}")
-            return ""
-    
-    def _extract_csv(self, file_buffer: io.BytesIO) -> str:
-        """Extract text from CSV file"""
-        try:
-            text = file_buffer.read().decode('utf-8', errors='ignore')
-            return text
         except Exception as e:
-            print(f"Error extracting CSV: {str(e)}")
+            print(f"Error extracting content from {file_name}: {str(e)}")
             return ""
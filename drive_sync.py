@@ -0,0 +1,151 @@
+from typing import List, Dict, Optional
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+
+def _reparent(folders: Dict[str, List[str]], old_path: List[str], new_path: List[str]) -> None:
+    """Rewrite the paths of a folder and everything below it after a move"""
+    depth = len(old_path)
+    for folder_id, path in list(folders.items()):
+        if path[:depth] == old_path:
+            folders[folder_id] = new_path + path[depth:]
+
+
+def _drop_subtree(folders: Dict[str, List[str]], folder_id: str) -> None:
+    """Forget a folder and everything below it"""
+    for other_id, path in list(folders.items()):
+        if folder_id in path:
+            del folders[other_id]
+
+
+def belongs_to_tree(indexed: Dict, root_id: str, namespace: Optional[str] = None) -> bool:
+    """
+    Whether a file's stored rows were indexed from a given root folder
+
+    Rows record the folder path from their root, so the first folder ID
+    identifies the root. Rows stored without a path (indexed before folders
+    were recorded) are attributed by namespace instead.
+    """
+    folder_ids = indexed.get('folder_ids') or []
+    if folder_ids:
+        return folder_ids[0] == root_id
+    return namespace is not None and indexed.get('namespace') == namespace
+
+
+def classify_changes(changes: List[Dict], folders: Dict[str, List[str]],
+                     indexed_files: Dict[str, Dict],
+                     namespace: Optional[str] = None) -> Dict[str, List]:
+    """
+    Sort Drive changes into the updates needed for one indexed folder tree
+
+    Changes outside the tree are ignored, except for indexed files and folders
+    that were moved out of it, which are treated as removals. Files indexed
+    from another root folder are never removed by this tree's changes.
+
+    Args:
+        changes: Changes from DriveHandler.list_changes
+        folders: Path (list of folder IDs from the root) of every folder in the
+            tree, keyed by folder ID. Updated in place for folder moves.
+        indexed_files: Currently indexed state of the changed files, keyed by
+            file ID, with file_name, modified_time, folder_ids and namespace
+        namespace: Namespace the tree is indexed into
+
+    Returns:
+        Dictionary with:
+            added, modified, moved: file info dictionaries (with folderIds)
+            removed: file IDs
+            folders_added: (folder ID, path) tuples for folders to scan
+            folders_moved: (old path, new path) tuples
+            folders_removed: folder IDs whose indexed files must be deleted
+    """
+    result = {
+        'added': [], 'modified': [], 'moved': [], 'removed': [],
+        'folders_added': [], 'folders_moved': [], 'folders_removed': [],
+    }
+    root_ids = {path[0] for path in folders.values()}
+
+    def is_gone(change: Dict) -> bool:
+        return change.get('removed') or change.get('file', {}).get('trashed', False)
+
+    def parent_path(change: Dict):
+        parents = change.get('file', {}).get('parents') or []
+        return next((folders[parent] for parent in parents if parent in folders), None)
+
+    # Folders first, so file changes below see the updated tree. Repeat until
+    # nothing changes, since a new folder may sit inside another new folder.
+    pending = [
+        change for change in changes
+        if change.get('removed') or change.get('file', {}).get('mimeType') == FOLDER_MIME_TYPE
+    ]
+    progress = True
+    while progress:
+        progress = False
+        for change in list(pending):
+            folder_id = change['fileId']
+            if folder_id in root_ids:
+                pending.remove(change)
+                continue
+
+            known = folder_id in folders
+            parent = None if is_gone(change) else parent_path(change)
+
+            if parent is None:
+                if known:
+                    # Trashed, deleted or moved out of the tree
+                    _drop_subtree(folders, folder_id)
+                    result['folders_removed'].append(folder_id)
+                    progress = True
+                elif not is_gone(change):
+                    # Parent may be a folder added later in this batch
+                    continue
+            else:
+                new_path = parent + [folder_id]
+                if not known:
+                    folders[folder_id] = new_path
+                    result['folders_added'].append((folder_id, new_path))
+                    progress = True
+                elif folders[folder_id] != new_path:
+                    old_path = folders[folder_id]
+                    _reparent(folders, old_path, new_path)
+                    result['folders_moved'].append((old_path, new_path))
+                    progress = True
+            pending.remove(change)
+
+    # Files inside newly added folders are picked up by scanning those folders
+    added_folder_ids = {folder_id for folder_id, _ in result['folders_added']}
+    removed_folder_ids = set(result['folders_removed'])
+
+    for change in changes:
+        file_id = change['fileId']
+        file_info = change.get('file')
+        if file_info and file_info.get('mimeType') == FOLDER_MIME_TYPE:
+            continue
+        if file_id in folders or file_id in removed_folder_ids:
+            continue
+
+        indexed = indexed_files.get(file_id)
+        if indexed and not any(belongs_to_tree(indexed, root_id, namespace) for root_id in root_ids):
+            # Stored rows belong to another indexed root
+            indexed = None
+        path = None if is_gone(change) else parent_path(change)
+
+        if path is None:
+            if indexed:
+                result['removed'].append(file_id)
+            continue
+
+        if added_folder_ids.intersection(path):
+            continue
+
+        file_info = dict(file_info)
+        file_info['folderIds'] = path
+
+        if not indexed:
+            result['added'].append(file_info)
+        elif indexed.get('modified_time') != file_info.get('modifiedTime'):
+            result['modified'].append(file_info)
+        elif (indexed.get('folder_ids') != path
+              or indexed.get('file_name') != file_info.get('name')):
+            result['moved'].append(file_info)
+
+    return result
@@ -0,0 +1,100 @@
+import os
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+import openai
+
+
+class OpenAIEmbedder:
+    """Embeddings from the OpenAI API"""
+
+    def __init__(self, model: str = "text-embedding-3-small", dimension: int = 1536):
+        openai_key = os.getenv('OPENAI_API_KEY')
+        if not openai_key:
+            raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY environment variable.")
+
+        openai.api_key = openai_key
+        self.model = model
+        self.dimension = dimension
+        # Stored with every vector, so vectors from different backends are never compared
+        self.model_id = f"openai:{model}"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in a single request, in order"""
+        response = openai.embeddings.create(model=self.model, input=texts)
+        ordered = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in ordered]
+
+
+class LocalEmbedder:
+    """
+    Embeddings computed on the CPU with a quantized ONNX sentence-transformer
+
+    Uses fastembed (ONNX Runtime), which batches inputs and runs on all cores.
+    Calls are serialized, so concurrent callers (indexing jobs, sessions)
+    queue for the cores instead of oversubscribing them. Vectors are
+    normalized and zero-padded to the database column dimension; padding
+    leaves cosine similarity between them unchanged.
+    """
+
+    def __init__(self, model: str = "BAAI/bge-small-en-v1.5", dimension: int = 1536,
+                 batch_size: int = 64):
+        try:
+            from fastembed import TextEmbedding
+        except ImportError:
+            raise ImportError(
+                "EMBEDDING_BACKEND=local needs the fastembed package: pip install fastembed"
+            )
+
+        self.model = model
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self.model_id = f"local:{model}"
+        self._model = TextEmbedding(model_name=model, threads=os.cpu_count())
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in batches, in order"""
+        if not texts:
+            return []
+        with self._lock:
+            vectors = np.array(list(self._model.embed(texts, batch_size=self.batch_size)),
+                               dtype=np.float32)
+        if vectors.shape[1] > self.dimension:
+            raise ValueError(
+                f"{self.model} produces {vectors.shape[1]}-dimensional vectors, more than "
+                f"the {self.dimension} the database stores"
+            )
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        padded = np.zeros((len(vectors), self.dimension), dtype=np.float32)
+        padded[:, :vectors.shape[1]] = vectors
+        return padded.tolist()
+
+
+# One embedder per configuration and process, shared by every vector store
+# (a local model is loaded once, not once per indexing job)
+_embedders: Dict[Tuple[str, str, int], object] = {}
+_embedders_lock = threading.Lock()
+
+
+def create_embedder(dimension: int = 1536):
+    """
+    The embedding backend configured by EMBEDDING_BACKEND, created on first use
+
+    'openai' (the default) uses text-embedding-3-small; 'local' uses
+    LOCAL_EMBEDDING_MODEL (default BAAI/bge-small-en-v1.5) on the CPU.
+    """
+    backend = os.getenv('EMBEDDING_BACKEND', 'openai').lower()
+    model = os.getenv('LOCAL_EMBEDDING_MODEL', 'BAAI/bge-small-en-v1.5')
+    if backend not in ('openai', 'local'):
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    key = (backend, model if backend == 'local' else '', dimension)
+    with _embedders_lock:
+        if key not in _embedders:
+            if backend == 'openai':
+                _embedders[key] = OpenAIEmbedder(dimension=dimension)
+            else:
+                _embedders[key] = LocalEmbedder(model=model, dimension=dimension)
+        return _embedders[key]
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Indexing Jobs for Wake Forest RAG App
+Full index and incremental sync of Google Drive root folders, each into its
+own namespace, independent of the Streamlit UI
+
+Usage:
+    python indexer.py                             (every namespace in config.yaml)
+    python indexer.py <namespace>=<folder_id> ... [--full]
+
+One job runs per root folder, up to INDEX_JOBS (default 4) at once. Without
+--full, folders indexed before are synced and new ones fully indexed.
+"""
+
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import yaml
+from yaml.loader import SafeLoader
+
+from drive_handler import DriveHandler
+from drive_sync import classify_changes
+from supabase_store import DEFAULT_NAMESPACE, SupabaseVectorStore
+
+# Called with (files done, total files, name of the current file)
+Progress = Callable[[int, int, str], None]
+
+
+def load_namespaces(config: Optional[Dict] = None) -> Dict[str, str]:
+    """
+    Root folder of each namespace configured in config.yaml
+
+    Args:
+        config: Parsed config.yaml; read from disk if not given
+
+    Returns:
+        Folder ID keyed by namespace name (empty if none are configured)
+    """
+    if config is None:
+        with open(Path(__file__).parent / 'config.yaml') as file:
+            config = yaml.load(file, Loader=SafeLoader)
+    namespaces = config.get('namespaces') or {}
+    return {name: str(spec['folder_id']) for name, spec in namespaces.items()}
+
+
+def index_file(drive_handler: DriveHandler, vector_store: SupabaseVectorStore,
+               file_info: Dict, content: Optional[str] = None) -> bool:
+    """Extract, chunk and store one file. Returns True if it was indexed."""
+    # Skip exact copies of files already indexed (by Drive checksum)
+    if vector_store.duplicate_file(file_info):
+        return False
+
+    # Extract text content, unless it was extracted ahead of time
+    if content is None:
+        content = drive_handler.extract_content(file_info)
+
+    if not content or vector_store.duplicate_file(file_info, content):
+        return False
+
+    # Create chunks and embeddings
+    chunks = vector_store.create_chunks(content, file_info)
+    try:
+        vector_store.add_documents(chunks)
+    finally:
+        # Also after a partial failure, so the chunks that were stored stay findable
+        summarized = vector_store.add_summary(content, file_info)
+    # Without a summary the file can only be found while searches skip the
+    # summary index, so it is reported rather than counted as indexed
+    if not summarized:
+        raise RuntimeError("chunks stored, but the file summary could not be created")
+    return True
+
+
+def index_files(drive_handler: DriveHandler, vector_store: SupabaseVectorStore,
+                files: List[Dict], progress: Optional[Progress] = None) -> Dict:
+    """
+    Index a list of files
+
+    Downloads and parsing run a few files ahead in background threads;
+    deduplication and embedding stay in the calling thread, in file order, so
+    a copy is always linked to the chunks of the original seen before it.
+
+    Args:
+        drive_handler: Drive client used to extract the files
+        vector_store: Store the chunks are written to
+        files: File metadata from Google Drive
+        progress: Optional callback, called in the calling thread before
+            each file and once at the end
+
+    Returns:
+        Dictionary with indexed (count), skipped ((file name, error) pairs),
+        duplicate_files and duplicate_chunks
+    """
+    workers = max(1, drive_handler.extract_workers)
+    indexed_count = 0
+    skipped = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        remaining = iter(files)
+        # Checksums of the files extracted ahead. Later copies are not
+        # downloaded; they reach index_file without content and are matched
+        # against the original there, after it has been stored.
+        queued_checksums = set()
+
+        def submit_next():
+            for file_info in remaining:
+                checksum = file_info.get('md5Checksum')
+                if checksum and checksum in queued_checksums:
+                    pending.append((file_info, None))
+                else:
+                    if checksum:
+                        queued_checksums.add(checksum)
+                    pending.append((file_info, executor.submit(drive_handler.extract_content, file_info)))
+                return
+
+        for _ in range(workers * 2):
+            submit_next()
+
+        i = 0
+        while pending:
+            file_info, future = pending.popleft()
+            submit_next()
+            if progress:
+                progress(i, len(files), file_info['name'])
+            try:
+                content = future.result() if future is not None else None
+                if index_file(drive_handler, vector_store, file_info, content=content):
+                    indexed_count += 1
+            except Exception as e:
+                skipped.append((file_info['name'], str(e)))
+            i += 1
+
+    if progress:
+        progress(len(files), len(files), "")
+
+    # Link duplicate copies to the chunks that were stored once
+    vector_store.save_shared_sources()
+
+    dedup = vector_store.deduplicator
+    return {
+        'indexed': indexed_count,
+        'skipped': skipped,
+        'duplicate_files': dedup.duplicate_files,
+        'duplicate_chunks': dedup.duplicate_chunks,
+    }
+
+
+def index_folder(folder_id: str, namespace: str = DEFAULT_NAMESPACE,
+                 progress: Optional[Progress] = None) -> Dict:
+    """
+    Fully index a root folder into a namespace
+
+    Returns:
+        The index_files result, with found (files in the folder tree)
+    """
+    # Each job has its own clients and deduplicator, so jobs can run in
+    # parallel; the embedding model is shared (see create_embedder)
+    drive_handler = DriveHandler()
+    vector_store = SupabaseVectorStore()
+
+    # Changes made during the scan are picked up by the next sync
+    page_token = drive_handler.get_start_page_token()
+
+    folders = {}
+    files = drive_handler.get_all_files_recursive(folder_id, folders=folders)
+    for file_info in files:
+        file_info['namespace'] = namespace
+
+    report = index_files(drive_handler, vector_store, files, progress)
+    vector_store.save_sync_state(folder_id, page_token, folders, namespace)
+    return {**report, 'found': len(files), 'full': True}
+
+
+def sync_folder(folder_id: str, namespace: Optional[str] = None,
+                progress: Optional[Progress] = None) -> Dict:
+    """
+    Apply only the Drive changes since the last index or sync of a root folder
+
+    Folders that have not been fully indexed yet are indexed with index_folder.
+
+    Args:
+        folder_id: Root folder ID
+        namespace: Namespace of the folder; defaults to the one it was
+            indexed into
+        progress: Optional callback, see index_files
+
+    Returns:
+        The index_files result, with moved and removed counts
+    """
+    drive_handler = DriveHandler()
+    vector_store = SupabaseVectorStore()
+
+    state = vector_store.load_sync_state(folder_id)
+    if not state:
+        return index_folder(folder_id, namespace or DEFAULT_NAMESPACE, progress)
+    namespace = namespace or state.get('namespace') or DEFAULT_NAMESPACE
+
+    changes, page_token = drive_handler.list_changes(state['page_token'])
+    folders = state['folders']
+    file_ids = [change['fileId'] for change in changes]
+    indexed = vector_store.get_indexed_files(file_ids, root_id=folder_id, namespace=namespace)
+    delta = classify_changes(changes, folders, indexed, namespace)
+
+    # Copies that were deduplicated against files about to be deleted have no
+    # rows of their own, so they are looked up first and re-indexed below
+    deleted_ids = set(delta['removed']) | {file_info['id'] for file_info in delta['modified']}
+    copies = vector_store.get_duplicate_copies(sorted(deleted_ids), delta['folders_removed'])
+
+    # Removals and moves only touch stored rows
+    for removed_folder in delta['folders_removed']:
+        vector_store.delete_folder(removed_folder)
+    for old_path, new_path in delta['folders_moved']:
+        vector_store.move_folder(old_path, new_path)
+    for file_id in delta['removed']:
+        vector_store.delete_file(file_id)
+        if drive_handler.table_store is not None:
+            drive_handler.table_store.delete(file_id)
+    for file_info in delta['moved']:
+        vector_store.update_file_metadata(file_info)
+
+    # Folders moved into the tree are scanned; nested ones come with their parent
+    added_folder_ids = {added_id for added_id, _ in delta['folders_added']}
+    files = delta['added'] + delta['modified']
+    for added_id, path in delta['folders_added']:
+        if not added_folder_ids.intersection(path[:-1]):
+            files += drive_handler.get_all_files_recursive(
+                added_id, folders=folders, ancestors=path[:-1]
+            )
+
+    # Copies still in the tree take over from the deleted originals
+    queued = deleted_ids | {file_info['id'] for file_info in files}
+    copy_ids = [file_id for file_id in copies if file_id not in queued]
+    for copy in drive_handler.get_files(copy_ids).values():
+        if copy.get('trashed'):
+            continue
+        path = next((folders[parent] for parent in copy.get('parents') or [] if parent in folders), None)
+        if path is not None:
+            copy['folderIds'] = path
+            files.append(copy)
+
+    for file_info in files:
+        file_info['namespace'] = namespace
+
+    for file_info in delta['modified']:
+        vector_store.delete_file(file_info['id'])
+
+    if files:
+        report = index_files(drive_handler, vector_store, files, progress)
+    else:
+        report = {'indexed': 0, 'skipped': [], 'duplicate_files': 0, 'duplicate_chunks': 0}
+    vector_store.save_sync_state(folder_id, page_token, folders, namespace)
+
+    return {
+        **report,
+        'full': False,
+        'moved': len(delta['moved']),
+        'removed': len(delta['removed']) + len(delta['folders_removed']),
+    }
+
+
+def index_namespaces(namespaces: Dict[str, str], full: bool = False,
+                     progress: Optional[Callable[[str, int, int, str], None]] = None,
+                     poll: Optional[Callable[[], None]] = None,
+                     max_jobs: Optional[int] = None) -> Dict[str, Dict]:
+    """
+    Index or sync several root folders concurrently, one job per namespace
+
+    Args:
+        namespaces: Root folder ID keyed by namespace name
+        full: Fully re-index every folder instead of syncing
+        progress: Optional callback with the namespace prepended to the
+            index_files progress arguments; called from the job threads
+        poll: Optional callback run in the calling thread about twice a
+            second while jobs are running, e.g. to redraw progress
+        max_jobs: Jobs running at once (default INDEX_JOBS, 4)
+
+    Returns:
+        Job result keyed by namespace; failed jobs have an error entry instead
+    """
+    if not namespaces:
+        return {}
+    max_jobs = max_jobs or int(os.getenv('INDEX_JOBS', '4'))
+    job = index_folder if full else sync_folder
+
+    reports = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_jobs, len(namespaces)))) as executor:
+        futures = {
+            executor.submit(job, folder_id, name, partial(progress, name) if progress else None): name
+            for name, folder_id in namespaces.items()
+        }
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.5)
+            if poll:
+                poll()
+        for future, name in futures.items():
+            try:
+                reports[name] = future.result()
+            except Exception as e:
+                reports[name] = {'error': str(e)}
+    return reports
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Index Google Drive folders into namespaces")
+    parser.add_argument('folders', nargs='*', metavar='NAMESPACE=FOLDER_ID',
+                        help="Folders to index (default: the namespaces in config.yaml)")
+    parser.add_argument('--full', action='store_true',
+                        help="Fully re-index instead of syncing changes")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    if args.folders:
+        namespaces = dict(entry.split('=', 1) for entry in args.folders)
+    else:
+        namespaces = load_namespaces()
+    if not namespaces:
+        print("❌ No folders given and no namespaces configured in config.yaml.")
+        return 1
+
+    print("=" * 60)
+    print("Wake Forest RAG App - Indexing Jobs")
+    print("=" * 60)
+
+    def progress(namespace, done, total, file_name):
+        if file_name:
+            print(f"[{namespace}] {done + 1}/{total} {file_name}")
+
+    reports = index_namespaces(namespaces, full=args.full, progress=progress)
+
+    print("-" * 60)
+    failed = 0
+    for name, report in reports.items():
+        if 'error' in report:
+            failed += 1
+            print(f"❌ {name}: {report['error']}")
+            continue
+        for file_name, error in report['skipped']:
+            print(f"⚠️  {name}: skipped {file_name}: {error}")
+        if report['full']:
+            print(f"✅ {name}: indexed {report['indexed']} of {report['found']} files")
+        else:
+            print(f"✅ {name}: {report['indexed']} files indexed, {report['moved']} moved or "
+                  f"renamed, {report['removed']} removed")
+    print("=" * 60)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
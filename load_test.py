@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Load Test for Wake Forest RAG App
+Measures how many concurrent chat users one app process can serve, with
+Claude, the embedding API and Supabase replaced by local stand-ins of
+configurable latency
+
+Usage:
+    python load_test.py [--mode engine|streamlit] [--users 1,5,10,20] [--questions 5]
+                        [--embed-ms 80] [--search-ms 40] [--llm-ms 1500]
+
+'engine' calls RAGEngine.query from one thread per simulated user, each with
+its own conversation and all sharing one engine, like Streamlit sessions in
+one process. 'streamlit' runs
+app.py once per user with Streamlit's AppTest harness and times the full
+rerun triggered by each chat message, i.e. the work the websocket handler
+does for a message, without the network. Each user count in --users is run
+in turn and reported as one row.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+import yaml
+from yaml.loader import SafeLoader
+
+from rescoring import DEFAULT_CUTOFF, cosine_scores
+
+QUESTIONS = [
+    "What is the deadline for fall course registration?",
+    "Summarize the faculty handbook section on sabbatical leave.",
+    "How many credit hours are required for the biology major?",
+    "What did the Q3 budget report say about facilities spending?",
+    "Who should I contact about graduate housing?",
+    "What are the learning outcomes in the syllabus for ECN 150?",
+    "When is the next board of trustees meeting?",
+    "What is the policy on late assignment submissions?",
+]
+
+
+def rss_bytes() -> int:
+    """Resident memory of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Peak rather than current, but the best available off Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Latency:
+    """Sleep for a base latency with uniform relative jitter"""
+
+    def __init__(self, ms: float, jitter: float):
+        self.seconds = ms / 1000
+        self.jitter = jitter
+
+    def wait(self) -> None:
+        if self.seconds > 0:
+            time.sleep(self.seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+class StandInVectorStore:
+    """
+    In-memory replacement for SupabaseVectorStore
+
+    Implements the methods RAGEngine calls, over a synthetic corpus of random
+    unit vectors. Each call sleeps for the configured API latency; ranking
+    is real NumPy work, like the database would do.
+    """
+
+    def __init__(self, chunks: int, embed: Latency, search: Latency, dimension: int = 1536):
+        rng = np.random.default_rng(0)
+        self.embedding_dimension = dimension
+        self.matrix = rng.standard_normal((chunks, dimension), dtype=np.float32)
+        self.matrix /= np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.embed_latency = embed
+        self.search_latency = search
+
+    def load_cutoff_params(self) -> Dict:
+        return dict(DEFAULT_CUTOFF)
+
+    def create_embedding(self, text: str) -> List[float]:
+        return self.create_embeddings([text])[0]
+
+    def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.embed_latency.wait()
+        embeddings = []
+        for text in texts:
+            seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).standard_normal(self.embedding_dimension)
+            embeddings.append((vector / np.linalg.norm(vector)).tolist())
+        return embeddings
+
+    def search(self, query: str, top_k: int = 5, filters: Optional[Dict] = None,
+               query_embedding: Optional[List[float]] = None, hydrate: bool = True) -> List[Dict]:
+        if query_embedding is None:
+            query_embedding = self.create_embedding(query)
+        self.search_latency.wait()
+        scores = cosine_scores(query_embedding, self.matrix)
+        best = np.argsort(-scores)[:top_k]
+        rows = [{
+            'id': f"chunk-{i}",
+            'file_id': f"file-{i // 20}",
+            'chunk_id': int(i % 20),
+            'content_length': 1000,
+            'similarity': float(scores[i]),
+        } for i in best]
+        return self.fetch_chunks(rows) if hydrate else rows
+
+    def fetch_chunks(self, rows: List[Dict]) -> List[Dict]:
+        missing = [row for row in rows if 'content' not in row]
+        if missing:
+            self.search_latency.wait()
+        return [row if 'content' in row else {
+            **row,
+            'content': f"Stand-in text of {row['id']}. " * 40,
+            'file_name': f"Document {row['file_id']}.pdf",
+            'file_url': '',
+            'mime_type': 'application/pdf',
+            'duplicate_sources': [],
+        } for row in rows]
+
+
+class StandInClaude:
+    """Replacement for anthropic.Anthropic answering every request after a delay"""
+
+    def __init__(self, latency: Latency):
+        self.messages = self
+        self.latency = latency
+
+    def create(self, **kwargs):
+        self.latency.wait()
+        return SimpleNamespace(
+            content=[SimpleNamespace(text="Stand-in answer based on the documents above.")],
+            stop_reason='end_turn',
+            usage=SimpleNamespace(input_tokens=2000, output_tokens=150,
+                                  cache_creation_input_tokens=0, cache_read_input_tokens=0),
+        )
+
+
+def create_engine(store: StandInVectorStore, claude: StandInClaude):
+    """A RAGEngine wired to the stand-ins"""
+    from rag_engine import RAGEngine
+
+    # RAGEngine requires a key to build its client, which is then replaced
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'load-test')
+    engine = RAGEngine(store)
+    engine.client = claude
+    engine.table_store = None
+    return engine
+
+
+class EngineSession:
+    """A simulated user calling RAGEngine.query directly"""
+
+    def __init__(self, engine):
+        from rag_engine import ConversationMemory
+
+        self.engine = engine
+        self.conversation = ConversationMemory()
+        self.messages = []
+
+    def ask(self, question: str) -> None:
+        response, sources = self.engine.query(question, conversation=self.conversation)
+        self.messages.append({"role": "user", "content": question})
+        self.messages.append({"role": "assistant", "content": response,
+                              "source_ids": [source['id'] for source in sources]})
+
+
+class StreamlitSession:
+    """A simulated user of app.py, driven through Streamlit's AppTest harness"""
+
+    def __init__(self, engine, username: str, timeout: float):
+        from streamlit.testing.v1 import AppTest
+
+        self.app = AppTest.from_file(str(Path(__file__).parent / 'app.py'),
+                                     default_timeout=timeout)
+        # Logged in and indexed, so every rerun renders the chat interface
+        self.app.session_state['authentication_status'] = True
+        self.app.session_state['name'] = 'Load Test'
+        self.app.session_state['username'] = username
+        self.app.session_state['indexed'] = True
+        self.app.session_state['rag_engine'] = engine
+        self.app.run()
+
+    def ask(self, question: str) -> None:
+        self.app.chat_input[0].set_value(question).run()
+        if self.app.exception:
+            raise RuntimeError(str(self.app.exception[0].message))
+
+
+def run_level(args, users: int, store: StandInVectorStore, claude: StandInClaude,
+              username: str) -> Dict:
+    """Run one user count and measure it"""
+    # One engine per process, as in the app (see warmup.shared_engine)
+    engine = create_engine(store, claude)
+    if args.mode == 'streamlit':
+        # app.py warms up on the first run and would reach the real APIs;
+        # the stand-in engine is the shared one and counts as warmed up
+        import warmup
+        warmup._engine = engine
+        warmup.status['ready'] = True
+    rss_before = rss_bytes()
+    sessions = []
+    for _ in range(users):
+        if args.mode == 'streamlit':
+            sessions.append(StreamlitSession(engine, username, args.timeout))
+        else:
+            sessions.append(EngineSession(engine))
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(users + 1)
+
+    def user(session, seed: int):
+        rng = random.Random(seed)
+        start.wait()
+        for _ in range(args.questions):
+            question = rng.choice(QUESTIONS)
+            began = time.perf_counter()
+            try:
+                session.ask(question)
+                with lock:
+                    latencies.append(time.perf_counter() - began)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+            if args.think_ms:
+                time.sleep(rng.expovariate(1000 / args.think_ms))
+
+    threads = [threading.Thread(target=user, args=(session, i), daemon=True)
+               for i, session in enumerate(sessions)]
+    # Per-query log lines (e.g. the model router's) would drown the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for thread in threads:
+            thread.start()
+        start.wait()
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+
+    # Measured while the sessions, with their full history, are still alive
+    memory_per_session = (rss_bytes() - rss_before) / users
+    latencies = np.array(latencies) * 1000
+    return {
+        'users': users,
+        'queries': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'throughput': len(latencies) / wall if wall else 0.0,
+        'p50': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        'p95': float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        'p99': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        'max': float(latencies.max()) if len(latencies) else 0.0,
+        'cpu': cpu / wall if wall else 0.0,
+        'memory_mb': memory_per_session / 2 ** 20,
+        # Queries answered by joining an identical one already running
+        'coalesced': engine.coalesced_queries,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load-test the chat query path")
+    parser.add_argument('--mode', choices=['engine', 'streamlit'], default='engine')
+    parser.add_argument('--users', default='1,5,10,20',
+                        help="Comma-separated concurrent user counts to run")
+    parser.add_argument('--questions', type=int, default=5, help="Questions per user")
+    parser.add_argument('--think-ms', type=float, default=0,
+                        help="Mean pause between a user's questions")
+    parser.add_argument('--embed-ms', type=float, default=80, help="Embedding API latency")
+    parser.add_argument('--search-ms', type=float, default=40, help="Supabase request latency")
+    parser.add_argument('--llm-ms', type=float, default=1500, help="Claude response latency")
+    parser.add_argument('--jitter', type=float, default=0.3,
+                        help="Relative random variation of every latency")
+    parser.add_argument('--chunks', type=int, default=5000, help="Chunks in the stand-in index")
+    parser.add_argument('--timeout', type=float, default=120,
+                        help="Streamlit mode: seconds allowed per rerun")
+    args = parser.parse_args()
+
+    # The stand-ins replace every external service
+    os.environ['TABLE_STORE_DIR'] = ''
+    with open(Path(__file__).parent / 'config.yaml') as file:
+        username = next(iter(yaml.load(file, Loader=SafeLoader)['credentials']['usernames']))
+
+    store = StandInVectorStore(args.chunks, Latency(args.embed_ms, args.jitter),
+                               Latency(args.search_ms, args.jitter))
+    claude = StandInClaude(Latency(args.llm_ms, args.jitter))
+
+    print("=" * 86)
+    print(f"Wake Forest RAG App - Load Test ({args.mode}, {os.cpu_count()} CPUs)")
+    print(f"Stand-in latency: embed {args.embed_ms:.0f} ms, search {args.search_ms:.0f} ms, "
+          f"Claude {args.llm_ms:.0f} ms (±{args.jitter:.0%})")
+    print("=" * 86)
+    print(f"{'users':>5} {'queries':>7} {'q/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'CPU':>6} {'MB/user':>8} {'shared':>6} {'errors':>6}")
+
+    errors = 0
+    for users in [int(value) for value in args.users.split(',')]:
+        result = run_level(args, users, store, claude, username)
+        errors += result['errors']
+        print(f"{result['users']:>5} {result['queries']:>7} {result['throughput']:>7.2f} "
+              f"{result['p50']:>8.0f} {result['p95']:>8.0f} {result['p99']:>8.0f} "
+              f"{result['max']:>8.0f} {result['cpu']:>6.0%} {result['memory_mb']:>8.2f} "
+              f"{result['coalesced']:>6} {result['errors']:>6}")
+        if result['first_error']:
+            print(f"      first error: {result['first_error']}")
+
+    print("-" * 86)
+    print("CPU is process CPU time over wall time (100% = one core busy). The point where")
+    print("q/s stops rising with users, or p95 climbs well above the stand-in latencies,")
+    print("is the number of concurrent users one instance can carry.")
+    print("'shared' counts queries answered by an identical query already in flight.")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
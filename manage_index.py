@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+ANN Index Maintenance for Wake Forest RAG App
+Sizes, rebuilds and tunes the vector index on the documents table
+
+Usage:
+    python manage_index.py status
+    python manage_index.py rebuild [--method auto|ivfflat|hnsw]
+    python manage_index.py tune [--recall-target 0.95] [--latency-ms 50]
+    python manage_index.py auto
+    python manage_index.py prefilter
+"""
+
+import argparse
+import math
+import re
+import statistics
+import sys
+import time
+from typing import List, Dict, Optional
+
+from supabase_store import SupabaseVectorStore, select_ann_params
+
+# Above this many rows HNSW is preferred: ivfflat needs more probes to keep
+# recall up as lists grow, while HNSW search cost grows logarithmically
+HNSW_MIN_ROWS = 100_000
+
+# ivfflat needs enough rows per list for k-means to produce useful clusters
+IVFFLAT_MIN_ROWS = 1_000
+
+PROBES_LEVELS = [1, 2, 4, 8, 16, 32, 64, 128]
+EF_SEARCH_LEVELS = [10, 20, 40, 80, 160, 320]
+
+
+def recommend_index(row_count: int, method: str = 'auto') -> Dict:
+    """
+    Recommend index build parameters for the table size
+
+    Follows the pgvector guidance: lists = rows / 1000 up to 1M rows and
+    sqrt(rows) beyond, and larger HNSW graphs for larger tables.
+
+    Args:
+        row_count: Number of rows in the documents table
+        method: 'ivfflat', 'hnsw' or 'auto'
+
+    Returns:
+        Dictionary with index_method and its build parameters
+    """
+    if method == 'auto':
+        method = 'hnsw' if row_count >= HNSW_MIN_ROWS else 'ivfflat'
+
+    if method == 'hnsw':
+        m = 16 if row_count < 1_000_000 else 24
+        return {'index_method': 'hnsw', 'm': m, 'ef_construction': 4 * m}
+
+    if row_count <= 1_000_000:
+        lists = max(10, row_count // 1000)
+    else:
+        lists = int(math.sqrt(row_count))
+    return {'index_method': 'ivfflat', 'lists': lists}
+
+
+def parse_index_definition(definition: Optional[str]) -> Dict:
+    """
+    Extract the index method and build parameters from pg_get_indexdef output
+
+    Args:
+        definition: Index definition, or None if there is no index
+
+    Returns:
+        Dictionary with index_method and any integer build parameters
+    """
+    if not definition:
+        return {}
+
+    params = {}
+    method = re.search(r'USING (\w+)', definition)
+    if method:
+        params['index_method'] = method.group(1)
+    for name in ('lists', 'm', 'ef_construction'):
+        value = re.search(rf"\b{name}\s*=\s*'?(\d+)'?", definition)
+        if value:
+            params[name] = int(value.group(1))
+    return params
+
+
+def needs_rebuild(current: Dict, recommended: Dict) -> bool:
+    """Check whether the current index is badly sized for the table"""
+    if current.get('index_method') != recommended['index_method']:
+        return True
+    if recommended['index_method'] == 'ivfflat':
+        ratio = current.get('lists', 0) / recommended['lists']
+        return not 0.5 <= ratio <= 2
+    return (current.get('m'), current.get('ef_construction')) != (
+        recommended['m'], recommended['ef_construction']
+    )
+
+
+def get_stats(store: SupabaseVectorStore) -> Dict:
+    """Fetch the row count and current embedding index definition"""
+    results = store.supabase.rpc('documents_index_stats', {}).execute()
+    stats = results.data[0] if results.data else {'row_count': 0}
+    stats.update(parse_index_definition(stats.get('index_definition')))
+    return stats
+
+
+def rebuild_index(store: SupabaseVectorStore, params: Dict) -> None:
+    """Drop and recreate the embedding index with the given parameters"""
+    store.supabase.rpc('rebuild_documents_index', {
+        'index_method': params['index_method'],
+        'lists': params.get('lists'),
+        'm': params.get('m'),
+        'ef_construction': params.get('ef_construction'),
+    }).execute()
+    # Measurements for the old index no longer apply
+    store.supabase.table('ann_tuning').delete().neq('index_method', '').execute()
+
+
+def _timed_rpc(store: SupabaseVectorStore, name: str, params: Dict):
+    start = time.perf_counter()
+    results = store.supabase.rpc(name, params).execute()
+    return results.data or [], (time.perf_counter() - start) * 1000
+
+
+def benchmark(store: SupabaseVectorStore, index_method: str, sample_size: int = 50,
+              top_k: int = 5, levels: Optional[List[int]] = None) -> Dict:
+    """
+    Measure recall and latency of the ANN index against an exact scan
+
+    Stored embeddings are used as queries, so no embedding calls are made.
+    Each query's own row is left out of both result sets; it is always the
+    exact top hit and would inflate recall.
+
+    Args:
+        store: Vector store to benchmark
+        index_method: 'ivfflat' or 'hnsw'
+        sample_size: Number of query vectors to sample
+        top_k: Result count per query
+        levels: Search parameter values to try (probes or ef_search)
+
+    Returns:
+        Dictionary with the exact-scan median latency and one curve row per level
+    """
+    param_name = 'ann_probes' if index_method == 'ivfflat' else 'ann_ef_search'
+    if levels is None:
+        levels = PROBES_LEVELS if index_method == 'ivfflat' else EF_SEARCH_LEVELS
+
+    samples, _ = _timed_rpc(store, 'sample_document_embeddings', {'sample_size': sample_size})
+    if not samples:
+        return {'exact_latency_ms': 0.0, 'curve': []}
+
+    def top_ids(rows: List[Dict], query_id: str) -> set:
+        # Rows come back nearest first; one extra was requested for the query row
+        return set([row['id'] for row in rows if row['id'] != query_id][:top_k])
+
+    # Exact-scan baseline
+    exact_ids = []
+    exact_latencies = []
+    for sample in samples:
+        rows, latency = _timed_rpc(store, 'exact_match_documents', {
+            'query_embedding': sample['embedding'],
+            'match_count': top_k + 1,
+        })
+        exact_ids.append(top_ids(rows, sample['id']))
+        exact_latencies.append(latency)
+
+    curve = []
+    for level in levels:
+        recalls = []
+        latencies = []
+        for sample, expected in zip(samples, exact_ids):
+            rows, latency = _timed_rpc(store, 'match_documents', {
+                'query_embedding': sample['embedding'],
+                'match_threshold': -1,
+                'match_count': top_k + 1,
+                param_name: level,
+            })
+            found = top_ids(rows, sample['id'])
+            recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+            latencies.append(latency)
+        curve.append({
+            'index_method': index_method,
+            'search_param': level,
+            'recall': statistics.mean(recalls),
+            'latency_ms': statistics.median(latencies),
+        })
+
+    return {'exact_latency_ms': statistics.median(exact_latencies), 'curve': curve}
+
+
+def benchmark_prefilter(store: SupabaseVectorStore, sample_size: int = 50,
+                        top_k: int = 5) -> Dict:
+    """
+    Measure recall of the two-level (summary, then chunk) search
+
+    For each sampled embedding the best summary_top_files files are found
+    through the summary index, as SupabaseVectorStore.search does, and the
+    chunks match_document_ids returns for them are compared with an exact
+    scan of the same files and with an exact scan of all chunks.
+
+    Args:
+        store: Vector store to benchmark
+        sample_size: Number of query vectors to sample
+        top_k: Result count per query
+
+    Returns:
+        Dictionary with recall_in_files (chunk ranking within the selected
+        files), recall_overall (against the exact top_k of all chunks) and
+        the median latency_ms of the restricted chunk search
+    """
+    samples, _ = _timed_rpc(store, 'sample_document_embeddings', {'sample_size': sample_size})
+
+    def top_ids(rows: List[Dict], query_id: str) -> set:
+        return set([row['id'] for row in rows if row['id'] != query_id][:top_k])
+
+    def recall(found: set, expected: set) -> float:
+        return len(found & expected) / len(expected) if expected else 1.0
+
+    in_files, overall, latencies = [], [], []
+    for sample in samples:
+        summaries, _ = _timed_rpc(store, 'match_summaries', {
+            'query_embedding': sample['embedding'],
+            'match_count': store.summary_top_files,
+            'filter_embedding_model': store.embedding_model,
+        })
+        file_ids = [row['file_id'] for row in summaries]
+        if not file_ids:
+            continue
+
+        rows, latency = _timed_rpc(store, 'match_document_ids', {
+            'query_embedding': sample['embedding'],
+            'match_threshold': -1,
+            'match_count': top_k + 1,
+            'filter_file_ids': file_ids,
+            'filter_embedding_model': store.embedding_model,
+            **store.ann_params,
+        })
+        found = top_ids(rows, sample['id'])
+        latencies.append(latency)
+
+        exact_in_files, _ = _timed_rpc(store, 'exact_match_documents', {
+            'query_embedding': sample['embedding'],
+            'match_count': top_k + 1,
+            'filter_file_ids': file_ids,
+        })
+        exact_all, _ = _timed_rpc(store, 'exact_match_documents', {
+            'query_embedding': sample['embedding'],
+            'match_count': top_k + 1,
+        })
+        in_files.append(recall(found, top_ids(exact_in_files, sample['id'])))
+        overall.append(recall(found, top_ids(exact_all, sample['id'])))
+
+    if not latencies:
+        return {'queries': 0, 'recall_in_files': 0.0, 'recall_overall': 0.0, 'latency_ms': 0.0}
+    return {
+        'queries': len(latencies),
+        'recall_in_files': statistics.mean(in_files),
+        'recall_overall': statistics.mean(overall),
+        'latency_ms': statistics.median(latencies),
+    }
+
+
+def save_curve(store: SupabaseVectorStore, curve: List[Dict]) -> None:
+    """Replace the stored tuning curve used by SupabaseVectorStore"""
+    store.supabase.table('ann_tuning').delete().neq('index_method', '').execute()
+    if curve:
+        store.supabase.table('ann_tuning').insert(curve).execute()
+
+
+def print_stats(stats: Dict, recommended: Dict) -> None:
+    print(f"Rows:        {stats['row_count']:,}")
+    print(f"Index:       {stats.get('index_definition') or 'none'}")
+    print(f"Recommended: {recommended}")
+
+
+def print_benchmark(result: Dict, recall_target: float,
+                    latency_budget_ms: Optional[float]) -> Dict:
+    print(f"Exact scan median latency: {result['exact_latency_ms']:.1f} ms")
+    print("-" * 60)
+    print(f"{'param':>8} {'recall':>8} {'latency ms':>12} {'speedup':>9}")
+    for row in result['curve']:
+        speedup = result['exact_latency_ms'] / row['latency_ms'] if row['latency_ms'] else 0
+        print(f"{row['search_param']:>8} {row['recall']:>8.3f} "
+              f"{row['latency_ms']:>12.1f} {speedup:>8.1f}x")
+    print("-" * 60)
+    chosen = select_ann_params(result['curve'], recall_target, latency_budget_ms)
+    print(f"Selected for recall >= {recall_target}: {chosen or 'database defaults'}")
+    return chosen
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Manage the documents vector index")
+    parser.add_argument('command', choices=['status', 'rebuild', 'tune', 'auto', 'prefilter'])
+    parser.add_argument('--method', choices=['auto', 'ivfflat', 'hnsw'], default='auto',
+                        help="Index type to build (default: by table size)")
+    parser.add_argument('--recall-target', type=float, default=None,
+                        help="Minimum recall vs. exact scan (default: ANN_RECALL_TARGET or 0.95)")
+    parser.add_argument('--latency-ms', type=float, default=None,
+                        help="Median latency budget per query")
+    parser.add_argument('--samples', type=int, default=50,
+                        help="Number of query vectors to benchmark")
+    parser.add_argument('--top-k', type=int, default=5)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    store = SupabaseVectorStore()
+    recall_target = args.recall_target or store.recall_target
+    latency_budget_ms = args.latency_ms if args.latency_ms is not None else store.latency_budget_ms
+
+    print("=" * 60)
+    print("Wake Forest RAG App - Index Maintenance")
+    print("=" * 60)
+
+    stats = get_stats(store)
+    recommended = recommend_index(stats['row_count'], args.method)
+    # An HNSW index is never downgraded automatically: it is either what the
+    # size calls for, or what a previous 'auto' run switched to because
+    # ivfflat could not reach the recall target
+    if args.method == 'auto' and stats.get('index_method') == 'hnsw' \
+            and recommended['index_method'] == 'ivfflat':
+        recommended = recommend_index(stats['row_count'], 'hnsw')
+    print_stats(stats, recommended)
+    print()
+
+    if args.command == 'status':
+        return 0
+
+    if args.command == 'prefilter':
+        print(f"Benchmarking the summary prefilter (top {store.summary_top_files} files) "
+              f"on {args.samples} sampled queries...")
+        result = benchmark_prefilter(store, args.samples, args.top_k)
+        if not result['queries']:
+            print("❌ No summaries matched - index documents with SUMMARY_TOP_FILES set first.")
+            return 1
+        print(f"Recall within the selected files: {result['recall_in_files']:.3f}")
+        print(f"Recall against all chunks:        {result['recall_overall']:.3f}")
+        print(f"Chunk search median latency:      {result['latency_ms']:.1f} ms")
+        print("=" * 60)
+        return 0
+
+    if stats['row_count'] < IVFFLAT_MIN_ROWS and recommended['index_method'] == 'ivfflat':
+        print(f"Fewer than {IVFFLAT_MIN_ROWS:,} rows - an exact scan is fast enough, "
+              "re-run after indexing more documents.")
+        return 0
+
+    if args.command == 'rebuild' or (
+        args.command == 'auto' and needs_rebuild(stats, recommended)
+    ):
+        print(f"Rebuilding index: {recommended}")
+        rebuild_index(store, recommended)
+        stats.update(recommended)
+        print("✅ Index rebuilt")
+        print()
+
+    if args.command == 'rebuild':
+        return 0
+
+    index_method = stats.get('index_method')
+    if index_method not in ('ivfflat', 'hnsw'):
+        print("❌ No ivfflat or hnsw index on documents.embedding - run 'rebuild' first.")
+        return 1
+
+    print(f"Benchmarking {index_method} on {args.samples} sampled queries...")
+    result = benchmark(store, index_method, args.samples, args.top_k)
+    chosen = print_benchmark(result, recall_target, latency_budget_ms)
+
+    # ivfflat that cannot reach the target within budget: switch to HNSW
+    best_recall = max((row['recall'] for row in result['curve']), default=1.0)
+    if (args.command == 'auto' and index_method == 'ivfflat'
+            and args.method == 'auto' and best_recall < recall_target):
+        print()
+        recommended = recommend_index(stats['row_count'], 'hnsw')
+        print(f"Recall target not reachable with ivfflat, switching to {recommended}")
+        rebuild_index(store, recommended)
+        result = benchmark(store, 'hnsw', args.samples, args.top_k)
+        chosen = print_benchmark(result, recall_target, latency_budget_ms)
+
+    save_curve(store, result['curve'])
+    print()
+    print(f"✅ Tuning saved. New app sessions will search with {chosen or 'database defaults'}.")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
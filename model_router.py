@@ -0,0 +1,144 @@
+import json
+import re
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Optional
+
+# Questions asking for synthesis across documents go to the full model
+SYNTHESIS_PATTERN = re.compile(
+    r"\b(compare|comparison|contrast|difference|differences|summari[sz]e|summary|"
+    r"overview|analy[sz]e|analysis|explain|why|how does|how do|evaluate|"
+    r"pros and cons|trade-?offs?|implications|timeline|all of|list all|across)\b",
+    re.IGNORECASE
+)
+
+# Phrases in a fast-model answer that suggest it could not answer well
+UNCERTAIN_PATTERN = re.compile(
+    r"(don't|do not|doesn't|does not) (contain|provide|include) enough|"
+    r"not enough information|unable to (find|determine|answer)|"
+    r"cannot (determine|answer|find)|unclear from the documents",
+    re.IGNORECASE
+)
+
+# Default model and response budget per tier
+DEFAULT_TIERS = {
+    'fast': {'model': "claude-3-5-haiku-20241022", 'max_tokens': 1024},
+    'full': {'model': "claude-sonnet-4-20250514", 'max_tokens': 4096},
+}
+
+
+class ModelRouter:
+    """
+    Routes each question to the fast or full Claude model
+
+    Classification uses only information available locally after retrieval:
+    question length and wording, how many files the retrieved chunks come from,
+    and how strongly the best chunk stands out. Every decision is logged so
+    the thresholds can be tuned from real traffic.
+    """
+
+    def __init__(self, tiers: Optional[Dict] = None, max_question_words: int = 20,
+                 max_files: int = 2, min_top_similarity: float = 0.6,
+                 min_score_gap: float = 0.05, log_size: int = 500):
+        """
+        Initialize router
+
+        Args:
+            tiers: Model and max_tokens for the 'fast' and 'full' tiers
+            max_question_words: Longer questions go to the full model
+            max_files: Questions whose chunks span more files go to the full model
+            min_top_similarity: Best chunk must be at least this similar for a lookup
+            min_score_gap: Best chunk must lead the runner-up by this much, or
+                all chunks must come from one file
+            log_size: Number of recent decisions kept in memory
+        """
+        self.tiers = tiers or DEFAULT_TIERS
+        self.max_question_words = max_question_words
+        self.max_files = max_files
+        self.min_top_similarity = min_top_similarity
+        self.min_score_gap = min_score_gap
+        self.decisions = deque(maxlen=log_size)
+
+    def features(self, question: str, documents: List[Dict], has_history: bool = False) -> Dict:
+        """
+        Compute the routing features of a question and its retrieved chunks
+
+        Args:
+            question: User's question
+            documents: Retrieved chunks with similarity scores
+            has_history: Whether the question is part of an ongoing conversation
+
+        Returns:
+            Dictionary of features
+        """
+        scores = sorted((doc.get('similarity', 0.0) for doc in documents), reverse=True)
+        return {
+            'question_words': len(question.split()),
+            'synthesis': bool(SYNTHESIS_PATTERN.search(question)),
+            'distinct_files': len({doc['file_id'] for doc in documents}),
+            'top_similarity': scores[0] if scores else 0.0,
+            'score_gap': scores[0] - scores[1] if len(scores) > 1 else 1.0,
+            'score_spread': scores[0] - scores[-1] if scores else 0.0,
+            'has_history': has_history,
+        }
+
+    def route(self, question: str, documents: List[Dict], has_history: bool = False) -> Dict:
+        """
+        Pick the tier for a question
+
+        Args:
+            question: User's question
+            documents: Retrieved chunks with similarity scores
+            has_history: Whether the question is part of an ongoing conversation
+
+        Returns:
+            Decision dictionary with tier, model, max_tokens, reason and features
+        """
+        features = self.features(question, documents, has_history)
+
+        if features['synthesis']:
+            reason = 'synthesis wording'
+        elif features['question_words'] > self.max_question_words:
+            reason = 'long question'
+        elif features['distinct_files'] > self.max_files:
+            reason = 'many source files'
+        elif features['top_similarity'] < self.min_top_similarity:
+            reason = 'weak retrieval'
+        elif features['score_gap'] < self.min_score_gap and features['distinct_files'] > 1:
+            reason = 'no dominant chunk'
+        else:
+            reason = None
+
+        tier = 'full' if reason else 'fast'
+        return {
+            'tier': tier,
+            **self.tiers[tier],
+            'reason': reason or 'simple lookup',
+            'features': features,
+            'escalated': False,
+        }
+
+    def should_escalate(self, response: str, stop_reason: Optional[str]) -> bool:
+        """
+        Check whether a fast-model answer needs to be redone by the full model
+
+        Args:
+            response: Fast model's answer
+            stop_reason: API stop reason, or None if the call failed
+
+        Returns:
+            True if the answer failed, was cut off or signals missing information
+        """
+        if stop_reason != 'end_turn':
+            return True
+        return bool(UNCERTAIN_PATTERN.search(response))
+
+    def escalate(self, decision: Dict, why: str) -> Dict:
+        """Return the full-tier version of a decision"""
+        return {**decision, 'tier': 'full', **self.tiers['full'], 'escalated': True, 'reason': why}
+
+    def log(self, decision: Dict) -> None:
+        """Record a final routing decision"""
+        entry = {'time': datetime.utcnow().isoformat(), **decision}
+        self.decisions.append(entry)
+        print(f"[router] {json.dumps(entry)}")
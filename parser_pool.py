@@ -0,0 +1,198 @@
+import atexit
+import multiprocessing
+import os
+import signal
+import threading
+from typing import List, Optional, Union
+
+from parsers import parse
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; workers then run without limits
+    resource = None
+
+MB = 1024 * 1024
+
+
+def _limit_cpu(cpu_seconds: int) -> None:
+    """Allow the current process cpu_seconds more of CPU time before SIGXCPU"""
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(used.ru_utime + used.ru_stime) + cpu_seconds
+    # The hard limit is left alone: lowering it cannot be undone for the next file
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _on_cpu_limit(signum, frame):
+    raise TimeoutError("CPU time limit exceeded")
+
+
+def _worker_main(conn, memory_bytes: int, cpu_seconds: int, max_tasks: int) -> None:
+    """Parse files sent over conn until max_tasks are done or the parent hangs up"""
+    if resource is not None:
+        if memory_bytes:
+            # Caps the address space, so a runaway parser gets MemoryError
+            # instead of growing until the machine swaps
+            try:
+                resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+            except (ValueError, OSError) as e:
+                print(f"Parser worker could not set memory limit: {str(e)}")
+        if cpu_seconds:
+            signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+    for _ in range(max_tasks):
+        try:
+            kind, source = conn.recv()
+        except EOFError:
+            break
+
+        try:
+            if resource is not None and cpu_seconds:
+                _limit_cpu(cpu_seconds)
+            result = ('ok', parse(kind, source))
+        except BaseException as e:
+            result = ('error', f"{type(e).__name__}: {str(e)}")
+        conn.send(result)
+
+    conn.close()
+
+
+class _Worker:
+    """A parser process and the parent's end of its pipe"""
+
+    def __init__(self, context, memory_bytes: int, cpu_seconds: int, max_tasks: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, memory_bytes, cpu_seconds, max_tasks),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def stop(self, kill: bool = False) -> None:
+        self.conn.close()
+        if kill:
+            self.process.kill()
+        self.process.join(timeout=5)
+
+
+class ParserPool:
+    """
+    Pool of recyclable worker processes for CPU-heavy document parsing
+
+    Each file is parsed in a separate process, so a malformed or huge PDF
+    cannot hang or bloat the Streamlit process. Workers run under an address
+    space limit and a per-file CPU time limit, and are replaced after a fixed
+    number of files to give back fragmented memory. A worker that overruns
+    the wall clock timeout or dies is killed and replaced; that file yields
+    no text. Parsing is thread-safe and runs up to `workers` files at once.
+    """
+
+    _shared: Optional['ParserPool'] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, workers: int, memory_mb: int = 2048, cpu_seconds: int = 60,
+                 max_tasks: int = 50):
+        """
+        Initialize pool (worker processes are started on first use)
+
+        Args:
+            workers: Maximum number of worker processes
+            memory_mb: Address space limit per worker (0 for none)
+            cpu_seconds: CPU time limit per file (0 for none)
+            max_tasks: Files a worker parses before it is replaced
+        """
+        self.workers = workers
+        self.memory_bytes = memory_mb * MB
+        self.cpu_seconds = cpu_seconds
+        self.max_tasks = max(1, max_tasks)
+        # Wall clock limit, for parsers stuck waiting rather than computing
+        self.timeout = cpu_seconds * 2 if cpu_seconds else None
+
+        # Spawned workers start clean instead of inheriting the parent's
+        # threads and heap
+        self._context = multiprocessing.get_context('spawn')
+        self._slots = threading.BoundedSemaphore(workers)
+        self._idle: List[_Worker] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> Optional['ParserPool']:
+        """
+        Process-wide pool configured by PARSER_WORKERS / PARSER_MEMORY_MB /
+        PARSER_CPU_SECONDS / PARSER_MAX_TASKS, or None if PARSER_WORKERS is 0
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                workers = int(os.getenv('PARSER_WORKERS', str(os.cpu_count() or 1)))
+                if workers <= 0:
+                    return None
+                cls._shared = cls(
+                    workers,
+                    memory_mb=int(os.getenv('PARSER_MEMORY_MB', '2048')),
+                    cpu_seconds=int(os.getenv('PARSER_CPU_SECONDS', '60')),
+                    max_tasks=int(os.getenv('PARSER_MAX_TASKS', '50')),
+                )
+                atexit.register(cls._shared.shutdown)
+            return cls._shared
+
+    def _checkout(self) -> _Worker:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.stop()
+        return _Worker(self._context, self.memory_bytes, self.cpu_seconds, self.max_tasks)
+
+    def _checkin(self, worker: _Worker) -> None:
+        if worker.tasks >= self.max_tasks:
+            # The worker exits on its own after its last task
+            worker.stop()
+            return
+        with self._lock:
+            self._idle.append(worker)
+
+    def parse(self, kind: str, source: Union[str, bytes], name: str = ""):
+        """
+        Run a parser in a worker process
+
+        Args:
+            kind: Parser to use (a key of parsers.PARSERS)
+            source: Path of the file on disk, or its contents
+            name: File name for error messages
+
+        Returns:
+            The parser's result (text, or tables for the *_tables kinds), or ""
+            if the worker failed or ran out of time
+        """
+        with self._slots:
+            worker = self._checkout()
+            try:
+                worker.conn.send((kind, source))
+                if not worker.conn.poll(self.timeout):
+                    raise TimeoutError(f"no result after {self.timeout} seconds")
+                status, value = worker.conn.recv()
+            except (EOFError, OSError, TimeoutError) as e:
+                # Hung or crashed (e.g. killed for exceeding a limit)
+                worker.stop(kill=True)
+                print(f"Parser worker failed on {name or kind}: {str(e) or type(e).__name__}")
+                return ""
+
+            worker.tasks += 1
+            self._checkin(worker)
+
+        if status == 'error':
+            print(f"Error parsing {name or kind}: {value}")
+            return ""
+        return value
+
+    def shutdown(self) -> None:
+        """Stop all idle workers"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
@@ -0,0 +1,170 @@
+import csv
+import io
+from typing import List, Optional, Tuple, Union
+
+# Document processing libraries
+import PyPDF2
+from docx import Document
+import openpyxl
+
+from chunking import join_sections
+
+# Text extraction from downloaded files. Plain functions with no Drive or
+# Streamlit dependencies, so they can run in the parser worker processes.
+
+
+def extract_pdf(file_buffer) -> str:
+    """Extract text from PDF file"""
+    try:
+        pdf_reader = PyPDF2.PdfReader(file_buffer)
+        text = ""
+        for page in pdf_reader.pages:
+            text += page.extract_text() + "\n"
+        return text
+    except Exception as e:
+        print(f"Error extracting PDF: {str(e)}")
+        return ""
+
+
+def extract_docx(file_buffer) -> str:
+    """Extract text from DOCX file"""
+    try:
+        doc = Document(file_buffer)
+        text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+        return text
+    except Exception as e:
+        print(f"Error extracting DOCX: {str(e)}")
+        return ""
+
+
+def extract_slides_pdf(file_buffer) -> str:
+    """Extract text from a presentation exported as PDF, one section per slide"""
+    try:
+        pdf_reader = PyPDF2.PdfReader(file_buffer)
+        sections = []
+        for number, page in enumerate(pdf_reader.pages, 1):
+            slide_text = (page.extract_text() or "").strip()
+            if slide_text:
+                sections.append(f"=== Slide {number} ===\n{slide_text}")
+        return join_sections(sections)
+    except Exception as e:
+        print(f"Error extracting slides: {str(e)}")
+        return ""
+
+
+# A table as (title, header cells, data rows), all cells as strings
+Table = Tuple[str, List[str], List[List[str]]]
+
+
+def read_table(title: str, rows) -> Optional[Table]:
+    """
+    Collect table rows as strings, skipping empty rows
+
+    Args:
+        title: Table title, e.g. the sheet name
+        rows: Iterable of row value sequences; the first non-empty row is
+            treated as the header
+
+    Returns:
+        The table, or None if it has no non-empty rows
+    """
+    header = None
+    body = []
+    for row in rows:
+        cells = [str(cell) if cell is not None else "" for cell in row]
+        if not any(cell.strip() for cell in cells):
+            continue
+        if header is None:
+            header = cells
+        else:
+            body.append(cells)
+
+    if header is None:
+        return None
+    return title, header, body
+
+
+def table_section(title: str, header: List[str], rows: List[List[str]]) -> str:
+    """Format a table as a section whose heading carries the column headers"""
+    heading = f"=== {title} === Columns: {' | '.join(header)}"
+    return heading + "\n" + "\n".join(" | ".join(row) for row in rows)
+
+
+def extract_xlsx_tables(file_buffer) -> List[Table]:
+    """Read every sheet tab of an XLSX file as a table"""
+    try:
+        # Read-only mode streams rows instead of loading the whole workbook
+        workbook = openpyxl.load_workbook(file_buffer, data_only=True, read_only=True)
+        try:
+            tables = [
+                read_table(f"Sheet: {sheet_name}",
+                           workbook[sheet_name].iter_rows(values_only=True))
+                for sheet_name in workbook.sheetnames
+            ]
+        finally:
+            workbook.close()
+
+        return [table for table in tables if table]
+    except Exception as e:
+        print(f"Error extracting XLSX: {str(e)}")
+        return []
+
+
+def extract_csv_tables(file_buffer) -> List[Table]:
+    """Read a CSV file as a single table"""
+    try:
+        text = file_buffer.read().decode('utf-8', errors='ignore')
+        table = read_table("Table", csv.reader(io.StringIO(text)))
+        return [table] if table else []
+    except Exception as e:
+        print(f"Error extracting CSV: {str(e)}")
+        return []
+
+
+def extract_xlsx(file_buffer) -> str:
+    """Extract text from XLSX file, one section per sheet tab"""
+    return join_sections([table_section(*table) for table in extract_xlsx_tables(file_buffer)])
+
+
+def extract_csv(file_buffer) -> str:
+    """Extract text from CSV file as a single table section"""
+    return join_sections([table_section(*table) for table in extract_csv_tables(file_buffer)])
+
+
+def extract_text(file_buffer) -> str:
+    """Decode a plain text file"""
+    return file_buffer.read().decode('utf-8', errors='ignore')
+
+
+# Parser for each kind of document
+PARSERS = {
+    'pdf': extract_pdf,
+    'docx': extract_docx,
+    'slides': extract_slides_pdf,
+    'xlsx': extract_xlsx,
+    'csv': extract_csv,
+    'xlsx_tables': extract_xlsx_tables,
+    'csv_tables': extract_csv_tables,
+    'text': extract_text,
+}
+
+# Kinds whose parsers are CPU- or memory-heavy enough to isolate in workers
+HEAVY_KINDS = {'pdf', 'docx', 'slides', 'xlsx', 'xlsx_tables'}
+
+
+def parse(kind: str, source: Union[str, bytes]):
+    """
+    Extract text (or tables, for the *_tables kinds) from a file path or raw bytes
+
+    Args:
+        kind: Key of PARSERS
+        source: Path of a file on disk, or its contents
+
+    Returns:
+        Extracted text, or list of tables
+    """
+    parser = PARSERS[kind]
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return parser(f)
+    return parser(io.BytesIO(source))
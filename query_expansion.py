@@ -0,0 +1,97 @@
+import re
+from typing import List, Dict
+
+# Common English words that carry no retrieval signal on their own
+STOPWORDS = {
+    'a', 'about', 'all', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'by', 'can',
+    'could', 'did', 'do', 'does', 'for', 'from', 'give', 'has', 'have', 'how', 'i',
+    'in', 'is', 'it', 'its', 'me', 'my', 'of', 'on', 'or', 'our', 'please', 'should',
+    'show', 'tell', 'that', 'the', 'their', 'there', 'these', 'this', 'those', 'to',
+    'us', 'was', 'we', 'were', 'what', 'when', 'where', 'which', 'who', 'why', 'will',
+    'with', 'would', 'you', 'your',
+}
+
+_WORD_RE = re.compile(r"[\w'-]+")
+_SPLIT_RE = re.compile(r"\s*(?:,|;|\band\b|\bor\b|\bas well as\b|\bversus\b|\bvs\.?)\s*",
+                       re.IGNORECASE)
+
+
+def keywords(text: str) -> List[str]:
+    """Content words of a text, in order, without stopwords"""
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+def keyword_variants(question: str, max_variants: int = 4) -> List[str]:
+    """
+    Generate query variants locally, without any model call
+
+    Produces the original question, a keyword-only form, and one query per
+    part of a compound question ("travel and reimbursement policies" also
+    searches "travel" and "reimbursement policies").
+
+    Args:
+        question: Search query
+        max_variants: Maximum number of variants, including the original
+
+    Returns:
+        Distinct query variants, original first
+    """
+    variants = [question]
+
+    terms = keywords(question)
+    if len(terms) > 1:
+        variants.append(" ".join(terms))
+
+    parts = [part for part in _SPLIT_RE.split(question) if part]
+    if len(parts) > 1:
+        # A lone modifier ("travel" in "travel and reimbursement policies")
+        # borrows the noun that ends the last part
+        last_terms = keywords(parts[-1])
+        shared = last_terms[-1:] if len(last_terms) > 1 else []
+        for part in parts:
+            part_terms = keywords(part)
+            if not part_terms:
+                continue
+            if len(part_terms) == 1 and shared and shared != part_terms:
+                part_terms = part_terms + shared
+            variants.append(" ".join(part_terms))
+
+    distinct = []
+    seen = set()
+    for variant in variants:
+        key = variant.lower().strip()
+        if key and key not in seen:
+            seen.add(key)
+            distinct.append(variant)
+    return distinct[:max_variants]
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]], top_k: int, k: int = 60) -> List[Dict]:
+    """
+    Merge ranked result lists into one, deduplicated by chunk ID
+
+    Each chunk scores sum(1 / (k + rank)) over the lists it appears in, so
+    chunks found by several variants rise to the top. The highest similarity
+    seen for a chunk is kept on the returned row.
+
+    Args:
+        result_lists: Search results per query variant, best first
+        top_k: Number of results to return
+        k: Rank damping constant (60 is the usual choice)
+
+    Returns:
+        Fused results, best first
+    """
+    scores: Dict[str, float] = {}
+    rows: Dict[str, Dict] = {}
+
+    for results in result_lists:
+        for rank, row in enumerate(results, 1):
+            row_id = row['id']
+            scores[row_id] = scores.get(row_id, 0.0) + 1.0 / (k + rank)
+            best = rows.get(row_id)
+            if best is None or row.get('similarity', 0.0) > best.get('similarity', 0.0):
+                rows[row_id] = row
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [rows[row_id] for row_id in ranked[:top_k]]
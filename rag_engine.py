@@ -1,7 +1,142 @@
+import json
 import os
-from typing import List, Dict, Tuple
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional
 import anthropic
 
+from model_router import ModelRouter
+from parsers import table_section
+from query_expansion import keyword_variants, keywords, reciprocal_rank_fusion
+from rescoring import adaptive_cutoff, token_budget_count
+from table_store import TableStore
+
+# Words that usually mean a question depends on earlier turns
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|they|them|their|this|that|these|those|he|she|his|her|"
+    r"one|ones|first|second|third|last|previous|above|same|also|else|"
+    r"what about|how about|and the|more)\b",
+    re.IGNORECASE
+)
+
+# Retrieval modes accepted by MULTI_QUERY and RAGEngine.query
+MULTI_QUERY_MODES = ('off', 'keywords', 'llm')
+
+# Longer questions usually name what they ask about, even with a referring word
+FOLLOW_UP_MAX_WORDS = 10
+
+
+SYSTEM_PROMPT = """You are an intelligent document assistant for Wake Forest University. 
+Your role is to help users find information from their documents accurately and helpfully.
+
+Guidelines:
+- Answer questions based ONLY on the provided document context
+- If the answer isn't in the documents, clearly state that
+- Cite specific documents when providing information
+- Be concise but thorough
+- Use a professional, academic tone appropriate for a university setting
+- If the documents contain conflicting information, acknowledge this
+- Always prioritize accuracy over speculation"""
+
+def normalize_query(query: str) -> str:
+    """Cache key of a query: lowercased, with whitespace collapsed"""
+    return " ".join(query.lower().split())
+
+
+# Token counts reported by the Messages API, accumulated in RAGEngine.usage
+# (whole process) and ConversationMemory.usage (one session)
+USAGE_FIELDS = (
+    'input_tokens',
+    'output_tokens',
+    'cache_creation_input_tokens',
+    'cache_read_input_tokens',
+)
+
+
+def empty_usage() -> Dict:
+    """Zeroed token usage totals"""
+    return {'requests': 0, **{field: 0 for field in USAGE_FIELDS}}
+
+
+def cache_hit_rate(usage: Dict) -> float:
+    """Share of prompt input tokens in usage totals served from the prompt cache"""
+    total = (
+        usage['input_tokens']
+        + usage['cache_creation_input_tokens']
+        + usage['cache_read_input_tokens']
+    )
+    return usage['cache_read_input_tokens'] / total if total else 0.0
+
+
+class ConversationMemory:
+    """
+    Per-session conversation state for multi-turn queries
+    
+    Keeps the last few turns verbatim and folds older turns into a rolling
+    summary, so the prompt stays bounded however long the conversation runs.
+    Also caches query embeddings so repeated standalone queries are not
+    re-embedded, and totals the Claude token usage of the session's answers.
+    """
+    
+    def __init__(self, recent_turns: int = 4, embedding_cache_size: int = 64):
+        """
+        Initialize conversation memory
+        
+        Args:
+            recent_turns: Number of messages (user and assistant) kept verbatim
+            embedding_cache_size: Maximum number of cached query embeddings
+        """
+        self.summary = ""
+        self.turns: List[Dict] = []
+        self.recent_turns = recent_turns
+        self.embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.embedding_cache_size = embedding_cache_size
+        self.usage = empty_usage()
+    
+    def add_turn(self, role: str, content: str) -> None:
+        """Append a message to the conversation"""
+        self.turns.append({'role': role, 'content': content})
+    
+    def overflow(self) -> List[Dict]:
+        """Messages that no longer fit in the verbatim window"""
+        return self.turns[:-self.recent_turns] if len(self.turns) > self.recent_turns else []
+    
+    def transcript(self) -> str:
+        """Summary plus recent turns as plain text for prompts"""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation:\n{self.summary}")
+        for turn in self.turns[-self.recent_turns:]:
+            parts.append(f"{turn['role'].capitalize()}: {turn['content']}")
+        return "\n\n".join(parts)
+    
+    def get_embedding(self, query: str) -> Optional[List[float]]:
+        """Look up a cached query embedding"""
+        key = normalize_query(query)
+        embedding = self.embedding_cache.get(key)
+        if embedding is not None:
+            self.embedding_cache.move_to_end(key)
+        return embedding
+    
+    def put_embedding(self, query: str, embedding: List[float]) -> None:
+        """Cache a query embedding, evicting the least recently used one"""
+        # Zero vectors stand in for failed embedding calls
+        if not any(embedding):
+            return
+        key = normalize_query(query)
+        self.embedding_cache[key] = embedding
+        self.embedding_cache.move_to_end(key)
+        while len(self.embedding_cache) > self.embedding_cache_size:
+            self.embedding_cache.popitem(last=False)
+    
+    def clear(self) -> None:
+        """Forget the conversation (the embedding cache stays valid)"""
+        self.summary = ""
+        self.turns = []
+
+
 class RAGEngine:
     """RAG engine using Claude for response generation"""
     
@@ -22,38 +157,443 @@ class RAGEngine:
         self.client = anthropic.Anthropic(api_key=api_key)
         self.model = "claude-sonnet-4-20250514"  # Latest Claude Sonnet model
         self.max_tokens = 4096
+        # Small, fast model for query rewriting and history summaries
+        self.utility_model = "claude-3-5-haiku-20241022"
+        
+        # Route simple lookups to the small model; set MODEL_ROUTING=false to
+        # always use self.model
+        self.routing_enabled = os.getenv('MODEL_ROUTING', 'true').lower() != 'false'
+        self.router = ModelRouter(tiers={
+            'fast': {'model': self.utility_model, 'max_tokens': 1024},
+            'full': {'model': self.model, 'max_tokens': self.max_tokens},
+        })
+        
+        # Multi-query retrieval: 'off', 'keywords' (local expansion) or 'llm'
+        self.multi_query = os.getenv('MULTI_QUERY', 'off').lower()
+        if self.multi_query not in MULTI_QUERY_MODES:
+            raise ValueError(f"Unknown multi-query mode: {self.multi_query}")
+        self.max_query_variants = 4
+        
+        # Rows of large spreadsheet tables are looked up locally for the
+        # spreadsheets that retrieval returns
+        self.table_store = TableStore.from_env()
+        self.table_lookup_rows = 20
+        
+        # Dynamic top_k: over-fetch max_chunks candidates and keep as many as
+        # their score distribution and the context token budget justify
+        self.max_chunks = 10
+        self.min_chunks = 1
+        self.context_token_budget = int(os.getenv('CONTEXT_TOKEN_BUDGET', '4000'))
+        self.cutoff = vector_store.load_cutoff_params()
+        
+        # Token usage of answer generation, including prompt cache reads/writes
+        self.usage = empty_usage()
+        
+        # Query embeddings shared by every conversation using this engine,
+        # e.g. frequent questions embedded ahead of time by prefetch_embeddings
+        self.query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.query_embedding_cache_size = 1024
+        self._embedding_lock = threading.Lock()
+        
+        # Identical questions asked at the same time (e.g. by a whole class)
+        # share one pipeline run; see _single_flight
+        self._in_flight: Dict[Tuple, Future] = {}
+        self._in_flight_lock = threading.Lock()
+        self.coalesced_queries = 0
     
-    def query(self, question: str, top_k: int = 5) -> Tuple[str, List[Dict]]:
+    def query(self, question: str, top_k: Optional[int] = None, filters: Optional[Dict] = None,
+              conversation: Optional[ConversationMemory] = None,
+              multi_query: Optional[str] = None) -> Tuple[str, List[Dict]]:
         """
         Query the RAG system
         
+        Concurrent calls with the same question, conversation history,
+        filters and options share one retrieval and answer.
+        
         Args:
             question: User's question
-            top_k: Number of relevant documents to retrieve
+            top_k: Number of relevant documents to retrieve. If None, up to
+                max_chunks are retrieved and cut by select_chunks.
+            filters: Optional metadata filters passed to the vector store
+                (file_ids, mime_types, folder_id, modified_after, modified_before)
+            conversation: Optional session memory. Follow-up questions are
+                rewritten into standalone queries for retrieval, and the
+                summarized history is included in the prompt.
+            multi_query: Retrieval mode overriding self.multi_query: 'off',
+                'keywords' or 'llm'. The latter two search several query
+                variants in parallel and fuse the results.
             
         Returns:
             Tuple of (response text, list of source documents)
         """
+        mode = multi_query or self.multi_query
+        if mode not in MULTI_QUERY_MODES:
+            raise ValueError(f"Unknown multi-query mode: {mode}")
+        
+        search_query = question
+        if conversation is not None and conversation.turns and self._is_follow_up(question):
+            search_query = self._rewrite_query(question, conversation)
+        history = conversation.transcript() if conversation is not None else ""
+        
+        # Everything the answer depends on; concurrent queries with the same key
+        # get the same answer
+        key = (
+            normalize_query(question), normalize_query(search_query), history,
+            json.dumps(filters or {}, sort_keys=True, default=str), top_k, mode,
+        )
+        response, sources = self._single_flight(key, lambda: self._run_query(
+            question, search_query, history, top_k, filters, conversation, mode
+        ))
+        
+        if conversation is not None:
+            conversation.add_turn('user', question)
+            conversation.add_turn('assistant', response)
+            self._update_summary(conversation)
+        
+        return response, list(sources)
+    
+    def _single_flight(self, key: Tuple, run) -> Tuple[str, List[Dict]]:
+        """
+        Run a query pipeline, or wait for an identical one already running
+        
+        The first caller for a key runs the pipeline; callers arriving while
+        it runs block and receive its result (or exception) instead of
+        repeating the embedding, search and Claude calls. Nothing is cached
+        once the run finishes.
+        
+        Args:
+            key: Identity of the query (see query)
+            run: Runs the pipeline and returns (response, sources)
+        """
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced_queries += 1
+        
+        if not leader:
+            return future.result()
+        
+        try:
+            result = run()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+    
+    def _run_query(self, question: str, search_query: str, history: str, top_k: Optional[int],
+                   filters: Optional[Dict], conversation: Optional[ConversationMemory],
+                   mode: str) -> Tuple[str, List[Dict]]:
+        """Retrieve, answer and format sources for one query (see query)"""
         # Retrieve relevant documents
-        relevant_docs = self.vector_store.search(question, top_k=top_k)
+        relevant_docs = self._retrieve(
+            search_query, top_k or self.max_chunks, filters, conversation, mode
+        )
+        if top_k is None:
+            relevant_docs = self.select_chunks(relevant_docs)
+        # Content is loaded only for the chunks that made the cut
+        relevant_docs = self.vector_store.fetch_chunks(relevant_docs)
         
         if not relevant_docs:
-            return (
+            response = (
                 "I couldn't find any relevant documents to answer your question. "
-                "Please try rephrasing your question or check if documents have been indexed.",
-                []
+                "Please try rephrasing your question or check if documents have been indexed."
             )
+            return response, []
         
         # Build context from retrieved documents
         context = self._build_context(relevant_docs)
+        table_rows = self._lookup_table_rows(search_query, relevant_docs)
+        if table_rows:
+            context = f"{context}\n{table_rows}"
         
-        # Generate response using Claude
-        response = self._generate_response(question, context)
+        # Generate response using Claude, with the model picked by the router
+        response = self._answer(question, relevant_docs, context, history,
+                                conversation.usage if conversation is not None else None)
         
         # Format sources for display
-        sources = self._format_sources(relevant_docs)
+        return response, self._format_sources(relevant_docs)
+    
+    def _retrieve(self, search_query: str, top_k: int, filters: Optional[Dict],
+                  conversation: Optional[ConversationMemory], mode: str) -> List[Dict]:
+        """
+        Search the vector store with one query or a fan-out of variants
+        
+        Variants are embedded in one batched request and searched concurrently;
+        results are fused by reciprocal rank and deduplicated by chunk ID, so
+        the prompt still gets top_k chunks.
         
-        return response, sources
+        Args:
+            search_query: Standalone search query
+            top_k: Number of chunks to return
+            filters: Optional metadata filters
+            conversation: Optional session memory holding the embedding cache
+            mode: 'off', 'keywords' or 'llm'
+            
+        Returns:
+            Retrieved chunks, best first
+        """
+        if mode == 'keywords':
+            variants = keyword_variants(search_query, self.max_query_variants)
+        elif mode == 'llm':
+            variants = self._llm_variants(search_query)
+        else:
+            variants = [search_query]
+        
+        embeddings = self._embed_queries(variants, conversation)
+        
+        if len(variants) == 1:
+            return self.vector_store.search(
+                search_query, top_k=top_k, filters=filters, query_embedding=embeddings[0],
+                hydrate=False
+            )
+        
+        def search_variant(pair):
+            variant, embedding = pair
+            return self.vector_store.search(
+                variant, top_k=top_k, filters=filters, query_embedding=embedding,
+                hydrate=False
+            )
+        
+        with ThreadPoolExecutor(max_workers=len(variants)) as pool:
+            result_lists = list(pool.map(search_variant, zip(variants, embeddings)))
+        
+        return reciprocal_rank_fusion(result_lists, top_k)
+    
+    def select_chunks(self, documents: List[Dict]) -> List[Dict]:
+        """
+        Keep the chunks an answer needs from an over-fetched candidate list
+        
+        Finds where similarity falls off (see adaptive_cutoff, with the
+        thresholds fitted by calibrate_retrieval.py) and drops the chunks
+        below that score, then cuts to what fits in context_token_budget.
+        Easy questions with one clear match get a short prompt; broad ones
+        keep more chunks. The order is kept, so chunks ranked up by fusion
+        or MMR are not pushed back behind more similar ones.
+        
+        Args:
+            documents: Retrieved chunks, best first
+            
+        Returns:
+            The kept chunks, in the given order
+        """
+        scores = [doc.get('similarity', 0.0) for doc in documents]
+        ranked = sorted(scores, reverse=True)
+        count = adaptive_cutoff(
+            ranked,
+            self.cutoff['min_similarity'], self.cutoff['relative_drop'], self.cutoff['min_gap'],
+            min_k=self.min_chunks
+        )
+        if count < len(ranked):
+            floor = ranked[count - 1] if count else float('inf')
+            documents = [doc for doc, score in zip(documents, scores) if score >= floor]
+        lengths = [doc.get('content_length') or len(doc.get('content', '')) for doc in documents]
+        return documents[:token_budget_count(lengths, self.context_token_budget)]
+    
+    def _embed_queries(self, queries: List[str],
+                       conversation: Optional[ConversationMemory]) -> List[List[float]]:
+        """Embed queries in one request, reusing the session and engine caches where possible"""
+        embeddings = [
+            conversation.get_embedding(query) if conversation is not None else None
+            for query in queries
+        ]
+        for i, query in enumerate(queries):
+            if embeddings[i] is None:
+                embeddings[i] = self._cached_embedding(query)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        if missing:
+            created = self.vector_store.create_embeddings([queries[i] for i in missing])
+            for i, embedding in zip(missing, created):
+                embeddings[i] = embedding
+                self._cache_embedding(queries[i], embedding)
+        
+        if conversation is not None:
+            for query, embedding in zip(queries, embeddings):
+                conversation.put_embedding(query, embedding)
+        return embeddings
+    
+    def _cached_embedding(self, query: str) -> Optional[List[float]]:
+        """Look up a query embedding in the engine-wide cache"""
+        key = normalize_query(query)
+        with self._embedding_lock:
+            embedding = self.query_embeddings.get(key)
+            if embedding is not None:
+                self.query_embeddings.move_to_end(key)
+            return embedding
+    
+    def _cache_embedding(self, query: str, embedding: List[float]) -> None:
+        """Add a query embedding to the engine-wide cache, evicting the least recently used"""
+        # Zero vectors stand in for failed embedding calls
+        if not any(embedding):
+            return
+        key = normalize_query(query)
+        with self._embedding_lock:
+            self.query_embeddings[key] = embedding
+            self.query_embeddings.move_to_end(key)
+            while len(self.query_embeddings) > self.query_embedding_cache_size:
+                self.query_embeddings.popitem(last=False)
+    
+    def prefetch_embeddings(self, queries: List[str], batch_size: int = 100) -> int:
+        """
+        Embed queries ahead of time into the engine-wide cache
+        
+        Args:
+            queries: Questions likely to be asked, most likely first
+            batch_size: Queries per embedding request
+            
+        Returns:
+            Number of queries embedded (already cached ones are skipped)
+        """
+        queries = list(OrderedDict.fromkeys(normalize_query(query) for query in queries))
+        queries = [query for query in queries[:self.query_embedding_cache_size]
+                   if self._cached_embedding(query) is None]
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            for query, embedding in zip(batch, self.vector_store.create_embeddings(batch)):
+                self._cache_embedding(query, embedding)
+        return len(queries)
+    
+    def _llm_variants(self, search_query: str) -> List[str]:
+        """
+        Ask the small model for alternative phrasings of a query
+        
+        Returns:
+            The original query followed by the alternatives, or local keyword
+            variants if the call fails
+        """
+        try:
+            message = self.client.messages.create(
+                model=self.utility_model,
+                max_tokens=200,
+                system=(
+                    f"Write {self.max_query_variants - 1} alternative search queries that "
+                    "would find documents answering the user's question, covering "
+                    "different wordings and sub-topics. One query per line, no numbering."
+                ),
+                messages=[{"role": "user", "content": search_query}]
+            )
+            lines = [line.strip(" -•\t") for line in message.content[0].text.splitlines()]
+            alternatives = [line for line in lines if line]
+            return [search_query] + alternatives[:self.max_query_variants - 1]
+        except Exception as e:
+            print(f"Error generating query variants: {str(e)}")
+            return keyword_variants(search_query, self.max_query_variants)
+    
+    def _answer(self, question: str, documents: List[Dict], context: str, history: str,
+                usage: Optional[Dict] = None) -> str:
+        """
+        Generate the answer with the cheapest model that can handle it
+        
+        Args:
+            question: User's question
+            documents: Retrieved chunks, used for routing
+            context: Context built from the chunks
+            history: Summarized conversation so far, if any
+            usage: Session totals to add the token usage to, besides self.usage
+            
+        Returns:
+            Generated response
+        """
+        if not self.routing_enabled:
+            response, _ = self._generate_response(question, context, history, usage=usage)
+            return response
+        
+        decision = self.router.route(question, documents, has_history=bool(history))
+        response, stop_reason = self._generate_response(
+            question, context, history, decision['model'], decision['max_tokens'], usage
+        )
+        
+        # Escalate only when the fast answer failed, was cut off or came up empty
+        if decision['tier'] == 'fast' and self.router.should_escalate(response, stop_reason):
+            why = 'fast answer truncated or failed' if stop_reason != 'end_turn' else 'fast answer uncertain'
+            decision = self.router.escalate(decision, why)
+            response, _ = self._generate_response(
+                question, context, history, decision['model'], decision['max_tokens'], usage
+            )
+        
+        self.router.log(decision)
+        return response
+    
+    def _is_follow_up(self, question: str) -> bool:
+        """
+        Cheap check for questions that only make sense with earlier turns
+        
+        Both a referring word and a short question are required, so most
+        standalone questions skip the rewrite call.
+        """
+        return (len(question.split()) <= FOLLOW_UP_MAX_WORDS
+                and bool(FOLLOW_UP_PATTERN.search(question)))
+    
+    def _rewrite_query(self, question: str, conversation: ConversationMemory) -> str:
+        """
+        Rewrite a follow-up question into a standalone search query
+        
+        Args:
+            question: Latest user question
+            conversation: Session memory with the summary and recent turns
+            
+        Returns:
+            Standalone query, or the original question if rewriting fails
+        """
+        try:
+            message = self.client.messages.create(
+                model=self.utility_model,
+                max_tokens=200,
+                system=(
+                    "Rewrite the user's latest question as a standalone search query, "
+                    "resolving references to earlier turns. Reply with the query only."
+                ),
+                messages=[{
+                    "role": "user",
+                    "content": f"{conversation.transcript()}\n\nLatest question: {question}"
+                }]
+            )
+            rewritten = message.content[0].text.strip()
+            return rewritten or question
+        except Exception as e:
+            print(f"Error rewriting follow-up question: {str(e)}")
+            return question
+    
+    def _update_summary(self, conversation: ConversationMemory) -> None:
+        """
+        Fold turns that left the verbatim window into the rolling summary
+        
+        Only the evicted turns and the previous summary are sent, so the cost
+        does not grow with the length of the conversation.
+        """
+        evicted = conversation.overflow()
+        if not evicted:
+            return
+        
+        turns = "\n\n".join(f"{turn['role'].capitalize()}: {turn['content']}" for turn in evicted)
+        try:
+            message = self.client.messages.create(
+                model=self.utility_model,
+                max_tokens=400,
+                system=(
+                    "Update the conversation summary with the new turns. Keep the "
+                    "topics, documents and facts discussed, in under 150 words. "
+                    "Reply with the summary only."
+                ),
+                messages=[{
+                    "role": "user",
+                    "content": f"Current summary:\n{conversation.summary or '(none)'}\n\nNew turns:\n{turns}"
+                }]
+            )
+            conversation.summary = message.content[0].text.strip()
+        except Exception as e:
+            print(f"Error updating conversation summary: {str(e)}")
+            # Keep the turns rather than losing them
+            return
+        
+        conversation.turns = conversation.turns[len(evicted):]
     
     def _build_context(self, documents: List[Dict]) -> str:
         """
@@ -67,6 +607,10 @@ class RAGEngine:
         """
         context_parts = []
         
+        # Order chunks by location rather than score, so the same set of
+        # retrieved chunks always yields the same text and hits the prompt cache
+        documents = sorted(documents, key=lambda doc: (doc['file_id'], doc.get('chunk_id', 0)))
+        
         for i, doc in enumerate(documents, 1):
             context_parts.append(
                 f"[Document {i}: {doc['file_name']}]\n{doc['content']}\n"
@@ -74,58 +618,121 @@ class RAGEngine:
         
         return "\n".join(context_parts)
     
-    def _generate_response(self, question: str, context: str) -> str:
+    def _lookup_table_rows(self, search_query: str, documents: List[Dict]) -> str:
+        """
+        Find rows matching the query in the stored tables of retrieved spreadsheets
+        
+        Large tables are embedded only as summaries, so exact rows come from
+        keyword filtering of the local table store instead.
+        
+        Returns:
+            Context text with the matching rows, or "" if there are none
+        """
+        if self.table_store is None:
+            return ""
+        
+        terms = keywords(search_query)
+        parts = []
+        file_names = {doc['file_id']: doc['file_name'] for doc in documents}
+        for file_id in sorted(file_names):
+            tables = self.table_store.lookup(file_id, terms, self.table_lookup_rows)
+            if tables:
+                sections = "\n".join(table_section(*table) for table in tables)
+                parts.append(f"[Matching rows from {file_names[file_id]}]\n{sections}\n")
+        return "\n".join(parts)
+    
+    def _generate_response(self, question: str, context: str, history: str = "",
+                           model: Optional[str] = None,
+                           max_tokens: Optional[int] = None,
+                           usage: Optional[Dict] = None) -> Tuple[str, Optional[str]]:
         """
         Generate response using Claude
         
         Args:
             question: User's question
             context: Retrieved context
+            history: Summarized conversation so far, if any
+            model: Model to use (default: self.model)
+            max_tokens: Response token limit (default: self.max_tokens)
+            usage: Session totals to add the token usage to, besides self.usage
             
         Returns:
-            Generated response
+            Tuple of (generated response, API stop reason or None on error)
         """
-        # Construct prompt
-        system_prompt = """You are an intelligent document assistant for Wake Forest University. 
-Your role is to help users find information from their documents accurately and helpfully.
+        # Cache breakpoints: the system prompt, then the document context.
+        # Both come before anything that changes between similar questions.
+        system = [{
+            "type": "text",
+            "text": SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"}
+        }]
+        
+        conversation_part = f"""Conversation so far:
+{history}
 
-Guidelines:
-- Answer questions based ONLY on the provided document context
-- If the answer isn't in the documents, clearly state that
-- Cite specific documents when providing information
-- Be concise but thorough
-- Use a professional, academic tone appropriate for a university setting
-- If the documents contain conflicting information, acknowledge this
-- Always prioritize accuracy over speculation"""
+""" if history else ""
 
-        user_prompt = f"""Based on the following documents, please answer the question.
+        content = [
+            {
+                "type": "text",
+                "text": f"""Based on the following documents, please answer the question.
 
 Documents:
-{context}
-
-Question: {question}
+{context}""",
+                "cache_control": {"type": "ephemeral"}
+            },
+            {
+                "type": "text",
+                "text": f"""{conversation_part}Question: {question}
 
 Please provide a clear, accurate answer based on the documents above. If the documents don't contain 
 enough information to answer the question, please say so."""
+            }
+        ]
 
         try:
             # Call Claude API
             message = self.client.messages.create(
-                model=self.model,
-                max_tokens=self.max_tokens,
-                system=system_prompt,
+                model=model or self.model,
+                max_tokens=max_tokens or self.max_tokens,
+                system=system,
                 messages=[
-                    {"role": "user", "content": user_prompt}
+                    {"role": "user", "content": content}
                 ]
             )
+            self._record_usage(message, usage)
             
             # Extract response text
             response_text = message.content[0].text
-            return response_text
+            return response_text, message.stop_reason
             
         except Exception as e:
             print(f"Error generating response with Claude: {str(e)}")
-            return "I encountered an error generating a response. Please try again."
+            return "I encountered an error generating a response. Please try again.", None
+    
+    def _record_usage(self, message, usage: Optional[Dict] = None) -> None:
+        """Add the token counts of a Claude response to the running totals,
+        and to the session's if given"""
+        for totals in (self.usage, usage):
+            if totals is None:
+                continue
+            totals['requests'] += 1
+            for field in USAGE_FIELDS:
+                totals[field] += getattr(message.usage, field, None) or 0
+    
+    def cache_hit_rate(self) -> float:
+        """Share of prompt input tokens served from the prompt cache, over all sessions"""
+        return cache_hit_rate(self.usage)
+    
+    def load_sources(self, chunk_ids: List[str]) -> List[Dict]:
+        """
+        Rebuild the sources of an earlier answer from their chunk IDs
+        
+        Lets callers keep only the IDs of past sources instead of the
+        formatted snippets. Chunks deleted since are left out.
+        """
+        rows = self.vector_store.fetch_chunks([{'id': chunk_id} for chunk_id in chunk_ids])
+        return self._format_sources(rows)
     
     def _format_sources(self, documents: List[Dict]) -> List[Dict]:
         """
@@ -152,10 +759,17 @@ enough information to answer the question, please say so."""
                 snippet = content[:200] + "..." if len(content) > 200 else content
                 
                 sources.append({
+                    # Chunk row ID, enough to rebuild the source (see load_sources)
+                    'id': doc['id'],
                     'title': doc['file_name'],
                     'url': doc.get('file_url', ''),
                     'snippet': snippet,
-                    'type': doc.get('mime_type', 'unknown')
+                    'type': doc.get('mime_type', 'unknown'),
+                    # Other files containing the same (deduplicated) content
+                    'also_in': [
+                        {'title': other['file_name'], 'url': other.get('file_url', '')}
+                        for other in doc.get('duplicate_sources') or []
+                    ]
                 })
         
         return sources
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Re-chunk and Re-embed from Cached Text for Wake Forest RAG App
+Rebuilds the chunks of every indexed file from the local text cache, e.g.
+after changing chunk_size or the chunking rules, without Drive or the parsers
+
+Usage:
+    python rechunk.py
+"""
+
+import sys
+
+from text_cache import TextCache
+from supabase_store import SupabaseVectorStore
+
+
+def main() -> int:
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    print("=" * 60)
+    print("Wake Forest RAG App - Re-chunk from Text Cache")
+    print("=" * 60)
+
+    cache = TextCache.from_env()
+    if cache is None:
+        print("❌ Text cache is disabled (TEXT_CACHE_DIR is empty).")
+        return 1
+
+    vector_store = SupabaseVectorStore()
+    entries = list(cache.entries())
+    indexed = vector_store.get_indexed_files([file_info['id'] for file_info, _ in entries])
+
+    rechunked = 0
+    for file_info, text in entries:
+        state = indexed.get(file_info['id'])
+        # Files no longer indexed (deleted, moved away) stay out of the index
+        if not state:
+            continue
+        # Names and folders may have changed since the text was cached
+        file_info = {
+            **file_info,
+            'name': state['file_name'],
+            'folderIds': state.get('folder_ids') or [],
+            'namespace': state.get('namespace'),
+        }
+
+        try:
+            vector_store.delete_file(file_info['id'])
+            chunks = vector_store.create_chunks(text, file_info)
+            try:
+                vector_store.add_documents(chunks)
+            finally:
+                summarized = vector_store.add_summary(text, file_info)
+            if not summarized:
+                raise RuntimeError("chunks stored, but the file summary could not be created")
+            rechunked += 1
+            print(f"✅ {file_info['name']}: {len(chunks)} chunks")
+        except Exception as e:
+            print(f"❌ {file_info['name']}: {str(e)}")
+
+    vector_store.save_shared_sources()
+
+    print("-" * 60)
+    print(f"Re-chunked {rechunked} of {len(indexed)} indexed files found in the cache")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import json
+from typing import List, Sequence, Union
+
+import numpy as np
+
+
+def parse_embeddings(values: Sequence[Union[str, List[float]]]) -> np.ndarray:
+    """
+    Stack embeddings into a float32 matrix
+
+    PostgREST returns pgvector columns as text ("[0.1,0.2,...]"); all rows
+    are decoded in a single JSON parse.
+
+    Args:
+        values: Embeddings as pgvector text or lists of floats
+
+    Returns:
+        Matrix with one row per embedding
+    """
+    if len(values) and isinstance(values[0], str):
+        return np.array(json.loads("[" + ",".join(values) + "]"), dtype=np.float32)
+    return np.asarray(values, dtype=np.float32)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale vectors (rows) to unit length"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, np.float32(1e-12))
+
+
+def cosine_scores(query_embedding: Sequence[float], matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every row to the query, as one matrix-vector product"""
+    query = normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+    return normalize_rows(matrix) @ query
+
+
+def mmr_select(scores: np.ndarray, matrix: np.ndarray, top_k: int,
+               diversity: float = 0.3, duplicate_similarity: float = 0.97) -> np.ndarray:
+    """
+    Pick results by maximal marginal relevance
+
+    Each pick maximizes (1 - diversity) * relevance - diversity * (highest
+    similarity to an earlier pick), so chunks repeating what is already
+    selected drop down. Candidates at least duplicate_similarity to a pick
+    are removed outright. Pairwise similarities come from one matrix product;
+    the loop runs once per pick, not per candidate.
+
+    Args:
+        scores: Relevance of each candidate to the query
+        matrix: Candidate embeddings, one per row
+        top_k: Number of results to pick
+        diversity: Weight of redundancy against relevance (0 ranks by relevance only)
+        duplicate_similarity: Similarity at which a candidate counts as a near-duplicate
+
+    Returns:
+        Indices of the picked candidates, in pick order
+    """
+    unit = normalize_rows(matrix)
+    pairwise = unit @ unit.T
+
+    available = np.ones(len(scores), dtype=bool)
+    redundancy = np.zeros(len(scores), dtype=np.float32)
+    picks = []
+    while len(picks) < top_k and available.any():
+        marginal = np.where(available, (1 - diversity) * scores - diversity * redundancy, -np.inf)
+        pick = int(np.argmax(marginal))
+        picks.append(pick)
+        available &= pairwise[pick] < duplicate_similarity
+        available[pick] = False
+        redundancy = np.maximum(redundancy, pairwise[pick])
+
+    return np.array(picks, dtype=int)
+
+
+# Score-distribution cutoff used until calibrate_retrieval.py has stored one
+DEFAULT_CUTOFF = {'min_similarity': 0.0, 'relative_drop': 0.15, 'min_gap': 0.05}
+
+
+def adaptive_cutoff(scores: Sequence[float], min_similarity: float, relative_drop: float,
+                    min_gap: float, min_k: int = 1) -> int:
+    """
+    Decide how many of an over-fetched, best-first candidate list to keep
+
+    Candidates are kept while they score at least min_similarity and no more
+    than relative_drop below the best one. Within those, the list is cut at
+    the largest gap between consecutive scores if that gap is at least
+    min_gap, the point where the clearly relevant chunks end.
+
+    Args:
+        scores: Candidate similarities, in descending order
+        min_similarity: Absolute score floor
+        relative_drop: Largest allowed distance from the best score
+        min_gap: Smallest score drop treated as a relevance boundary
+        min_k: Fewest candidates to keep, if there are that many
+
+    Returns:
+        Number of leading candidates to keep
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    if not len(scores):
+        return 0
+    floor_k = min(min_k, len(scores))
+
+    # Scores are sorted, so the candidates passing both floors are a prefix
+    keep = int(np.count_nonzero((scores >= min_similarity) & (scores >= scores[0] - relative_drop)))
+    if keep > floor_k:
+        gaps = scores[:keep - 1] - scores[1:keep]
+        # Only cuts that leave at least floor_k candidates are considered
+        start = max(floor_k - 1, 0)
+        cut = int(np.argmax(gaps[start:])) + start
+        if gaps[cut] >= min_gap:
+            keep = cut + 1
+    return max(keep, floor_k)
+
+
+def token_budget_count(lengths: Sequence[int], budget: int) -> int:
+    """Number of leading texts, given their lengths in characters, that fit in a
+    token budget (at least one), at ~4 characters per token"""
+    if not len(lengths):
+        return 0
+    tokens = np.cumsum(np.asarray(lengths, dtype=np.int64) // 4)
+    return max(int(np.searchsorted(tokens, budget, side='right')), 1)
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 import os
-import subprocess
 import sys
 
 # Get port from environment or use default
@@ -12,14 +11,33 @@ try:
 except ValueError:
     port = '8501'
 
+# Warm up before the server starts listening, so health checks only pass once
+# the first query will be fast. Streamlit runs in this process afterwards and
+# reuses the warmed-up engine. Set WARMUP=false to skip.
+if os.environ.get('WARMUP', 'true').lower() != 'false':
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from warmup import warm_up
+
+    print("Warming up...")
+    status = warm_up()
+    steps = ", ".join(
+        f"{name} {step['ms']} ms" + (" (failed)" if 'error' in step else "")
+        for name, step in status['steps'].items()
+    )
+    print(f"Warm-up finished in {status['seconds']} s: {steps}")
+
 print(f"Starting Streamlit on port {port}")
 
 # Run streamlit
-cmd = [
-    sys.executable, '-m', 'streamlit', 'run', 'app.py',
+from streamlit.web import cli as stcli
+
+sys.argv = [
+    'streamlit', 'run', 'app.py',
     '--server.port', port,
     '--server.address', '0.0.0.0',
     '--server.headless', 'true'
 ]
 
-subprocess.run(cmd)
\ No newline at end of file
+sys.exit(stcli.main())
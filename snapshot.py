@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Index Snapshots for Wake Forest RAG App
+Copies the search index between environments without crawling Drive or
+re-embedding anything
+
+Usage:
+    python snapshot.py export <dir>
+    python snapshot.py import <dir> [--replace]
+
+A snapshot is a directory with, per table, the embeddings as a float16
+NumPy block (memory-mapped on import) and the other columns as gzip JSON,
+one list per column. Import uses Postgres COPY when DATABASE_URL is set and
+psycopg2 is installed, replacing and loading all tables in one transaction,
+and batched upserts through Supabase otherwise.
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from rescoring import parse_embeddings
+from supabase_store import SupabaseVectorStore
+
+SNAPSHOT_VERSION = 2
+
+# Tables copied by a snapshot: key column, other columns, and whether rows
+# have an embedding (stored separately as float16)
+SNAPSHOT_TABLES = {
+    'documents': {
+        'key': 'id',
+        'columns': [
+            'id', 'content', 'content_encoding', 'content_length', 'embedding_model',
+            'file_id', 'file_name', 'file_url', 'chunk_id', 'mime_type', 'modified_time',
+            'folder_ids', 'namespace', 'duplicate_sources', 'created_at',
+        ],
+        'embedding': True,
+    },
+    'document_summaries': {
+        'key': 'file_id',
+        'columns': [
+            'file_id', 'file_name', 'mime_type', 'modified_time', 'folder_ids', 'namespace', 'revision',
+            'summary', 'embedding_model', 'created_at',
+        ],
+        'embedding': True,
+    },
+    # Lets the new environment continue with "Sync Changes" instead of a full index
+    'drive_sync_state': {
+        'key': 'folder_id',
+        'columns': ['folder_id', 'page_token', 'folders', 'namespace', 'updated_at'],
+        'embedding': False,
+    },
+}
+
+# Columns written by COPY as JSON rather than as text or Postgres arrays
+JSON_COLUMNS = {'duplicate_sources', 'folders'}
+ARRAY_COLUMNS = {'folder_ids'}
+
+PAGE_SIZE = 1000
+UPSERT_BATCH = 200
+
+
+def read_table(store: SupabaseVectorStore, table: str, spec: Dict) -> Iterator[List[Dict]]:
+    """Yield all rows of a table, one page at a time, in key order
+
+    Pages end only at an empty result: the API may return fewer rows than
+    asked for (its max-rows setting), which does not mean the table is done.
+    """
+    fields = ", ".join(spec['columns'] + (['embedding'] if spec['embedding'] else []))
+    start = 0
+    while True:
+        results = store.supabase.table(table).select(fields).order(spec['key']).range(
+            start, start + PAGE_SIZE - 1
+        ).execute()
+        rows = results.data or []
+        if not rows:
+            return
+        yield rows
+        start += len(rows)
+
+
+def export_table(store: SupabaseVectorStore, table: str, spec: Dict, out_dir: Path) -> int:
+    """Write one table to the snapshot directory. Returns the row count."""
+    columns = {name: [] for name in spec['columns']}
+    blocks = []
+    for rows in read_table(store, table, spec):
+        for name in spec['columns']:
+            columns[name].extend(row.get(name) for row in rows)
+        if spec['embedding']:
+            blocks.append(parse_embeddings([row['embedding'] for row in rows]).astype(np.float16))
+
+    count = len(columns[spec['key']])
+    with gzip.open(out_dir / f"{table}.columns.json.gz", 'wt', encoding='utf-8') as f:
+        json.dump(columns, f)
+    if spec['embedding']:
+        matrix = np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype=np.float16)
+        np.save(out_dir / f"{table}.embeddings.npy", matrix)
+    return count
+
+
+def export_snapshot(store: SupabaseVectorStore, out_dir: Path) -> Dict:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'created_at': datetime.utcnow().isoformat(),
+        'embedding_model': store.embedding_model,
+        'embedding_dimension': store.embedding_dimension,
+        'tables': {},
+    }
+    for table, spec in SNAPSHOT_TABLES.items():
+        started = time.perf_counter()
+        manifest['tables'][table] = export_table(store, table, spec, out_dir)
+        print(f"✅ {table}: {manifest['tables'][table]:,} rows "
+              f"({time.perf_counter() - started:.1f}s)")
+
+    (out_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def load_table(in_dir: Path, table: str, spec: Dict):
+    """Read a snapshot table: (columns dict, embedding matrix or None)"""
+    with gzip.open(in_dir / f"{table}.columns.json.gz", 'rt', encoding='utf-8') as f:
+        columns = json.load(f)
+    matrix = None
+    if spec['embedding']:
+        # Memory-mapped, so rows are paged in batch by batch
+        matrix = np.load(in_dir / f"{table}.embeddings.npy", mmap_mode='r')
+    return columns, matrix
+
+
+def vector_literals(block: np.ndarray) -> List[str]:
+    """pgvector text for each row of a float block"""
+    buffer = io.StringIO()
+    np.savetxt(buffer, block.astype(np.float32), fmt='%.6g', delimiter=',')
+    return [f"[{line}]" for line in buffer.getvalue().splitlines()]
+
+
+def copy_table(connection, table: str, spec: Dict, columns: Dict, matrix) -> None:
+    """Bulk load a table with COPY FROM STDIN, in the connection's open transaction"""
+    names = spec['columns'] + (['embedding'] if spec['embedding'] else [])
+    count = len(columns[spec['key']])
+    with connection.cursor() as cursor:
+        for start in range(0, count, PAGE_SIZE * 10):
+            end = min(start + PAGE_SIZE * 10, count)
+            vectors = vector_literals(matrix[start:end]) if spec['embedding'] else None
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for i in range(start, end):
+                row = []
+                for name in spec['columns']:
+                    value = columns[name][i]
+                    if value is None:
+                        row.append(None)
+                    elif name in JSON_COLUMNS:
+                        row.append(json.dumps(value))
+                    elif name in ARRAY_COLUMNS:
+                        row.append("{" + ",".join(json.dumps(item) for item in value) + "}")
+                    else:
+                        row.append(value)
+                if vectors is not None:
+                    row.append(vectors[i - start])
+                writer.writerow(["\\N" if value is None else value for value in row])
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"copy {table} ({', '.join(names)}) from stdin with (format csv, null '\\N')",
+                buffer
+            )
+
+
+def upsert_table(store: SupabaseVectorStore, table: str, spec: Dict, columns: Dict, matrix) -> None:
+    """Load a table through the Supabase API in batches"""
+    count = len(columns[spec['key']])
+    for start in range(0, count, UPSERT_BATCH):
+        end = min(start + UPSERT_BATCH, count)
+        rows = [{name: columns[name][i] for name in spec['columns']} for i in range(start, end)]
+        if spec['embedding']:
+            for row, vector in zip(rows, np.asarray(matrix[start:end], dtype=np.float32).tolist()):
+                row['embedding'] = vector
+        store.supabase.table(table).upsert(rows).execute()
+
+
+def clear_table(store: SupabaseVectorStore, table: str, spec: Dict) -> None:
+    store.supabase.table(table).delete().neq(spec['key'], '').execute()
+
+
+def table_is_empty(store: SupabaseVectorStore, table: str, spec: Dict) -> bool:
+    results = store.supabase.table(table).select(spec['key']).limit(1).execute()
+    return not results.data
+
+
+def import_snapshot(store: SupabaseVectorStore, in_dir: Path, replace: bool) -> int:
+    manifest = json.loads((in_dir / 'manifest.json').read_text())
+    if manifest['version'] != SNAPSHOT_VERSION:
+        print(f"❌ Unsupported snapshot version {manifest['version']}")
+        return 1
+    if manifest['embedding_model'] != store.embedding_model:
+        print(f"⚠️  Snapshot vectors are from {manifest['embedding_model']}, but this "
+              f"environment embeds with {store.embedding_model}; searches will not match "
+              f"them until EMBEDDING_BACKEND is changed to match.")
+
+    non_empty = [table for table, spec in SNAPSHOT_TABLES.items()
+                 if not table_is_empty(store, table, spec)]
+    if non_empty and not replace:
+        print(f"❌ {', '.join(non_empty)} not empty. Re-run with --replace to overwrite.")
+        return 1
+
+    # Everything that can fail is checked before any table is cleared
+    tables = {table: load_table(in_dir, table, spec) for table, spec in SNAPSHOT_TABLES.items()}
+    connection = None
+    database_url = os.getenv('DATABASE_URL')
+    if database_url:
+        try:
+            import psycopg2
+        except ImportError:
+            print("psycopg2 is not installed; loading through the Supabase API instead of COPY")
+        else:
+            try:
+                connection = psycopg2.connect(database_url)
+            except psycopg2.Error as e:
+                print(f"❌ Could not connect to DATABASE_URL, nothing was changed: {str(e)}")
+                return 1
+
+    if connection is not None:
+        # Replace and load in one transaction: on any error the old rows stay
+        try:
+            with connection.cursor() as cursor:
+                if non_empty:
+                    cursor.execute(f"truncate {', '.join(non_empty)}")
+            for table, spec in SNAPSHOT_TABLES.items():
+                started = time.perf_counter()
+                columns, matrix = tables[table]
+                copy_table(connection, table, spec, columns, matrix)
+                print(f"✅ {table}: {len(columns[spec['key']]):,} rows "
+                      f"({time.perf_counter() - started:.1f}s)")
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            print(f"❌ Import failed and was rolled back: {str(e)}")
+            return 1
+        finally:
+            connection.close()
+    else:
+        for table in non_empty:
+            clear_table(store, table, SNAPSHOT_TABLES[table])
+        for table, spec in SNAPSHOT_TABLES.items():
+            started = time.perf_counter()
+            columns, matrix = tables[table]
+            upsert_table(store, table, spec, columns, matrix)
+            print(f"✅ {table}: {len(columns[spec['key']]):,} rows "
+                  f"({time.perf_counter() - started:.1f}s)")
+
+    print("-" * 60)
+    print("Run 'python manage_index.py auto' to rebuild and tune the vector index "
+          "for the loaded rows.")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Export or import an index snapshot")
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('path', help="Snapshot directory")
+    parser.add_argument('--replace', action='store_true',
+                        help="Import: clear non-empty tables first")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    print("=" * 60)
+    print(f"Wake Forest RAG App - Index Snapshot {args.command.title()}")
+    print("=" * 60)
+
+    store = SupabaseVectorStore()
+    path = Path(args.path)
+    if args.command == 'export':
+        export_snapshot(store, path)
+        return 0
+    return import_snapshot(store, path, args.replace)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import os
+from typing import Dict
+
+import anthropic
+
+from chunking import SECTION_BREAK
+
+SUMMARY_PROMPT = """Summarize this document in 3-5 sentences for a search index. Name its
+subject, purpose, the kind of document it is, and the main topics, people,
+programs or figures it covers. Reply with the summary only.
+
+Document: {file_name}
+
+{text}"""
+
+
+def extractive_summary(text: str, file_name: str, max_chars: int = 1500) -> str:
+    """
+    Summarize a document without a model call
+
+    Uses the file name, the section headings (sheet tabs, slides) and the
+    opening text, which together usually say what a document is about.
+
+    Args:
+        text: Extracted text
+        file_name: Name of the file
+        max_chars: Approximate length limit of the summary
+
+    Returns:
+        Summary text
+    """
+    parts = [f"Document: {file_name}"]
+
+    sections = [section.strip() for section in text.split(SECTION_BREAK) if section.strip()]
+    if len(sections) > 1:
+        headings = "; ".join(section.partition("\n")[0] for section in sections)
+        parts.append(f"Sections: {headings[:max_chars // 3]}")
+
+    remaining = max(max_chars - sum(len(part) for part in parts), 0)
+    lead = " ".join(text.replace(SECTION_BREAK, "\n").split())
+    parts.append(lead[:remaining])
+    return "\n".join(parts)
+
+
+class DocumentSummarizer:
+    """
+    Produces the per-file summaries embedded in the file-level search index
+
+    SUMMARY_MODE=extractive (the default) builds summaries locally; 'llm'
+    asks a small Claude model once per file revision, falling back to the
+    extractive summary if the call fails.
+    """
+
+    def __init__(self):
+        self.mode = os.getenv('SUMMARY_MODE', 'extractive').lower()
+        if self.mode not in ('extractive', 'llm'):
+            raise ValueError(f"Unknown summary mode: {self.mode}")
+
+        self.model = "claude-3-5-haiku-20241022"
+        self.max_input_chars = 12000
+        self.client = None
+        if self.mode == 'llm':
+            api_key = os.getenv('ANTHROPIC_API_KEY')
+            if not api_key:
+                raise ValueError("Anthropic API key not found. Please set ANTHROPIC_API_KEY environment variable.")
+            self.client = anthropic.Anthropic(api_key=api_key)
+
+    def summarize(self, text: str, file_info: Dict) -> str:
+        """
+        Summarize a document
+
+        Args:
+            text: Extracted text
+            file_info: File metadata from Google Drive
+
+        Returns:
+            Summary text, starting with the file name
+        """
+        if self.client is not None:
+            try:
+                message = self.client.messages.create(
+                    model=self.model,
+                    max_tokens=300,
+                    messages=[{
+                        "role": "user",
+                        "content": SUMMARY_PROMPT.format(
+                            file_name=file_info['name'],
+                            text=text[:self.max_input_chars].replace(SECTION_BREAK, "\n\n"),
+                        ),
+                    }],
+                )
+                return f"Document: {file_info['name']}\n{message.content[0].text.strip()}"
+            except Exception as e:
+                print(f"Error summarizing {file_info['name']}: {str(e)}")
+
+        return extractive_summary(text, file_info['name'])
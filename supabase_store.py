@@ -1,11 +1,138 @@
+import base64
+import json
 import os
-from typing import List, Dict, Tuple
-import openai
+import time
+import zlib
+from typing import Callable, List, Dict, Tuple, Optional
 from supabase import create_client, Client
 import numpy as np
 from datetime import datetime
 import hashlib
 
+from chunking import SECTION_BREAK, split_sections, split_text
+from dedup import Deduplicator
+from drive_sync import belongs_to_tree
+from embeddings import create_embedder
+from rescoring import DEFAULT_CUTOFF, cosine_scores, mmr_select, parse_embeddings
+from summaries import DocumentSummarizer
+from text_cache import revision_key
+
+# Search filters accepted by SupabaseVectorStore.search, mapped to the
+# corresponding match_documents parameters
+FILTER_PARAMS = {
+    'file_ids': 'filter_file_ids',
+    'mime_types': 'filter_mime_types',
+    'folder_id': 'filter_folder_id',
+    'modified_after': 'filter_modified_after',
+    'modified_before': 'filter_modified_before',
+    'namespaces': 'filter_namespaces',
+}
+
+# Namespace of rows indexed without one (single-folder setups)
+DEFAULT_NAMESPACE = 'default'
+
+
+def build_filter_params(filters: Optional[Dict]) -> Dict:
+    """
+    Translate search filters into match_documents RPC parameters
+    
+    Args:
+        filters: Dictionary with any of the keys in FILTER_PARAMS. Dates are
+            ISO 8601 strings compared against the Drive modifiedTime.
+            
+    Returns:
+        Dictionary of RPC parameters, omitting filters that are not set
+    """
+    if not filters:
+        return {}
+    
+    unknown = set(filters) - set(FILTER_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown search filters: {', '.join(sorted(unknown))}")
+    
+    params = {}
+    for key, value in filters.items():
+        if value in (None, '', [], ()):
+            continue
+        if key in ('file_ids', 'mime_types', 'namespaces'):
+            value = list(value)
+        params[FILTER_PARAMS[key]] = value
+    return params
+
+
+# Columns loaded for the chunks that survive ranking (see fetch_chunks)
+CHUNK_FIELDS = (
+    'id, content, content_encoding, file_id, file_name, file_url, chunk_id, '
+    'mime_type, modified_time, duplicate_sources'
+)
+
+
+def encode_content(text: str, compression: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Prepare chunk text for storage
+    
+    Args:
+        text: Chunk text
+        compression: 'zlib' to store it compressed (base64 text), or None
+        
+    Returns:
+        Tuple of (stored content, content_encoding column value)
+    """
+    if compression == 'zlib':
+        return base64.b64encode(zlib.compress(text.encode('utf-8'), 9)).decode('ascii'), 'zlib'
+    return text, None
+
+
+def decode_content(row: Dict) -> Dict:
+    """Return a stored chunk row with its content decoded"""
+    if row.get('content_encoding') == 'zlib':
+        text = zlib.decompress(base64.b64decode(row['content'])).decode('utf-8')
+        return {**row, 'content': text, 'content_encoding': None}
+    return row
+
+
+# Search-time parameter controlling the recall/speed trade-off of each ANN
+# index type, mapped to the corresponding match_documents parameter
+ANN_SEARCH_PARAMS = {
+    'ivfflat': 'ann_probes',
+    'hnsw': 'ann_ef_search',
+}
+
+
+def select_ann_params(curve: List[Dict], recall_target: float,
+                      latency_budget_ms: Optional[float] = None) -> Dict:
+    """
+    Pick the ANN search parameter that meets a recall/latency target
+    
+    Args:
+        curve: Benchmark rows from the ann_tuning table, each with
+            index_method, search_param, recall and latency_ms
+        recall_target: Minimum acceptable recall against an exact scan
+        latency_budget_ms: Optional maximum median latency per query
+        
+    Returns:
+        match_documents parameters (ann_probes or ann_ef_search), or an empty
+        dictionary to use the database defaults
+    """
+    if not curve:
+        return {}
+    
+    rows = sorted(curve, key=lambda row: row['search_param'])
+    if latency_budget_ms is not None:
+        within_budget = [row for row in rows if row['latency_ms'] <= latency_budget_ms]
+        # If nothing fits the budget, fall back to the fastest setting
+        rows = within_budget or rows[:1]
+    
+    # Cheapest setting that reaches the target, otherwise the most accurate one
+    meeting_target = [row for row in rows if row['recall'] >= recall_target]
+    chosen = meeting_target[0] if meeting_target else max(rows, key=lambda row: row['recall'])
+    
+    param_name = ANN_SEARCH_PARAMS.get(chosen['index_method'])
+    if not param_name:
+        return {}
+    return {param_name: int(chosen['search_param'])}
+
+
 class SupabaseVectorStore:
     """Handles vector storage and retrieval using Supabase with pgvector"""
     
@@ -23,22 +150,94 @@ class SupabaseVectorStore:
         
         self.supabase: Client = create_client(supabase_url, supabase_key)
         
-        # Initialize OpenAI for embeddings
-        openai_key = os.getenv('OPENAI_API_KEY')
-        if not openai_key:
-            raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY environment variable.")
-        
-        openai.api_key = openai_key
-        
-        # Embedding model configuration
-        self.embedding_model = "text-embedding-3-small"
+        # Embedding backend (OpenAI or local CPU model), set by EMBEDDING_BACKEND
         self.embedding_dimension = 1536
+        self.embedder = create_embedder(self.embedding_dimension)
+        self.embedding_model = self.embedder.model_id
+        self.embedding_batch_size = 100
         self.chunk_size = 1000
         self.chunk_overlap = 200
+        
+        # ANN search tuning, measured by manage_index.py
+        self.recall_target = float(os.getenv('ANN_RECALL_TARGET', '0.95'))
+        latency_budget = os.getenv('ANN_LATENCY_BUDGET_MS')
+        self.latency_budget_ms = float(latency_budget) if latency_budget else None
+        self.ann_params = self.load_ann_params()
+        
+        # File and chunk deduplication for the current indexing run
+        self.deduplicator = Deduplicator()
+        
+        # Two-level retrieval: search per-file summaries first, then chunks of
+        # the best SUMMARY_TOP_FILES files only (0 searches all chunks)
+        self.summary_top_files = int(os.getenv('SUMMARY_TOP_FILES', '10'))
+        self.summarizer = DocumentSummarizer()
+        # The prefilter is used only while no indexed file lacks a summary
+        # (tracked in unsummarized_files, re-read every SUMMARY_COVERAGE_TTL seconds)
+        self.summary_coverage_ttl = float(os.getenv('SUMMARY_COVERAGE_TTL', '60'))
+        self._summaries_complete = False
+        self._coverage_checked_at = None
+        
+        # Client-side re-scoring: over-fetch candidates, re-score them exactly
+        # in float32 and diversify with MMR (RESCORE=true to enable). Unless
+        # MATCH_THRESHOLD is set, load_cutoff_params replaces the threshold
+        # with the calibrated one.
+        self.match_threshold = float(os.getenv('MATCH_THRESHOLD', '0.5'))
+        self.rescore = os.getenv('RESCORE', 'false').lower() == 'true'
+        
+        # Optional compression of stored chunk text (CONTENT_COMPRESSION=zlib)
+        self.content_compression = os.getenv('CONTENT_COMPRESSION') or None
+        if self.content_compression not in (None, 'zlib'):
+            raise ValueError(f"Unknown content compression: {self.content_compression}")
+        self.rescore_factor = int(os.getenv('RESCORE_CANDIDATES', '4'))
+        self.mmr_diversity = float(os.getenv('MMR_DIVERSITY', '0.3'))
+        self.min_similarity = float(os.getenv('RESCORE_MIN_SIMILARITY', '0'))
+    
+    def load_ann_params(self) -> Dict:
+        """
+        Load the tuned ANN search parameter for the configured recall target
+        
+        Returns:
+            match_documents parameters, or an empty dictionary if the index
+            has not been tuned yet
+        """
+        try:
+            results = self.supabase.table('ann_tuning').select('*').execute()
+            return select_ann_params(
+                results.data or [], self.recall_target, self.latency_budget_ms
+            )
+        except Exception as e:
+            print(f"Error loading ANN tuning, using database defaults: {str(e)}")
+            return {}
+    
+    def load_cutoff_params(self) -> Dict:
+        """
+        Load the result cutoff fitted by calibrate_retrieval.py for the
+        current embedding model
+        
+        The fitted match_threshold is applied to this store, unless
+        MATCH_THRESHOLD is set.
+        
+        Returns:
+            Dictionary with min_similarity, relative_drop and min_gap;
+            DEFAULT_CUTOFF if no calibration has been stored
+        """
+        try:
+            results = self.supabase.table('retrieval_calibration').select(
+                'min_similarity, relative_drop, min_gap, match_threshold'
+            ).eq('embedding_model', self.embedding_model).execute()
+            if results.data:
+                cutoff = dict(results.data[0])
+                match_threshold = cutoff.pop('match_threshold', None)
+                if match_threshold is not None and 'MATCH_THRESHOLD' not in os.environ:
+                    self.match_threshold = float(match_threshold)
+                return {**DEFAULT_CUTOFF, **cutoff}
+        except Exception as e:
+            print(f"Error loading retrieval calibration, using defaults: {str(e)}")
+        return dict(DEFAULT_CUTOFF)
     
     def create_embedding(self, text: str) -> List[float]:
         """
-        Create embedding for text using OpenAI
+        Create embedding for text with the configured backend
         
         Args:
             text: Text to embed
@@ -47,66 +246,102 @@ class SupabaseVectorStore:
             List of floats representing the embedding
         """
         try:
-            response = openai.embeddings.create(
-                model=self.embedding_model,
-                input=text
-            )
-            return response.data[0].embedding
+            return self.embedder.embed([text])[0]
         except Exception as e:
             print(f"Error creating embedding: {str(e)}")
             return [0.0] * self.embedding_dimension
     
-    def create_chunks(self, text: str, file_info: Dict) -> List[Dict]:
+    def create_embeddings(self, texts: List[str], raise_errors: bool = False) -> List[List[float]]:
+        """
+        Create embeddings for several texts in one batch
+        
+        Args:
+            texts: Texts to embed
+            raise_errors: Raise if the request fails, instead of returning
+                zero vectors. Use when the vectors are stored.
+            
+        Returns:
+            One embedding per text, in the same order
+        """
+        if not texts:
+            return []
+        try:
+            return self.embedder.embed(texts)
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"Error creating embeddings: {str(e)}")
+            return [[0.0] * self.embedding_dimension for _ in texts]
+    
+    @staticmethod
+    def chunk_row_id(file_id: str, chunk_id: int) -> str:
+        """Row ID a chunk is stored under in the documents table"""
+        return hashlib.md5(f"{file_id}_{chunk_id}".encode()).hexdigest()
+    
+    def duplicate_file(self, file_info: Dict, content: Optional[str] = None) -> Optional[Dict]:
+        """
+        Check whether a file is a copy of one already indexed in this run
+        
+        Call before downloading (matches on the Drive md5Checksum) and again
+        after extraction (matches on the text). Duplicates are recorded as
+        extra sources of the original's chunks instead of being embedded.
+        
+        Args:
+            file_info: File metadata from Google Drive
+            content: Extracted text, if available
+            
+        Returns:
+            File info of the original copy, or None if the file is new
+        """
+        return self.deduplicator.duplicate_file(file_info, content)
+    
+    def create_chunks(self, text: str, file_info: Dict, deduplicate: bool = True) -> List[Dict]:
         """
         Split text into chunks with metadata
         
         Args:
             text: Text to chunk
             file_info: File metadata from Google Drive
+            deduplicate: Drop chunks that are near-duplicates of chunks already
+                created in this indexing run
             
         Returns:
             List of chunk dictionaries with metadata
         """
-        # Simple chunking by characters with overlap
         chunks = []
         text = text.strip()
         
         if not text:
             return chunks
         
-        start = 0
-        chunk_id = 0
+        # Structured exports (sheet tabs, slides) are chunked along their
+        # sections; everything else by characters with overlap
+        if SECTION_BREAK in text:
+            pieces = split_sections(text, self.chunk_size)
+        else:
+            pieces = split_text(text, self.chunk_size, self.chunk_overlap)
         
-        while start < len(text):
-            end = start + self.chunk_size
-            chunk_text = text[start:end]
-            
-            # Try to break at sentence boundary
-            if end < len(text):
-                last_period = chunk_text.rfind('.')
-                last_newline = chunk_text.rfind('\n')
-                break_point = max(last_period, last_newline)
-                
-                if break_point > self.chunk_size * 0.5:  # Only break if we're past halfway
-                    chunk_text = chunk_text[:break_point + 1]
-                    end = start + break_point + 1
+        for chunk_id, chunk_text in enumerate(pieces):
+            # Skip near-duplicates, recording this file as another source
+            if deduplicate and self.deduplicator.duplicate_chunk(
+                self.chunk_row_id(file_info['id'], chunk_id), chunk_text, file_info
+            ):
+                continue
             
             # Create chunk metadata
             chunk = {
-                'content': chunk_text.strip(),
+                'content': chunk_text,
                 'file_id': file_info['id'],
                 'file_name': file_info['name'],
                 'file_url': file_info.get('webViewLink', ''),
                 'chunk_id': chunk_id,
                 'mime_type': file_info.get('mimeType', ''),
                 'modified_time': file_info.get('modifiedTime', ''),
+                'folder_ids': file_info.get('folderIds', []),
+                'namespace': file_info.get('namespace') or DEFAULT_NAMESPACE,
             }
             
             chunks.append(chunk)
-            chunk_id += 1
-            
-            # Move start position with overlap
-            start = end - self.chunk_overlap if end < len(text) else end
         
         return chunks
     
@@ -114,30 +349,61 @@ class SupabaseVectorStore:
         """
         Add document chunks to Supabase with embeddings
         
+        Embeddings are created in batches of embedding_batch_size chunks. A
+        failed batch is retried chunk by chunk, so one rejected chunk does not
+        cost the rest; chunks that still fail are not stored.
+        
         Args:
             chunks: List of chunk dictionaries
+            
+        Raises:
+            RuntimeError: If some chunks could not be embedded or stored,
+                after the others have been stored
         """
-        for chunk in chunks:
+        embedded = []
+        failed = 0
+        for start in range(0, len(chunks), self.embedding_batch_size):
+            batch = chunks[start:start + self.embedding_batch_size]
+            try:
+                vectors = self.create_embeddings([chunk['content'] for chunk in batch],
+                                                 raise_errors=True)
+                embedded.extend(zip(batch, vectors))
+                continue
+            except Exception as e:
+                print(f"Error creating embeddings, retrying chunk by chunk: {str(e)}")
+            for chunk in batch:
+                try:
+                    embedded.append((chunk, self.create_embeddings([chunk['content']],
+                                                                   raise_errors=True)[0]))
+                except Exception as e:
+                    print(f"Error embedding chunk {chunk['chunk_id']} of "
+                          f"{chunk['file_name']}: {str(e)}")
+                    failed += 1
+        
+        for chunk, embedding in embedded:
             try:
-                # Create embedding
-                embedding = self.create_embedding(chunk['content'])
-                
                 # Create unique ID for chunk
-                chunk_hash = hashlib.md5(
-                    f"{chunk['file_id']}_{chunk['chunk_id']}".encode()
-                ).hexdigest()
+                chunk_hash = self.chunk_row_id(chunk['file_id'], chunk['chunk_id'])
                 
                 # Prepare data for insertion
+                content, encoding = encode_content(chunk['content'], self.content_compression)
                 data = {
                     'id': chunk_hash,
-                    'content': chunk['content'],
+                    'content': content,
+                    'content_encoding': encoding,
+                    'content_length': len(chunk['content']),
                     'embedding': embedding,
+                    'embedding_model': self.embedding_model,
                     'file_id': chunk['file_id'],
                     'file_name': chunk['file_name'],
                     'file_url': chunk['file_url'],
                     'chunk_id': chunk['chunk_id'],
                     'mime_type': chunk['mime_type'],
                     'modified_time': chunk['modified_time'],
+                    'folder_ids': chunk.get('folder_ids', []),
+                    'namespace': chunk.get('namespace') or DEFAULT_NAMESPACE,
+                    # Filled in by save_shared_sources at the end of the run
+                    'duplicate_sources': [],
                     'created_at': datetime.utcnow().isoformat(),
                 }
                 
@@ -146,43 +412,464 @@ class SupabaseVectorStore:
                 
             except Exception as e:
                 print(f"Error adding chunk to Supabase: {str(e)}")
+                failed += 1
+        
+        if failed:
+            raise RuntimeError(f"{failed} of {len(chunks)} chunks could not be embedded or stored")
     
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+    def save_shared_sources(self) -> None:
+        """
+        Store the other locations of deduplicated chunks
+        
+        Each source records the copy's folder_ids, so searches filtered to
+        the copy's folder also match the shared row. Call once at the end of
+        an indexing run, after all chunks are added.
+        """
+        for row_id, sources in self.deduplicator.shared_sources.items():
+            try:
+                self.supabase.table('documents').update(
+                    {'duplicate_sources': sources}
+                ).eq('id', row_id).execute()
+            except Exception as e:
+                print(f"Error saving duplicate sources for chunk {row_id}: {str(e)}")
+    
+    def add_summary(self, text: str, file_info: Dict) -> bool:
+        """
+        Summarize a file and store the summary embedding in the file-level index
+        
+        Summaries are generated once per file revision; a file whose stored
+        summary matches its current revision is left alone.
+        
+        Args:
+            text: Extracted text of the file
+            file_info: File metadata from Google Drive
+            
+        Returns:
+            True if the file has an up-to-date summary, False if it failed.
+            Failed files are recorded in unsummarized_files until a later
+            summary succeeds.
+        """
+        revision = revision_key(file_info)
+        try:
+            existing = self.supabase.table('document_summaries').select(
+                'revision, embedding_model'
+            ).eq('file_id', file_info['id']).execute()
+            if existing.data and existing.data[0]['revision'] == revision \
+                    and existing.data[0]['embedding_model'] == self.embedding_model:
+                return True
+            
+            summary = self.summarizer.summarize(text, file_info)
+            self.supabase.table('document_summaries').upsert({
+                'file_id': file_info['id'],
+                'file_name': file_info['name'],
+                'mime_type': file_info.get('mimeType', ''),
+                'modified_time': file_info.get('modifiedTime', ''),
+                'folder_ids': file_info.get('folderIds', []),
+                'namespace': file_info.get('namespace') or DEFAULT_NAMESPACE,
+                'revision': revision,
+                'summary': summary,
+                'embedding': self.create_embeddings([summary], raise_errors=True)[0],
+                'embedding_model': self.embedding_model,
+                'created_at': datetime.utcnow().isoformat(),
+            }).execute()
+            self.supabase.table('unsummarized_files').delete().eq(
+                'file_id', file_info['id']
+            ).execute()
+            return True
+        except Exception as e:
+            print(f"Error adding summary for {file_info['name']}: {str(e)}")
+            try:
+                self.supabase.table('unsummarized_files').upsert({
+                    'file_id': file_info['id'],
+                    'folder_ids': file_info.get('folderIds', []),
+                }).execute()
+            except Exception as e:
+                print(f"Error recording missing summary for {file_info['name']}: {str(e)}")
+            return False
+    
+    def summaries_complete(self) -> bool:
+        """
+        Check whether every indexed file has a summary
+        
+        Restricting chunks to the best matching summaries would hide files
+        without one, so search uses the summary index only when this holds.
+        Files are tracked at index time (see add_summary), so this is a
+        one-row lookup; the answer is cached for summary_coverage_ttl seconds.
+        
+        Returns:
+            True if no indexed file lacks a summary; False if some do or the
+            check failed
+        """
+        now = time.monotonic()
+        if self._coverage_checked_at is not None \
+                and now - self._coverage_checked_at < self.summary_coverage_ttl:
+            return self._summaries_complete
+        
+        try:
+            results = self.supabase.table('unsummarized_files').select(
+                'file_id'
+            ).limit(1).execute()
+            self._summaries_complete = not results.data
+        except Exception as e:
+            print(f"Error checking summary coverage, searching all chunks: {str(e)}")
+            self._summaries_complete = False
+        self._coverage_checked_at = now
+        return self._summaries_complete
+    
+    def search_files(self, query_embedding: List[float], filter_params: Dict) -> List[str]:
+        """
+        Find the files whose summaries best match a query
+        
+        Args:
+            query_embedding: Embedding of the query
+            filter_params: match_documents filter parameters, applied to the
+                file metadata
+            
+        Returns:
+            Up to summary_top_files file IDs, best first; empty if there are
+            no summaries or the search failed
+        """
+        try:
+            results = self.supabase.rpc(
+                'match_summaries',
+                {
+                    'query_embedding': query_embedding,
+                    'match_count': self.summary_top_files,
+                    'filter_embedding_model': self.embedding_model,
+                    **filter_params
+                }
+            ).execute()
+            return [row['file_id'] for row in results.data or []]
+        except Exception as e:
+            print(f"Error searching document summaries: {str(e)}")
+            return []
+    
+    def search(self, query: str, top_k: int = 5, filters: Optional[Dict] = None,
+               query_embedding: Optional[List[float]] = None, hydrate: bool = True) -> List[Dict]:
         """
         Search for similar documents using vector similarity
         
+        With summary_top_files set and every indexed file summarized (see
+        summaries_complete), the file-level summary index is searched first
+        and the chunks of the best matching files are ranked exactly (not
+        through the ANN index, which would see only a few of them). Otherwise,
+        or if no summaries match, all chunks are searched. With rescore set,
+        rescore_factor * top_k candidates are fetched and narrowed down by
+        rescore_results.
+        
         Args:
             query: Search query
             top_k: Number of results to return
+            filters: Optional metadata filters (file_ids, mime_types, folder_id,
+                modified_after, modified_before, namespaces), applied in the
+                database before ranking. With namespaces set, each namespace is
+                searched through its own partial ANN index.
+            query_embedding: Precomputed embedding of the query, e.g. from a
+                cache, to skip the embedding call
+            hydrate: Load content and metadata of the results. If False, rows
+                carry only id, file_id, chunk_id, content_length and
+                similarity; call fetch_chunks for the ones that are kept.
             
         Returns:
             List of matching documents with metadata
         """
+        filter_params = build_filter_params(filters)
+        
         try:
             # Create query embedding
-            query_embedding = self.create_embedding(query)
+            if query_embedding is None:
+                query_embedding = self.create_embedding(query)
+            
+            if self.summary_top_files and self.summaries_complete():
+                file_ids = self.search_files(query_embedding, filter_params)
+                if file_ids:
+                    filter_params = {**filter_params, 'filter_file_ids': file_ids}
             
             # Call Supabase RPC function for vector similarity search
             # This requires setting up a custom function in Supabase
+            # Only IDs and scores come back; content is fetched for the
+            # chunks that survive ranking
             results = self.supabase.rpc(
-                'match_documents',
+                'match_document_ids',
                 {
                     'query_embedding': query_embedding,
-                    'match_threshold': 0.5,
-                    'match_count': top_k
+                    'match_threshold': self.match_threshold,
+                    'match_count': top_k * self.rescore_factor if self.rescore else top_k,
+                    # Only vectors from the same embedding model are comparable
+                    'filter_embedding_model': self.embedding_model,
+                    **filter_params,
+                    **self.ann_params
                 }
             ).execute()
             
-            return results.data if results.data else []
+            rows = results.data if results.data else []
+            if self.rescore and rows:
+                rows = self.rescore_results(query_embedding, rows, top_k)
+            return self.fetch_chunks(rows) if hydrate else rows
             
         except Exception as e:
             print(f"Error searching documents: {str(e)}")
             return []
     
+    def fetch_chunks(self, rows: List[Dict]) -> List[Dict]:
+        """
+        Load content and metadata for search results in one batched request
+        
+        Args:
+            rows: Results from search(hydrate=False); rows that already have
+                content are kept as they are
+            
+        Returns:
+            The rows in the same order with content and metadata added, and
+            their scores preserved; rows whose chunk no longer exists are dropped
+        """
+        missing = [row['id'] for row in rows if 'content' not in row]
+        if not missing:
+            return rows
+        
+        try:
+            results = self.supabase.table('documents').select(CHUNK_FIELDS).in_(
+                'id', missing
+            ).execute()
+        except Exception as e:
+            print(f"Error fetching chunk content: {str(e)}")
+            return [row for row in rows if 'content' in row]
+        
+        by_id = {item['id']: decode_content(item) for item in results.data or []}
+        return [
+            row if 'content' in row else {**by_id[row['id']], **row}
+            for row in rows
+            if 'content' in row or row['id'] in by_id
+        ]
+    
+    def rescore_results(self, query_embedding: List[float], rows: List[Dict],
+                        top_k: int) -> List[Dict]:
+        """
+        Re-rank search candidates client-side from their stored embeddings
+        
+        Scores are recomputed in float32 as one matrix-vector product (exact,
+        unlike the ANN ranking), candidates below min_similarity are dropped,
+        and the rest are picked by MMR so near-duplicate chunks do not crowd
+        out other content.
+        
+        Args:
+            query_embedding: Embedding of the query
+            rows: Candidates from match_documents
+            top_k: Number of results to return
+            
+        Returns:
+            Up to top_k rows with updated similarity, in pick order
+        """
+        try:
+            results = self.supabase.table('documents').select('id, embedding').in_(
+                'id', [row['id'] for row in rows]
+            ).execute()
+            by_id = {item['id']: item['embedding'] for item in results.data or []}
+            rows = [row for row in rows if row['id'] in by_id]
+            if not rows:
+                return []
+            
+            matrix = parse_embeddings([by_id[row['id']] for row in rows])
+            scores = cosine_scores(query_embedding, matrix)
+            
+            keep = np.flatnonzero(scores >= self.min_similarity)
+            picks = keep[mmr_select(scores[keep], matrix[keep], top_k, self.mmr_diversity)]
+        except Exception as e:
+            print(f"Error re-scoring search results: {str(e)}")
+            return rows[:top_k]
+        
+        return [{**rows[i], 'similarity': float(scores[i])} for i in picks]
+    
     def clear_all_documents(self) -> None:
         """Clear all documents from the vector store"""
         try:
             self.supabase.table('documents').delete().neq('id', '').execute()
+            self.supabase.table('document_summaries').delete().neq('file_id', '').execute()
             print("All documents cleared from vector store")
         except Exception as e:
             print(f"Error clearing documents: {str(e)}")
+    
+    def get_indexed_files(self, file_ids: List[str], root_id: Optional[str] = None,
+                          namespace: Optional[str] = None) -> Dict[str, Dict]:
+        """
+        Look up the indexed state of files
+        
+        Args:
+            file_ids: Google Drive file IDs
+            root_id: Only return files indexed from this root folder (see
+                drive_sync.belongs_to_tree); all files if not given
+            namespace: Namespace of root_id, for rows stored without folders
+            
+        Returns:
+            Dictionary keyed by file ID with file_name, modified_time,
+            folder_ids and namespace, for the files that have stored chunks
+        """
+        indexed = {}
+        # Keep each request URL short
+        for start in range(0, len(file_ids), 100):
+            batch = file_ids[start:start + 100]
+            results = self.supabase.table('documents').select(
+                'file_id, file_name, modified_time, folder_ids, namespace'
+            ).in_('file_id', batch).execute()
+            for row in results.data or []:
+                if root_id is None or belongs_to_tree(row, root_id, namespace):
+                    indexed.setdefault(row['file_id'], row)
+        return indexed
+    
+    def get_duplicate_copies(self, file_ids: List[str] = (),
+                             folder_ids: List[str] = ()) -> Dict[str, Dict]:
+        """
+        Find the other files recorded as sources of some files' chunks
+        
+        Copies that were deduplicated against a file have no rows of their
+        own, so they must be re-indexed when that file goes away.
+        
+        Args:
+            file_ids: Files about to be deleted
+            folder_ids: Folders whose files are about to be deleted
+            
+        Returns:
+            Source dictionaries (file_id, file_name, file_url) keyed by file ID
+        """
+        rows = []
+        for start in range(0, len(file_ids), 100):
+            rows += self.supabase.table('documents').select('duplicate_sources').in_(
+                'file_id', list(file_ids[start:start + 100])
+            ).execute().data or []
+        for folder_id in folder_ids:
+            rows += self.supabase.table('documents').select('duplicate_sources').contains(
+                'folder_ids', [folder_id]
+            ).execute().data or []
+        
+        copies = {}
+        for row in rows:
+            for source in row.get('duplicate_sources') or []:
+                copies.setdefault(source['file_id'], source)
+        return copies
+    
+    def _edit_shared_sources(self, match: Dict, edit: Callable[[Dict], Optional[Dict]]) -> None:
+        """
+        Rewrite the duplicate_sources entries of other files' chunks
+        
+        Args:
+            match: Partial source; rows with a matching entry are updated
+            edit: Called with each matching entry, returns the new entry or
+                None to drop it
+        """
+        results = self.supabase.table('documents').select('id, duplicate_sources').contains(
+            'duplicate_sources', json.dumps([match])
+        ).execute()
+        for row in results.data or []:
+            sources = []
+            for source in row['duplicate_sources']:
+                matches = all(
+                    set(value) <= set(source.get(key) or []) if isinstance(value, list)
+                    else source.get(key) == value
+                    for key, value in match.items()
+                )
+                source = edit(source) if matches else source
+                if source is not None:
+                    sources.append(source)
+            self.supabase.table('documents').update(
+                {'duplicate_sources': sources}
+            ).eq('id', row['id']).execute()
+    
+    def delete_file(self, file_id: str) -> None:
+        """Remove all chunks and the summary of a file, and the file as a source of other chunks"""
+        for table in ('documents', 'document_summaries', 'unsummarized_files'):
+            self.supabase.table(table).delete().eq('file_id', file_id).execute()
+        self._edit_shared_sources({'file_id': file_id}, lambda source: None)
+    
+    def delete_folder(self, folder_id: str) -> None:
+        """Remove all chunks, summaries and shared sources of files anywhere below a folder"""
+        for table in ('documents', 'document_summaries', 'unsummarized_files'):
+            self.supabase.table(table).delete().contains('folder_ids', [folder_id]).execute()
+        self._edit_shared_sources({'folder_ids': [folder_id]}, lambda source: None)
+    
+    def update_file_metadata(self, file_info: Dict) -> None:
+        """
+        Update name, link and folder of a file's chunks after a rename or move,
+        and of its entries as a source of other files' chunks
+        """
+        self.supabase.table('documents').update({
+            'file_name': file_info['name'],
+            'file_url': file_info.get('webViewLink', ''),
+            'folder_ids': file_info.get('folderIds', []),
+        }).eq('file_id', file_info['id']).execute()
+        self.supabase.table('document_summaries').update({
+            'file_name': file_info['name'],
+            'folder_ids': file_info.get('folderIds', []),
+        }).eq('file_id', file_info['id']).execute()
+        self.supabase.table('unsummarized_files').update({
+            'folder_ids': file_info.get('folderIds', []),
+        }).eq('file_id', file_info['id']).execute()
+        self._edit_shared_sources({'file_id': file_info['id']}, lambda source: {
+            **source,
+            'file_name': file_info['name'],
+            'file_url': file_info.get('webViewLink', ''),
+            'folder_ids': file_info.get('folderIds', []),
+        })
+    
+    def move_folder(self, old_path: List[str], new_path: List[str]) -> None:
+        """
+        Rewrite folder_ids of every chunk and shared source below a folder
+        that was moved
+        
+        Args:
+            old_path: Previous folder IDs from the root down to the moved folder
+            new_path: New folder IDs from the root down to the moved folder
+        """
+        results = self.supabase.table('documents').select(
+            'file_id, folder_ids'
+        ).contains('folder_ids', [old_path[-1]]).execute()
+        
+        # All chunks of a file share folder_ids, so update once per file
+        files = {row['file_id']: row['folder_ids'] for row in results.data or []}
+        for file_id, folder_ids in files.items():
+            for table in ('documents', 'document_summaries', 'unsummarized_files'):
+                self.supabase.table(table).update({
+                    'folder_ids': new_path + folder_ids[len(old_path):]
+                }).eq('file_id', file_id).execute()
+        self._edit_shared_sources({'folder_ids': [old_path[-1]]}, lambda source: {
+            **source,
+            'folder_ids': new_path + source['folder_ids'][len(old_path):],
+        })
+    
+    def load_sync_state(self, folder_id: str) -> Optional[Dict]:
+        """
+        Load the Drive changes position saved for an indexed folder
+        
+        Args:
+            folder_id: Root folder ID that was indexed
+            
+        Returns:
+            Dictionary with page_token, folders and namespace, or None if the
+            folder has not been fully indexed yet
+        """
+        try:
+            results = self.supabase.table('drive_sync_state').select('*').eq(
+                'folder_id', folder_id
+            ).execute()
+            return results.data[0] if results.data else None
+        except Exception as e:
+            print(f"Error loading sync state: {str(e)}")
+            return None
+    
+    def save_sync_state(self, folder_id: str, page_token: str, folders: Dict[str, List[str]],
+                        namespace: str = DEFAULT_NAMESPACE) -> None:
+        """
+        Save the Drive changes position and folder tree for an indexed folder
+        
+        Args:
+            folder_id: Root folder ID that was indexed
+            page_token: Changes page token to resume from next time
+            folders: Path of every folder in the tree, keyed by folder ID
+            namespace: Namespace the folder's files are indexed into
+        """
+        self.supabase.table('drive_sync_state').upsert({
+            'folder_id': folder_id,
+            'page_token': page_token,
+            'folders': folders,
+            'namespace': namespace,
+            'updated_at': datetime.utcnow().isoformat(),
+        }).execute()
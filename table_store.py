@@ -0,0 +1,286 @@
+import hashlib
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from chunking import join_sections
+from parsers import Table, table_section
+from text_cache import revision_key
+
+# Appears in the summary of every table whose rows are kept in the store
+# instead of being embedded
+ROWS_STORED_NOTE = "rows stored for exact lookup"
+
+# Part of every table file name; files in older layouts are not loaded, so
+# their tables are extracted and stored again on the next index run
+FORMAT_SUFFIX = ".v2.npz"
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
+def _number(value: str) -> Optional[float]:
+    try:
+        return float(value.replace(',', ''))
+    except ValueError:
+        return None
+
+
+def column_profile(name: str, values: List[str]) -> str:
+    """One-line description of a column: numeric range or most common values"""
+    values = [value.strip() for value in values if value.strip()]
+    if not values:
+        return f"{name}: empty"
+
+    numbers = [_number(value) for value in values]
+    if all(number is not None for number in numbers):
+        return f"{name}: {min(numbers):g} to {max(numbers):g}"
+
+    counts = Counter(values)
+    examples = ", ".join(value[:40] for value, _ in counts.most_common(5))
+    return f"{name}: {len(counts)} distinct, e.g. {examples}"
+
+
+def summarize_table(title: str, header: List[str], rows: List[List[str]], sample_rows: int) -> str:
+    """
+    Describe a large table in a section small enough to embed
+
+    The section keeps the table heading, so it is chunked like the full
+    table would be, followed by the row count, a profile of each column
+    and evenly spaced sample rows.
+    """
+    lines = [f"{len(rows)} rows, {ROWS_STORED_NOTE}.", "Column values:"]
+    for i, name in enumerate(header):
+        lines.append(column_profile(name or f"Column {i + 1}",
+                                    [row[i] for row in rows if i < len(row)]))
+
+    picks = np.unique(np.linspace(0, len(rows) - 1, min(sample_rows, len(rows))).astype(int))
+    lines.append("Sample rows:")
+    lines.extend(" | ".join(rows[i]) for i in picks)
+
+    section = table_section(title, header, [])
+    return section.rstrip("\n") + "\n" + "\n".join(lines)
+
+
+class TableStore:
+    """
+    Local columnar store for the rows of large spreadsheet tables
+
+    Tables with more than max_rows rows are kept on disk as compressed NumPy
+    arrays, one file per Drive file revision, and only a summary with sampled
+    rows is embedded. Cells are stored as one UTF-8 buffer with offsets, so
+    memory follows the amount of text rather than the longest cell. Rows
+    matching a question are then found by substring search over the row text
+    instead of vector search.
+    """
+
+    def __init__(self, store_dir: str, max_rows: int = 200, sample_rows: int = 20,
+                 cache_size: int = 8, missing_cache_size: int = 4096):
+        """
+        Initialize store
+
+        Args:
+            store_dir: Directory for table files (created if missing)
+            max_rows: Tables with up to this many rows are embedded in full
+            sample_rows: Rows included in the summary of a stored table
+            cache_size: Number of files' tables kept loaded in memory
+            missing_cache_size: Number of files remembered as having no
+                stored tables
+        """
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.max_rows = max_rows
+        self.sample_rows = sample_rows
+        self.cache_size = cache_size
+        self._loaded: OrderedDict = OrderedDict()
+        # Files without stored tables, valid while the directory is unchanged
+        self.missing_cache_size = missing_cache_size
+        self._missing: OrderedDict = OrderedDict()
+        self._missing_mtime = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['TableStore']:
+        """Create the store configured by TABLE_STORE_DIR / TABLE_MAX_EMBEDDED_ROWS /
+        TABLE_SAMPLE_ROWS, or None if disabled"""
+        store_dir = os.getenv('TABLE_STORE_DIR', '.cache/tables')
+        if not store_dir:
+            return None
+        return cls(
+            store_dir,
+            max_rows=int(os.getenv('TABLE_MAX_EMBEDDED_ROWS', '200')),
+            sample_rows=int(os.getenv('TABLE_SAMPLE_ROWS', '20')),
+        )
+
+    def _path(self, file_id: str, revision: str) -> Path:
+        return self.store_dir / f"{_digest(file_id)}-{_digest(revision)[:16]}{FORMAT_SUFFIX}"
+
+    def _files(self, file_id: str, suffix: str = FORMAT_SUFFIX) -> List[Path]:
+        return sorted(self.store_dir.glob(f"{_digest(file_id)}-*{suffix}"))
+
+    def has(self, file_info: Dict) -> bool:
+        """Whether the tables of this file revision are stored"""
+        return self._path(file_info['id'], revision_key(file_info)).exists()
+
+    def ingest(self, file_info: Dict, tables: List[Table]) -> str:
+        """
+        Store the large tables of a file and build its text for embedding
+
+        Args:
+            file_info: File metadata from Google Drive
+            tables: Tables read from the file
+
+        Returns:
+            Extracted text: small tables in full, large ones summarized
+        """
+        sections = []
+        stored = []
+        for title, header, rows in tables:
+            if len(rows) <= self.max_rows:
+                sections.append(table_section(title, header, rows))
+            else:
+                sections.append(summarize_table(title, header, rows, self.sample_rows))
+                stored.append((title, header, rows))
+
+        self.delete(file_info['id'])
+        if stored:
+            self._save(file_info, stored)
+        return join_sections(sections)
+
+    def _save(self, file_info: Dict, tables: List[Table]) -> None:
+        arrays = {'titles': np.array([title for title, _, _ in tables])}
+        for i, (_, header, rows) in enumerate(tables):
+            width = max(len(header), max(len(row) for row in rows))
+            arrays[f'header_{i}'] = np.array(header + [""] * (width - len(header)))
+            arrays[f'width_{i}'] = np.array(width)
+            # Every cell, row by row, in one UTF-8 buffer with byte offsets
+            encoded = [cell.encode() for row in rows for cell in row + [""] * (width - len(row))]
+            arrays[f'cells_{i}'] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+            arrays[f'offsets_{i}'] = np.concatenate(
+                ([0], np.cumsum([len(cell) for cell in encoded], dtype=np.int64))
+            )
+            # Lowercased row text, one line per row, searched by lookup()
+            text = "\n".join(" | ".join(row).replace("\n", " ") for row in rows).lower()
+            arrays[f'text_{i}'] = np.frombuffer(text.encode(), dtype=np.uint8)
+
+        path = self._path(file_info['id'], revision_key(file_info))
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def _is_missing(self, file_id: str) -> bool:
+        """Whether file_id is known to have no stored tables (caller holds the lock)"""
+        mtime = self.store_dir.stat().st_mtime_ns
+        if mtime != self._missing_mtime:
+            # Tables were added or removed, possibly by another process
+            self._missing.clear()
+            self._missing_mtime = mtime
+        return file_id in self._missing
+
+    def _load(self, file_id: str) -> List[Dict]:
+        with self._lock:
+            if file_id in self._loaded:
+                self._loaded.move_to_end(file_id)
+                return self._loaded[file_id]
+            if self._is_missing(file_id):
+                return []
+            mtime = self._missing_mtime
+
+        tables = []
+        for path in self._files(file_id):
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    for i, title in enumerate(data['titles']):
+                        text = data[f'text_{i}'].tobytes().decode()
+                        line_ends = [match.start() for match in re.finditer("\n", text)]
+                        tables.append({
+                            'title': str(title),
+                            'header': [str(name) for name in data[f'header_{i}']],
+                            'width': int(data[f'width_{i}']),
+                            'cells': data[f'cells_{i}'].tobytes(),
+                            'offsets': data[f'offsets_{i}'],
+                            'text': text,
+                            # Character position where each row's line starts
+                            'row_starts': np.array([0] + [end + 1 for end in line_ends],
+                                                   dtype=np.int64),
+                        })
+            except Exception as e:
+                print(f"Error loading stored table {path.name}: {str(e)}")
+
+        with self._lock:
+            if tables:
+                self._loaded[file_id] = tables
+                if len(self._loaded) > self.cache_size:
+                    self._loaded.popitem(last=False)
+            elif mtime == self._missing_mtime:
+                self._missing[file_id] = True
+                if len(self._missing) > self.missing_cache_size:
+                    self._missing.popitem(last=False)
+        return tables
+
+    @staticmethod
+    def _row(table: Dict, row: int) -> List[str]:
+        """Cells of one stored row"""
+        width = table['width']
+        offsets = table['offsets'][row * width:(row + 1) * width + 1]
+        return [
+            table['cells'][start:end].decode()
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+
+    def lookup(self, file_id: str, terms: List[str], limit: int = 20) -> List[Table]:
+        """
+        Find the stored rows of a file that best match the given terms
+
+        Args:
+            file_id: Google Drive file ID
+            terms: Lowercase search terms, e.g. the keywords of a question
+            limit: Maximum number of rows returned across all tables
+
+        Returns:
+            Tables holding only the matching rows, best matches first. Rows
+            are scored by the terms they contain, rarer terms counting more.
+        """
+        terms = [term for term in terms if term]
+        if not terms:
+            return []
+
+        tables = self._load(file_id)
+        candidates = []
+        for index, table in enumerate(tables):
+            rows = len(table['row_starts'])
+            scores = np.zeros(rows)
+            for term in terms:
+                positions = [match.start() for match in re.finditer(re.escape(term), table['text'])]
+                hits = np.zeros(rows, dtype=bool)
+                hits[np.searchsorted(table['row_starts'], positions, side='right') - 1] = True
+                # Rare terms (a name, an ID) outweigh ones found in most rows
+                scores += hits * np.log((rows + 1) / (hits.sum() + 1))
+            best = np.argsort(-scores, kind='stable')[:limit]
+            candidates.extend((float(scores[row]), index, int(row)) for row in best if scores[row] > 0)
+
+        candidates.sort(key=lambda candidate: -candidate[0])
+        matches: Dict[int, List[List[str]]] = {}
+        for _, index, row in candidates[:limit]:
+            matches.setdefault(index, []).append(row)
+
+        return [
+            (tables[index]['title'], tables[index]['header'],
+             [self._row(tables[index], row) for row in rows])
+            for index, rows in matches.items()
+        ]
+
+    def delete(self, file_id: str) -> None:
+        """Remove the stored tables of a file, in any layout"""
+        for path in self._files(file_id, suffix=".npz"):
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._loaded.pop(file_id, None)
+            self._missing.pop(file_id, None)
@@ -0,0 +1,36 @@
+from chunking import SECTION_BREAK, cap_heading, join_sections, split_sections
+
+
+def sheet(columns, rows):
+    heading = f"=== Budget === Columns: {' | '.join(columns)}"
+    lines = [' | '.join(f"{column}={row}" for column in columns[:3]) for row in range(rows)]
+    return "\n".join([heading] + lines)
+
+
+def test_short_sections_are_packed():
+    text = join_sections(["Slide 1\nHello", "Slide 2\nWorld"])
+    assert split_sections(text, 100) == ["Slide 1\nHello\n\nSlide 2\nWorld"]
+
+
+def test_heading_is_repeated_on_every_piece():
+    pieces = split_sections(sheet(['a', 'b', 'c'], 50), 200)
+    assert len(pieces) > 1
+    assert all(piece.startswith("=== Budget === Columns: a | b | c\n") for piece in pieces)
+
+
+def test_wide_sheet_chunks_stay_within_chunk_size():
+    columns = [f"column_{i}" for i in range(300)]
+    text = sheet(columns, 100) + SECTION_BREAK + "Slide\n" + "x" * 5000
+    pieces = split_sections(text, 1000)
+
+    assert pieces
+    assert all(len(piece) <= 1000 for piece in pieces)
+    heading = pieces[0].split("\n", 1)[0]
+    assert heading.startswith("=== Budget === Columns: column_0 | column_1")
+    assert heading.endswith(" ...")
+
+
+def test_cap_heading():
+    assert cap_heading("Title", 10) == "Title"
+    assert cap_heading("=== T === Columns: aa | bb | cc", 25) == "=== T === Columns: aa ..."
+    assert len(cap_heading("x" * 50, 20)) == 20
@@ -0,0 +1,177 @@
+import copy
+
+import pytest
+
+from drive_sync import FOLDER_MIME_TYPE, belongs_to_tree, classify_changes
+
+DOC_MIME_TYPE = 'application/vnd.google-apps.document'
+
+# Indexed tree: root > reports > 2024. Files under 'other' belong to a second
+# indexed root.
+FOLDERS = {
+    'root': ['root'],
+    'reports': ['root', 'reports'],
+    '2024': ['root', 'reports', '2024'],
+}
+
+
+def drive_file(file_id, parent, name=None, modified='2024-01-01T00:00:00Z',
+               mime_type=DOC_MIME_TYPE, trashed=False):
+    """File resource as returned in a changes.list response"""
+    return {
+        'id': file_id,
+        'name': name or f"{file_id}.doc",
+        'mimeType': mime_type,
+        'modifiedTime': modified,
+        'webViewLink': f"https://drive.example/{file_id}",
+        'parents': [parent],
+        'trashed': trashed,
+    }
+
+
+def change(file_id, file=None, removed=False):
+    entry = {'fileId': file_id, 'removed': removed}
+    if file is not None:
+        entry['file'] = file
+    return entry
+
+
+def indexed(folder_ids, name=None, modified='2024-01-01T00:00:00Z', namespace='default'):
+    """Stored state of a file, as returned by get_indexed_files"""
+    return {
+        'file_name': name,
+        'modified_time': modified,
+        'folder_ids': folder_ids,
+        'namespace': namespace,
+    }
+
+
+@pytest.fixture
+def folders():
+    return copy.deepcopy(FOLDERS)
+
+
+@pytest.fixture
+def changes_list():
+    """A changes.list response covering every kind of change"""
+    return {
+        'newStartPageToken': '43',
+        'changes': [
+            change('new', drive_file('new', 'reports')),
+            change('edited', drive_file('edited', 'root', modified='2024-02-01T00:00:00Z')),
+            change('renamed', drive_file('renamed', 'root', name='new name.doc')),
+            change('relocated', drive_file('relocated', '2024')),
+            change('trashed', drive_file('trashed', 'root', trashed=True)),
+            change('deleted', removed=True),
+            change('moved-out', drive_file('moved-out', 'elsewhere')),
+            change('other-root', drive_file('other-root', 'elsewhere')),
+        ],
+    }
+
+
+@pytest.fixture
+def indexed_files():
+    return {
+        'edited': indexed(['root'], name='edited.doc'),
+        'renamed': indexed(['root'], name='old name.doc'),
+        'relocated': indexed(['root', 'reports'], name='relocated.doc'),
+        'trashed': indexed(['root'], name='trashed.doc'),
+        'deleted': indexed(['root', 'reports'], name='deleted.doc'),
+        'moved-out': indexed(['root'], name='moved-out.doc'),
+        'other-root': indexed(['other', 'sub'], name='other-root.doc'),
+    }
+
+
+def test_file_changes(changes_list, folders, indexed_files):
+    result = classify_changes(changes_list['changes'], folders, indexed_files)
+
+    assert [f['id'] for f in result['added']] == ['new']
+    assert result['added'][0]['folderIds'] == ['root', 'reports']
+    assert [f['id'] for f in result['modified']] == ['edited']
+    assert [f['id'] for f in result['moved']] == ['renamed', 'relocated']
+    assert result['moved'][1]['folderIds'] == ['root', 'reports', '2024']
+    assert result['removed'] == ['trashed', 'deleted', 'moved-out']
+
+
+def test_unchanged_file_is_ignored(folders):
+    changes = [change('same', drive_file('same', 'reports'))]
+    result = classify_changes(changes, folders, {'same': indexed(['root', 'reports'], 'same.doc')})
+
+    assert not any(result.values())
+
+
+def test_file_under_another_root_is_kept(folders):
+    changes = [
+        change('other-root', drive_file('other-root', 'elsewhere')),
+        change('other-trashed', drive_file('other-trashed', 'sub', trashed=True)),
+    ]
+    indexed_files = {
+        'other-root': indexed(['other'], name='other-root.doc'),
+        'other-trashed': indexed(['other', 'sub'], name='other-trashed.doc'),
+    }
+    result = classify_changes(changes, folders, indexed_files)
+
+    assert result['removed'] == []
+
+
+def test_file_moved_in_from_another_root_is_added(folders):
+    changes = [change('migrated', drive_file('migrated', 'reports'))]
+    result = classify_changes(changes, folders, {'migrated': indexed(['other'], 'migrated.doc')})
+
+    assert [f['id'] for f in result['added']] == ['migrated']
+    assert result['moved'] == []
+
+
+def test_rows_without_folders_are_matched_by_namespace(folders):
+    changes = [
+        change('legacy', drive_file('legacy', 'elsewhere')),
+        change('legacy-other', drive_file('legacy-other', 'elsewhere')),
+    ]
+    indexed_files = {
+        'legacy': indexed([], namespace='hr'),
+        'legacy-other': indexed([], namespace='finance'),
+    }
+    result = classify_changes(changes, folders, indexed_files, namespace='hr')
+
+    assert result['removed'] == ['legacy']
+
+
+def test_folder_moved_in(folders):
+    changes = [
+        # Nested folder listed before its parent in the same batch
+        change('old', drive_file('old', 'archive', mime_type=FOLDER_MIME_TYPE)),
+        change('archive', drive_file('archive', 'reports', mime_type=FOLDER_MIME_TYPE)),
+        # Files inside are picked up by scanning the added folder
+        change('inside', drive_file('inside', 'old')),
+    ]
+    result = classify_changes(changes, folders, {})
+
+    assert result['folders_added'] == [
+        ('archive', ['root', 'reports', 'archive']),
+        ('old', ['root', 'reports', 'archive', 'old']),
+    ]
+    assert folders['old'] == ['root', 'reports', 'archive', 'old']
+    assert result['added'] == []
+
+
+def test_folder_moved_out(folders):
+    changes = [change('reports', drive_file('reports', 'elsewhere', mime_type=FOLDER_MIME_TYPE))]
+    result = classify_changes(changes, folders, {})
+
+    assert result['folders_removed'] == ['reports']
+    assert folders == {'root': ['root']}
+
+
+def test_folder_moved_within_tree(folders):
+    changes = [change('2024', drive_file('2024', 'root', mime_type=FOLDER_MIME_TYPE))]
+    result = classify_changes(changes, folders, {})
+
+    assert result['folders_moved'] == [(['root', 'reports', '2024'], ['root', '2024'])]
+    assert folders['2024'] == ['root', '2024']
+
+
+def test_belongs_to_tree():
+    assert belongs_to_tree(indexed(['root', 'reports']), 'root')
+    assert not belongs_to_tree(indexed(['other']), 'root', namespace='default')
+    assert belongs_to_tree(indexed([], namespace='hr'), 'root', namespace='hr')
+    assert not belongs_to_tree(indexed([]), 'root')
@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+# Bump when extraction output changes (new parser, different section format)
+# so cached text from the old extractors is not reused
+TEXT_FORMAT_VERSION = 3
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
+def revision_key(file_info: Dict) -> str:
+    """Identify the file revision from its Drive metadata"""
+    return "|".join([
+        str(TEXT_FORMAT_VERSION),
+        file_info.get('modifiedTime', ''),
+        file_info.get('md5Checksum', ''),
+    ])
+
+
+class TextCache:
+    """
+    Local cache of extracted text, keyed by Drive file ID and revision
+
+    Entries are gzip-compressed JSON files holding the text and the file
+    metadata, so documents can be re-chunked and re-embedded later without
+    Drive or the parsers. The directory is kept under a size limit by
+    evicting the least recently used entries.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        Initialize cache
+
+        Args:
+            cache_dir: Directory for cache entries (created if missing)
+            max_bytes: Total size limit of the compressed entries
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = sum(path.stat().st_size for path in self.cache_dir.glob('*.json.gz'))
+
+    @classmethod
+    def from_env(cls) -> Optional['TextCache']:
+        """Create the cache configured by TEXT_CACHE_DIR / TEXT_CACHE_MB, or None if disabled"""
+        cache_dir = os.getenv('TEXT_CACHE_DIR', '.cache/text')
+        if not cache_dir:
+            return None
+        max_mb = int(os.getenv('TEXT_CACHE_MB', '500'))
+        return cls(cache_dir, max_mb * 1024 * 1024)
+
+    def _path(self, file_id: str, revision: str) -> Path:
+        return self.cache_dir / f"{_digest(file_id)}-{_digest(revision)[:16]}.json.gz"
+
+    def get(self, file_info: Dict) -> Optional[str]:
+        """
+        Look up the extracted text of a file revision
+
+        Args:
+            file_info: File metadata from Google Drive
+
+        Returns:
+            Cached text, or None on a miss
+        """
+        path = self._path(file_info['id'], revision_key(file_info))
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+            # Mark as recently used
+            os.utime(path)
+            return entry['text']
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading text cache for {file_info.get('name')}: {str(e)}")
+            return None
+
+    def put(self, file_info: Dict, text: str) -> None:
+        """
+        Store the extracted text of a file revision, replacing older revisions
+
+        Args:
+            file_info: File metadata from Google Drive
+            text: Extracted text
+        """
+        path = self._path(file_info['id'], revision_key(file_info))
+        entry = {'file_info': file_info, 'text': text}
+        data = gzip.compress(json.dumps(entry).encode('utf-8'))
+
+        with self._lock:
+            for old in self.cache_dir.glob(f"{_digest(file_info['id'])}-*.json.gz"):
+                self._remove(old)
+
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data)
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def entries(self) -> Iterator[Tuple[Dict, str]]:
+        """Yield (file_info, text) for every cached file"""
+        for path in sorted(self.cache_dir.glob('*.json.gz')):
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    entry = json.load(f)
+                yield entry['file_info'], entry['text']
+            except Exception as e:
+                print(f"Error reading text cache entry {path.name}: {str(e)}")
+
+    def _remove(self, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+            self._total_bytes -= size
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache is 90% of its limit"""
+        paths = sorted(self.cache_dir.glob('*.json.gz'), key=lambda p: p.stat().st_mtime)
+        target = self.max_bytes * 0.9
+        for path in paths:
+            if self._total_bytes <= target:
+                break
+            self._remove(path)
@@ -55,7 +55,9 @@ def main():
         load_dotenv()
     
     all_good &= check_env_var('ANTHROPIC_API_KEY')
-    all_good &= check_env_var('OPENAI_API_KEY')
+    # Only the OpenAI embedding backend needs a key
+    if os.getenv('EMBEDDING_BACKEND', 'openai').lower() == 'openai':
+        all_good &= check_env_var('OPENAI_API_KEY')
     all_good &= check_env_var('SUPABASE_URL')
     all_good &= check_env_var('SUPABASE_SERVICE_KEY')
     all_good &= check_env_var('GOOGLE_SERVICE_ACCOUNT_FILE')
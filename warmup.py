@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from rag_engine import RAGEngine, normalize_query
+from supabase_store import SupabaseVectorStore
+
+# One engine per process, shared by all sessions (clients, connection pools,
+# embedding model and caches are then set up once)
+_engine: Optional[RAGEngine] = None
+_engine_lock = threading.Lock()
+
+_warm_lock = threading.Lock()
+# Outcome of the warm-up, for status display
+status = {'ready': False, 'seconds': None, 'steps': {}}
+
+
+def shared_engine() -> RAGEngine:
+    """The process-wide RAGEngine, created on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = RAGEngine(SupabaseVectorStore())
+        return _engine
+
+
+def historical_queries(path: str, limit: int) -> List[str]:
+    """
+    The most frequent questions in a query file
+
+    Args:
+        path: Text file with one question per line, or JSONL with a
+            "question" per line (as used by calibrate_retrieval.py)
+        limit: Number of questions to return
+
+    Returns:
+        Up to limit questions, most frequent first
+    """
+    counts = Counter()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                line = json.loads(line).get('question', '')
+            if line:
+                counts[normalize_query(line)] += 1
+    return [query for query, _ in counts.most_common(limit)]
+
+
+def _step(name: str, action) -> None:
+    """Run one warm-up step, recording its duration or error"""
+    started = time.perf_counter()
+    try:
+        result = action()
+        status['steps'][name] = {'ms': round((time.perf_counter() - started) * 1000),
+                                 'result': result}
+    except Exception as e:
+        status['steps'][name] = {'ms': round((time.perf_counter() - started) * 1000),
+                                 'error': str(e)}
+        print(f"Warm-up step {name} failed: {str(e)}")
+
+
+def warm_up() -> Dict:
+    """
+    Prepare the process for its first query
+
+    Creates the shared engine (Supabase client, embedding backend, calibration
+    and ANN settings), opens the HTTPS connections to Supabase, the embedding
+    API and Claude so their TLS handshakes are done, and pre-embeds the
+    WARMUP_QUERIES (default 50) most frequent questions in WARMUP_QUERIES_FILE.
+    Runs once per process; later calls return the recorded status. A failing
+    step is recorded and does not stop the others.
+
+    Returns:
+        The status dictionary, with ready set and per-step timings
+    """
+    with _warm_lock:
+        if status['ready']:
+            return status
+
+        started = time.perf_counter()
+        _step('engine', lambda: type(shared_engine()).__name__)
+        # The other steps need the engine; they are skipped if it failed
+        engine = _engine
+
+        if engine is not None:
+            store = engine.vector_store
+            _step('supabase', lambda: len(
+                store.supabase.table('documents').select('id').limit(1).execute().data or []
+            ))
+            _step('claude', lambda: len(engine.client.models.list(limit=1).data))
+
+            queries_file = os.getenv('WARMUP_QUERIES_FILE')
+            queries = []
+            if queries_file and os.path.exists(queries_file):
+                queries = historical_queries(queries_file, int(os.getenv('WARMUP_QUERIES', '50')))
+            # Embedding at least one text also opens the embedding API connection,
+            # or loads the local model's ONNX session
+            _step('embeddings', lambda: engine.prefetch_embeddings(queries or ["warm-up"]))
+
+        status['seconds'] = round(time.perf_counter() - started, 2)
+        status['ready'] = True
+        return status
+